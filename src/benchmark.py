@@ -0,0 +1,247 @@
+"""
+Benchmarks the update throughput of the simulation.
+
+Runs fixed-seed scenarios over flock sizes, spawn patterns, rule combinations
+and engines, and reports ticks per second, per-tick latency percentiles and
+peak memory. Results are written as JSON and can be compared against a stored
+baseline to flag regressions, e.g.
+
+    python benchmark.py --sizes 75 1000 --output results.json
+    python benchmark.py --sizes 75 1000 --baseline results.json
+"""
+
+import argparse
+import gc
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import config
+
+from neighbor_index import NEIGHBOR_INDEXES
+from scenario import SPAWNS, spawn
+from simulation import (
+    Simulation, ARRAY_NEIGHBOR_INDEXES, ENGINES, HEADING_KERNELS, RULES, UPDATE_MODES)
+
+SIZES = (75, 1000, 10000, 100000)
+
+
+def rule_combinations(names=RULES):
+    '''Returns every subset of the given rules, from none to all'''
+    return [
+        combination
+        for size in range(len(names) + 1)
+        for combination in itertools.combinations(names, size)
+    ]
+
+
+def scenario_name(scenario):
+    '''Returns a unique, readable name for a scenario'''
+    rules = '+'.join(scenario['rules']) or 'none'
+    engine = scenario['engine']
+    if scenario['update_mode'] != UPDATE_MODES[0]:
+        engine += f":{scenario['update_mode']}"
+    if scenario['neighbor_index'] != 'grid':
+        engine += f":{scenario['neighbor_index']}"
+    if scenario.get('nearest') is not None:
+        engine += f":k{scenario['nearest']}"
+    if scenario.get('heading_kernel', 'angle') != 'angle':
+        engine += f":{scenario['heading_kernel']}"
+    name = f"{engine}/{scenario['boids']}/{scenario['spawn']}/{rules}"
+    world_size = tuple(scenario.get('world_size', config.WORLD_SIZE))
+    if world_size != tuple(config.WORLD_SIZE):
+        name += f'@{world_size[0]}x{world_size[1]}'
+    return name
+
+
+def percentile(sorted_values, fraction):
+    '''Returns the value at the given fraction of an already sorted list'''
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_scenario(scenario, ticks, warmup, seed, workers=None):
+    '''Runs a single scenario and returns its measurements'''
+    # peak memory is measured over construction and warmup only, since
+    # tracing allocations slows down the timed ticks
+    gc.collect()
+    tracemalloc.start()
+    world_size = tuple(scenario.get('world_size', config.WORLD_SIZE))
+    boids = spawn(scenario['boids'], seed, scenario['spawn'], world_size)
+    sim = Simulation(boids=boids, engine=scenario['engine'], world_size=world_size,
+                     update_mode=scenario['update_mode'], workers=workers,
+                     neighbor_index=scenario['neighbor_index'],
+                     nearest=scenario.get('nearest'),
+                     heading_kernel=scenario.get('heading_kernel', 'angle'))
+    sim.set_rules(*(rule in scenario['rules'] for rule in RULES))
+    sim.step(warmup)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(ticks):
+        tick_start = time.perf_counter()
+        sim.step()
+        latencies.append(time.perf_counter() - tick_start)
+    elapsed = time.perf_counter() - start
+    sim.close()
+
+    latencies.sort()
+    return {
+        'name': scenario_name(scenario),
+        **scenario,
+        'rules': list(scenario['rules']),
+        'ticks': ticks,
+        'ticks_per_second': ticks / elapsed,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.50) * 1000,
+            'p90': percentile(latencies, 0.90) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+            'max': latencies[-1] * 1000,
+        },
+        'peak_memory_bytes': peak_memory,
+    }
+
+
+def compare(results, baseline, threshold):
+    '''Returns a description of every scenario which regressed against the baseline'''
+    baseline_by_name = {result['name']: result for result in baseline['results']}
+
+    regressions = []
+    for result in results['results']:
+        previous = baseline_by_name.get(result['name'])
+        if previous is None:
+            continue
+
+        throughput = result['ticks_per_second'] / previous['ticks_per_second']
+        if throughput < 1 - threshold:
+            regressions.append(
+                f"{result['name']}: {result['ticks_per_second']:.1f} ticks/s, "
+                f"was {previous['ticks_per_second']:.1f} ({throughput - 1:+.0%})")
+
+        latency = result['latency_ms']['p99'] / previous['latency_ms']['p99']
+        if latency > 1 + threshold:
+            regressions.append(
+                f"{result['name']}: p99 {result['latency_ms']['p99']:.2f}ms, "
+                f"was {previous['latency_ms']['p99']:.2f}ms ({latency - 1:+.0%})")
+
+    return regressions
+
+
+def parse_args(args=None):
+    '''Parses the command line arguments of the benchmark'''
+    parser = argparse.ArgumentParser(description='Benchmark the boid update throughput.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES[:3],
+                        help='flock sizes to run')
+    parser.add_argument('--spawns', nargs='+', choices=SPAWNS, default=SPAWNS,
+                        help='spawn patterns to run')
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=ENGINES,
+                        help='engines to run')
+    parser.add_argument('--update-modes', nargs='+', choices=UPDATE_MODES,
+                        default=[config.UPDATE_MODE], help='update modes of the object engine to run')
+    parser.add_argument('--neighbor-indexes', nargs='+', choices=NEIGHBOR_INDEXES,
+                        default=[config.NEIGHBOR_INDEX],
+                        help='neighbor indexes to run, for the engines supporting them')
+    parser.add_argument('--nearest', type=int, nargs='+', default=[config.NEAREST_NEIGHBORS],
+                        help='how many of the nearest boids in view each boid reacts to, '
+                             "'0' for every boid in view")
+    parser.add_argument('--heading-kernels', nargs='+', choices=HEADING_KERNELS,
+                        default=[config.HEADING_KERNEL],
+                        help='heading kernels of the object engine to run')
+    parser.add_argument('--world-size', type=int, nargs=2, default=config.WORLD_SIZE,
+                        metavar=('WIDTH', 'HEIGHT'), help='size of the world the flocks spawn in')
+    parser.add_argument('--rules', nargs='+', default=None,
+                        help="rule combinations to run, e.g. 'none' 'separation+cohesion' "
+                             "(default: every combination)")
+    parser.add_argument('--workers', type=int, default=config.WORKER_COUNT,
+                        help='worker processes of the parallel engine (default: one per core)')
+    parser.add_argument('--ticks', type=int, default=50, help='timed ticks per scenario')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed ticks per scenario')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the spawned flocks')
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('-b', '--baseline', help='compare the results to this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative change against the baseline considered a regression')
+    return parser.parse_args(args)
+
+
+def main(args):
+    if args.rules is None:
+        combinations = rule_combinations()
+    else:
+        combinations = [
+            () if rules == 'none' else tuple(rules.split('+'))
+            for rules in args.rules
+        ]
+
+    scenarios = [
+        {'engine': engine, 'update_mode': mode, 'neighbor_index': index,
+         'nearest': nearest or None, 'heading_kernel': kernel, 'boids': size, 'spawn': spawn,
+         'rules': rules, 'world_size': list(args.world_size)}
+        for engine in args.engines
+        # the array engines are always synchronous, no need to run them once
+        # per mode, and only support some of the indexes
+        for mode in (args.update_modes if engine == 'object' else UPDATE_MODES[:1])
+        for index in args.neighbor_indexes
+        if engine == 'object' or index in ARRAY_NEIGHBOR_INDEXES[engine]
+        for nearest in args.nearest
+        # only the object engine has heading kernels
+        for kernel in (args.heading_kernels if engine == 'object' else ['angle'])
+        for size in args.sizes
+        for spawn in args.spawns
+        for rules in combinations
+    ]
+
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'ticks': args.ticks,
+            'warmup': args.warmup,
+            'seed': args.seed,
+            'workers': args.workers,
+        },
+        'results': [],
+    }
+
+    # import the array engine up front, so numpy's own import is not
+    # counted in the first scenario's peak memory
+    if set(args.engines) - {'object'}:
+        import flock
+
+    # nor the compiling of the kernel in the first jit scenario's
+    if 'jit' in args.engines:
+        import jit_flock
+        jit_flock.load_kernel()
+
+    for scenario in scenarios:
+        result = run_scenario(scenario, args.ticks, args.warmup, args.seed, args.workers)
+        results['results'].append(result)
+        print(f"{result['name']:<60} {result['ticks_per_second']:>10.1f} ticks/s  "
+              f"p50 {result['latency_ms']['p50']:>8.2f}ms  "
+              f"p99 {result['latency_ms']['p99']:>8.2f}ms  "
+              f"peak {result['peak_memory_bytes'] / 2**20:>8.1f}MiB")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(parse_args()))
@@ -1,3 +1,4 @@
+import heapq
 from math import atan2, cos, pi, sin, sqrt
 from sys import float_info
 import sim_state
@@ -5,17 +6,27 @@ import config
 
 HALF_PI = pi / 2
 
-class ComputedValues:
-    '''Struct for values computed during the update step'''
-    def __init__(self):
-        self.diff_pos = None
-        self.squared_distance = None
-        self.adjusted_angle = None
-        self.multiplier = 0
-# END class ComputedValues
-
 class Boid:
-    '''A single boid'''
+    '''A single boid.
+
+    Boids use __slots__ and keep their state as plain numbers: with the
+    accumulators below, a boid takes about 270 bytes (object plus floats),
+    down from about 640 bytes with an instance dict and per-boid lists.
+    The geometry and colors are shared by the class.
+
+    The heading is carried as an angle. Subclasses may carry it otherwise,
+    e.g. vector_boid.VectorBoid, sharing the state without a leading double
+    underscore: finding the other boids, their offsets around the world, the
+    buffers and the wrapping. They override the heading kernel: _react_at,
+    _interact_at, _sight, _react_seen, _steer, _update_position,
+    _swap_heading and get_theta.'''
+    __slots__ = (
+        '_id', '_x', '_y', '_magnitude', '_world_size', '_color', '_next_x', '_next_y',
+        '_center_x', '_center_y', '_boids_in_view', '_boids_avoided',
+        '_d_theta_separation', '_d_theta_alignment',
+        '__theta', '__next_theta',
+    )
+
     __MAX_MAGNITUDE = 8
     __VIEW_DISTANCE = 75
     __SQUARED_VIEW_DISTANCE = __VIEW_DISTANCE ** 2
@@ -23,29 +34,29 @@ class Boid:
     __D_THETA_PER_UPDATE = pi / 4
     __D_MAGNITUDE_PER_UPDATE = pi / 50
 
+    __POLY = ((8, 0), (-8, 6), (-4, 0), (-8, -6))
+
     __NEUTRAL_COLOR = (0, 0, 0)
     __ACTIVE_COLOR = (228, 235, 26)
 
     __next_id = 0
 
-    def __init__(self, init_position, init_magnitude, init_theta):
-        self.__id = f'boid_{Boid.__next_id}'
-        self.__pos = [init_position[0], init_position[1]] # force to a list to allow reassignment.
-        self.__magnitude = min(max(init_magnitude, 0), Boid.__MAX_MAGNITUDE)
+    def __init__(self, init_position, init_magnitude, init_theta, world_size=config.WORLD_SIZE):
+        self._id = Boid.__next_id
+        self._x = init_position[0]
+        self._y = init_position[1]
+        self._world_size = world_size
+        self._magnitude = min(max(init_magnitude, 0), Boid.__MAX_MAGNITUDE)
         self.__theta = normalize_angle(init_theta)
-        self.__poly = [(8, 0), (-8, 6), (-4, 0), (-8, -6)]
-        self.__color = Boid.__NEUTRAL_COLOR
+        self._color = Boid.__NEUTRAL_COLOR
 
-        # properties to help w/ computation
-        self.__relative_group_center = [0, 0]
-        self.__boids_in_view = 0
-        self.__boids_avoided = 0
-        self.__d_theta_separation = 0
-        self.__d_theta_alignment = 0
-        self.__d_theta_cohesion = 0
+        # back buffer written by update, see swap_buffers
+        self._next_x = self._x
+        self._next_y = self._y
+        self.__next_theta = self.__theta
 
-        self.__computation_color = False
-        self.__computed_values_dict = {}
+        # properties to help w/ computation, reset in place every tick
+        self._reset_computation_properties()
 
         # finally update the id counter
         Boid.__next_id += 1
@@ -63,122 +74,252 @@ class Boid:
         return Boid.__MAX_MAGNITUDE
 
 
+    @staticmethod
+    def get_view_angle():
+        '''Get the view angle (either side of the heading) for Boids'''
+        return Boid.__VIEW_ANGLE
+
+
+    @staticmethod
+    def get_d_theta_per_update():
+        '''Get the maximum change in theta per update for Boids'''
+        return Boid.__D_THETA_PER_UPDATE
+
+
+    @staticmethod
+    def configure(max_magnitude=None, view_distance=None, view_angle=None,
+                  d_theta_per_update=None):
+        '''Set the constants of the rules, leaving those not given as they are.
+        Neighbor indexes and engines read them when built, so set them first'''
+        if max_magnitude is not None:
+            Boid.__MAX_MAGNITUDE = max_magnitude
+        if view_distance is not None:
+            Boid.__VIEW_DISTANCE = view_distance
+            Boid.__SQUARED_VIEW_DISTANCE = view_distance ** 2
+        if view_angle is not None:
+            Boid.__VIEW_ANGLE = view_angle
+        if d_theta_per_update is not None:
+            Boid.__D_THETA_PER_UPDATE = d_theta_per_update
+
+
+    @staticmethod
+    def get_base_poly():
+        '''Get the unrotated polygon used to draw Boids'''
+        return Boid.__POLY
+
+
+    @staticmethod
+    def get_next_id():
+        '''Get the ID the next Boid created will be given'''
+        return Boid.__next_id
+
+
+    @staticmethod
+    def set_next_id(next_id):
+        '''Set the ID the next Boid created will be given, e.g. when restoring a flock'''
+        Boid.__next_id = next_id
+
+
+    @classmethod
+    def restore(cls, boid_id, position, magnitude, theta, active):
+        '''Returns a boid of this class with the given ID and state, e.g. read
+        from a checkpoint. The ID counter is left for the caller to restore'''
+        boid = cls(position, magnitude, theta)
+        boid._id = boid_id
+        if active:
+            boid._color = Boid.__ACTIVE_COLOR
+        return boid
+
+
+    @staticmethod
+    def get_neutral_color():
+        '''Get the color of a Boid which sees no other boid'''
+        return Boid.__NEUTRAL_COLOR
+
+
+    @staticmethod
+    def get_active_color():
+        '''Get the color of a Boid which sees at least one other boid'''
+        return Boid.__ACTIVE_COLOR
+
+
+    def get_magnitude(self):
+        '''Returns the boid's magnitude'''
+        return self._magnitude
+
+
+    def get_theta(self):
+        '''Returns the boid's heading'''
+        return self.__theta
+
+
     def get_id(self):
         '''Returns the boid's ID'''
-        return self.__id
+        return self._id
 
 
     def get_pos(self):
         '''Returns the boid's position'''
-        return self.__pos
+        return (self._x, self._y)
 
 
     def get_color(self):
         '''Returns the boid's color'''
-        return self.__color
+        return self._color
+
+
+    def set_world_size(self, world_size):
+        '''Sets the (width, height) of the world the boid wraps around'''
+        self._world_size = world_size
+
+
+    def get_boids_in_view(self):
+        '''Returns the number of boids seen in the last update'''
+        return self._boids_in_view
+
+
+    def is_active(self):
+        '''Returns whether the boid saw another boid in its last update'''
+        return self._color is Boid.__ACTIVE_COLOR
 
 
     def get_vec(self):
         '''Returns the boid's velocity vector'''
-        return (self.__magnitude, self.__theta)
+        return (self._magnitude, self.get_theta())
 
 
     def get_poly(self):
         '''Returns the boid's rotated poly'''
-        a = rotate(self.__poly[0], self.__theta)
-        b = rotate(self.__poly[1], self.__theta)
-        c = rotate(self.__poly[2], self.__theta)
-        d = rotate(self.__poly[3], self.__theta)
-        return transpose([a, b, c, d], self.__pos)
+        a = rotate(Boid.__POLY[0], self.__theta)
+        b = rotate(Boid.__POLY[1], self.__theta)
+        c = rotate(Boid.__POLY[2], self.__theta)
+        d = rotate(Boid.__POLY[3], self.__theta)
+        return transpose([a, b, c, d], (self._x, self._y))
+
+
+    def update(self, boid_groups, synchronous=False, nearest=None, field=None):
+        '''Update the boids speed, then position based on active rules.
+        When synchronous, the new state is written to a back buffer, and other
+        boids keep seeing the previous state until swap_buffers is called.
+        When nearest is given, the boid only reacts to that many of the
+        closest boids it can see. When an ObstacleField is given, the boid
+        also steers around its obstacles and towards its attractors'''
+        # read the state, in case it changes during execution.
+        rules = (sim_state.SEPARATION, sim_state.ALIGNMENT, sim_state.COHESION)
 
+        self.begin_update()
 
-    def get_computed_values(self, other_id, other_computation_color):
-        '''Return values computed against the other boid'''
-        if other_computation_color != self.__computation_color:
-            return None
+        # if the boid is not moving, or no rule is active, no need to look around
+        if self._magnitude != 0 and any(rules) and nearest is not None:
+            self.__observe_nearest(boid_groups, rules, nearest)
+        elif self._magnitude != 0 and any(rules):
+            # iterate over each boid group
+            for group in boid_groups:
+                # iterate over each boid in the group
+                for other in group:
+                    # don't check self
+                    if other is self:
+                        continue
 
-        if other_id in self.__computed_values_dict:
-            return self.__computed_values_dict[other_id]
+                    self.__observe(other, rules)
+                # end boid loop
+            # end group loop
 
-        return None
+        self.finish_update(rules, synchronous, field)
 
 
-    def update(self, boid_groups):
-        '''Update the boids speed, then position based on active rules'''
+    def begin_update(self):
+        '''Prepare the boid for a new tick, before it reacts to any other boid'''
+        self._color = Boid.__NEUTRAL_COLOR
+        self._reset_computation_properties()
 
-        self.__color = Boid.__NEUTRAL_COLOR
-        self.__computation_color = not self.__computation_color
 
-        # if the boid is not moving, it need not do anything to avoid the collision
-        if self.__magnitude == 0:
-            return
+    def interact(self, other, rules):
+        '''Evaluate a pair of boids once, letting each react to the other.
+        Both boids must have called begin_update, and neither finish_update'''
+        offset = self.__offset_to(other)
+        if offset is not None:
+            diff_x, diff_y, squared_distance = offset
+            self._interact_at(other, diff_x, diff_y, squared_distance, rules)
 
-        # read the state, in case it changes during execution.
-        separation = sim_state.SEPARATION
-        alignment = sim_state.ALIGNMENT
-        cohesion = sim_state.COHESION
 
-        # if o rule is active, no need to do anything
-        if not (separation or alignment or cohesion):
-            self.__update_position()
-            return
+    def _interact_at(self, other, diff_x, diff_y, squared_distance, rules):
+        # lets self and other react to one another, from the offset between them
 
-        # some computation is bound to take place, so we perpare
-        self.__reset_computation_properties()
+        # the same distance and direction serve both boids, the other simply
+        # sees self in the opposite direction
+        distance = sqrt(squared_distance)
+        angle = direction(diff_x, diff_y)
 
-        # iterate over each boid group
-        for group in boid_groups:
-            # iterate over each boid in the group
-            for other in group:
-                # don't check self
-                if other.get_id() == self.__id:
-                    continue
+        self.__react(
+            other, diff_x, diff_y, distance, normalize_angle(angle - self.__theta), rules)
+        other.__react(
+            self, -diff_x, -diff_y, distance, normalize_angle(angle + pi - other.__theta), rules)
 
-                # see if the other boid already computed some variables
-                comp_vals = other.get_computed_values(self.__id, self.__computation_color)
-                if comp_vals is None:
-                    comp_vals = ComputedValues()
-                    self.__computed_values_dict[other.get_id()] = comp_vals
 
-                # if the other boid is not visible, we cannot act on it.
-                if not self.__can_see(other, comp_vals):
-                    continue
+    def finish_update(self, rules, synchronous=False, field=None):
+        '''Apply the changes accumulated since begin_update, then move the boid'''
+        self.apply_steering(rules, field)
+        self.move(synchronous)
+
+
+    def apply_steering(self, rules, field=None):
+        '''Turn the boid by the changes accumulated since begin_update, and
+        by the obstacle field if given, the first half of finish_update'''
+        self._steer(rules[2], field)
 
-                # follow the 3 rules if active
-                if separation:
-                    self.__avoid_collision(other, comp_vals)
 
-                if alignment:
-                    self.__align(other, comp_vals)
+    def move(self, synchronous=False):
+        '''Move the boid along its new heading, the second half of finish_update'''
+        self._update_position()
 
-                # cohesion will try to go towards the center of the local group
-                # however we will only compute the relative center
-                if cohesion:
-                    self.__adjust_relative_center(comp_vals)
-            # end boid loop
-        # end group loop
+        if not synchronous:
+            self.swap_buffers()
 
-        # if we didn't see a sinlge boid, we can update the positino and just return
-        if self.__boids_in_view == 0:
-            self.__update_position()
+
+    def swap_buffers(self):
+        '''Makes the state computed by the last update visible to other boids'''
+        self._x = self._next_x
+        self._y = self._next_y
+        self._swap_heading()
+
+
+    def _swap_heading(self):
+        # makes the heading in the back buffer visible, see swap_buffers
+        self.__theta = self.__next_theta
+
+
+    def _steer(self, cohesion, field=None):
+        # computes the change in theta, writing the new heading to the back buffer
+        self.__next_theta = self.__theta
+
+        # if we didn't see a sinlge boid, only the obstacles steer the boid
+        if self._boids_in_view == 0:
+            if field is not None:
+                self.__next_theta += max(
+                    min(
+                        field.turn(self._x, self._y, self.__theta),
+                        Boid.__D_THETA_PER_UPDATE
+                    ),
+                    -Boid.__D_THETA_PER_UPDATE
+                )
             return
 
         # once we've found the relative center, we try to move towards it
-        if cohesion:
-            self.__merge()
+        d_theta_cohesion = self.__merge() if cohesion else 0
 
         # determine the final change in theta
         final_d_theta = \
-            self.__d_theta_alignment / self.__boids_in_view + \
-            self.__d_theta_cohesion / self.__boids_in_view
+            self._d_theta_alignment / self._boids_in_view + \
+            d_theta_cohesion / self._boids_in_view
 
         # only account for separation if we've actually avoided any
-        if self.__boids_avoided > 0:
+        if self._boids_avoided > 0:
             final_d_theta += \
-                self.__d_theta_separation / self.__boids_avoided
+                self._d_theta_separation / self._boids_avoided
 
         # cannot exceed the max change in theta per update
-        self.__theta += max(
+        final_d_theta = max(
             min(
                 final_d_theta,
                 Boid.__D_THETA_PER_UPDATE
@@ -186,126 +327,233 @@ class Boid:
             -Boid.__D_THETA_PER_UPDATE
         )
 
-        self.__update_position()
+        # the obstacles steer the boid on top of the others, within the same limit
+        if field is not None:
+            final_d_theta = max(
+                min(
+                    final_d_theta + field.turn(self._x, self._y, self.__theta),
+                    Boid.__D_THETA_PER_UPDATE
+                ),
+                -Boid.__D_THETA_PER_UPDATE
+            )
 
+        self.__next_theta += final_d_theta
 
-    def __reset_computation_properties(self):
-        self.__relative_group_center = [0, 0]
-        self.__boids_in_view = 0
-        self.__boids_avoided = 0
-        self.__d_theta_separation = 0
-        self.__d_theta_alignment = 0
-        self.__d_theta_cohesion = 0
 
-        self.__computed_values_dict = {}
+    def _reset_computation_properties(self):
+        self._center_x = 0
+        self._center_y = 0
+        self._boids_in_view = 0
+        self._boids_avoided = 0
+        self._d_theta_separation = 0
+        self._d_theta_alignment = 0
 
 
-    def __enforce_bounds(self):
-        # safety check: limit theta to +/- pi
-        self.__theta = normalize_angle(self.__theta)
-
+    def _enforce_bounds(self):
         # safety check: limit magnitude to [0, 8]
-        self.__magnitude = min(max(self.__magnitude, 0), Boid.__MAX_MAGNITUDE)
+        self._magnitude = min(max(self._magnitude, 0), Boid.__MAX_MAGNITUDE)
 
         # wrapping behavior: wrap around to other end
-        if self.__pos[0] > config.SCREEN_SIZE[0] or self.__pos[0] < 0:
-            self.__pos[0] %= config.SCREEN_SIZE[0] + 1
-        if self.__pos[1] > config.SCREEN_SIZE[1] or self.__pos[1] < 0:
-            self.__pos[1] %= config.SCREEN_SIZE[1] + 1
+        width, height = self._world_size
+        if self._next_x > width or self._next_x < 0:
+            self._next_x %= width + 1
+        if self._next_y > height or self._next_y < 0:
+            self._next_y %= height + 1
+
+
+    def __offset_to(self, other):
+        # returns the (diff_x, diff_y, squared_distance) from self to other,
+        # the shortest way around the world, or None if self cannot see it
+        view_distance = Boid.__VIEW_DISTANCE
+
+        # if the other is too far from self along either axis, we cannot see
+        # it. Positions wrap with a period of the world size + 1, see
+        # _enforce_bounds, so past the view distance only the other's copy
+        # across the edge of the world can be close enough
+        diff_x = other._x - self._x
+        if diff_x > view_distance:
+            diff_x -= self._world_size[0] + 1
+            if diff_x < -view_distance:
+                return None
+        elif diff_x < -view_distance:
+            diff_x += self._world_size[0] + 1
+            if diff_x > view_distance:
+                return None
+
+        diff_y = other._y - self._y
+        if diff_y > view_distance:
+            diff_y -= self._world_size[1] + 1
+            if diff_y < -view_distance:
+                return None
+        elif diff_y < -view_distance:
+            diff_y += self._world_size[1] + 1
+            if diff_y > view_distance:
+                return None
+
+        squared_distance = diff_x * diff_x + diff_y * diff_y
+        if squared_distance > Boid.__SQUARED_VIEW_DISTANCE:
+            return None
 
+        # a boid sharing the exact same position has no direction relative to self
+        if squared_distance == 0:
+            return None
 
-    def __can_see(self, other, comp_vals):
-        # determine if the other's relative position to self
-        o_pos = other.get_pos()
-        if comp_vals.diff_pos is None:
-            comp_vals.diff_pos = (o_pos[0]-self.__pos[0], o_pos[1]-self.__pos[1])
-        else:
-            comp_vals.diff_pos = (-comp_vals.diff_pos[0], -comp_vals.diff_pos[1])
+        return (diff_x, diff_y, squared_distance)
 
-        # if the other is too far from self, we cannot see it
-        if comp_vals.diff_pos[0] > Boid.__VIEW_DISTANCE or \
-            comp_vals.diff_pos[1] > Boid.__VIEW_DISTANCE:
-            return False
 
-        # now we can compute and store the distance squared
-        if comp_vals.squared_distance is None:
-            comp_vals.squared_distance = comp_vals.diff_pos[0]**2 + comp_vals.diff_pos[1]**2
+    def __observe(self, other, rules):
+        # determine the other's relative position to self, and react to it.
+        # The offset is inlined from __offset_to as this is the hot path
+        view_distance = Boid.__VIEW_DISTANCE
+        diff_x = other._x - self._x
+        if diff_x > view_distance:
+            diff_x -= self._world_size[0] + 1
+            if diff_x < -view_distance:
+                return
+        elif diff_x < -view_distance:
+            diff_x += self._world_size[0] + 1
+            if diff_x > view_distance:
+                return
+
+        diff_y = other._y - self._y
+        if diff_y > view_distance:
+            diff_y -= self._world_size[1] + 1
+            if diff_y < -view_distance:
+                return
+        elif diff_y < -view_distance:
+            diff_y += self._world_size[1] + 1
+            if diff_y > view_distance:
+                return
 
-        if comp_vals.squared_distance > Boid.__SQUARED_VIEW_DISTANCE:
-            return False
+        squared_distance = diff_x * diff_x + diff_y * diff_y
+        if squared_distance > Boid.__SQUARED_VIEW_DISTANCE or squared_distance == 0:
+            return
 
-        # determine the other boid's angle relative to self
-        if comp_vals.adjusted_angle is None:
-            if comp_vals.diff_pos[0] == 0:
-                angle_from_boid = HALF_PI if comp_vals.diff_pos[1] >= 0 else -HALF_PI
-            else:
-                angle_from_boid = atan2(comp_vals.diff_pos[1], comp_vals.diff_pos[0])
+        self._react_at(other, diff_x, diff_y, squared_distance, rules)
 
-            # adjust relative angle
-            comp_vals.adjusted_angle = normalize_angle(angle_from_boid - self.__theta)
-        else:
-            comp_vals.adjusted_angle = normalize_angle(comp_vals.adjusted_angle + pi - self.__theta)
 
+    def __observe_nearest(self, boid_groups, rules, nearest):
+        # find every boid in view first, then only react to the nearest ones
+        in_view = []
+        for group in boid_groups:
+            for other in group:
+                if other is self:
+                    continue
+
+                offset = self.__offset_to(other)
+                if offset is None:
+                    continue
+                diff_x, diff_y, squared_distance = offset
+
+                sight = self._sight(diff_x, diff_y, squared_distance)
+                if sight is None:
+                    continue
+
+                # the id breaks ties, so that boids are never compared
+                in_view.append((squared_distance, other._id, other, diff_x, diff_y, sight))
+
+        # a bounded selection of the nearest, rather than sorting every boid in view
+        if len(in_view) > nearest:
+            in_view = heapq.nsmallest(nearest, in_view)
+
+        for squared_distance, _, other, diff_x, diff_y, sight in in_view:
+            self._react_seen(other, diff_x, diff_y, squared_distance, sight, rules)
+
+
+    def _react_at(self, other, diff_x, diff_y, squared_distance, rules):
+        # reacts to another boid within the view distance, from the offset to it
+        adjusted_angle = normalize_angle(direction(diff_x, diff_y) - self.__theta)
+        self.__react(other, diff_x, diff_y, sqrt(squared_distance), adjusted_angle, rules)
+
+
+    def _sight(self, diff_x, diff_y, squared_distance):
+        # returns how self sees another boid at the offset, its adjusted
+        # angle, or None if it is outside the view angle
+        adjusted_angle = normalize_angle(direction(diff_x, diff_y) - self.__theta)
+        if adjusted_angle >= Boid.__VIEW_ANGLE or adjusted_angle <= -Boid.__VIEW_ANGLE:
+            return None
+        return adjusted_angle
+
+
+    def _react_seen(self, other, diff_x, diff_y, squared_distance, sight, rules):
+        # reacts to another boid in view, as returned by _sight
+        self.__react(other, diff_x, diff_y, sqrt(squared_distance), sight, rules)
+
+
+    def __react(self, other, diff_x, diff_y, distance, adjusted_angle, rules):
+        # if the boid is not moving, it need not do anything
+        if self._magnitude == 0:
+            return
 
         # if we cannot see the other boid, do nothing
-        if comp_vals.adjusted_angle >= Boid.__VIEW_ANGLE or \
-            comp_vals.adjusted_angle <= -Boid.__VIEW_ANGLE:
-            return False
+        if adjusted_angle >= Boid.__VIEW_ANGLE or \
+            adjusted_angle <= -Boid.__VIEW_ANGLE:
+            return
 
         # we can see the other boid!
-        self.__boids_in_view += 1
-        self.__color = Boid.__ACTIVE_COLOR
-        comp_vals.multiplier = 1 / sqrt(comp_vals.squared_distance)
+        self._boids_in_view += 1
+        self._color = Boid.__ACTIVE_COLOR
+        multiplier = 1 / distance
 
-        return True
+        # follow the 3 rules if active
+        separation, alignment, cohesion = rules
+        if separation:
+            self.__avoid_collision(other, adjusted_angle, multiplier)
+
+        if alignment:
+            self.__align(other, multiplier)
+
+        # cohesion will try to go towards the center of the local group
+        # however we will only compute the relative center
+        if cohesion:
+            self.__adjust_relative_center(diff_x, diff_y, distance)
 
 
-    def __avoid_collision(self, other, comp_vals):
+    def __avoid_collision(self, other, adjusted_angle, multiplier):
         # get the other's adjusted vector angle
-        o_vec = other.get_vec()
-        o_adjusted_theta = normalize_angle(o_vec[1] - self.__theta)
+        o_magnitude = other._magnitude
+        o_adjusted_theta = normalize_angle(other.__theta - self.__theta)
 
         ## first we consider some edge cases
-        if float_equals(comp_vals.adjusted_angle, 0):
+        if float_equals(adjusted_angle, 0):
             # case 1: boid is directly in front
-            if o_vec[0] == 0:
+            if o_magnitude == 0:
                 # case 1.1: stationary boid, move out of the way
-                self.__boids_avoided += 1
-                self.__d_theta_separation += Boid.__D_THETA_PER_UPDATE * comp_vals.multiplier
+                self._boids_avoided += 1
+                self._d_theta_separation += Boid.__D_THETA_PER_UPDATE * multiplier
                 return
 
             if float_equals(o_adjusted_theta, 0):
                 # case 1.2: moving away directly away. If too slow,
                 # dodge it otherwise no need to do anything
-                if o_vec[0] < self.__magnitude:
-                    self.__boids_avoided += 1
-                    self.__d_theta_separation += Boid.__D_THETA_PER_UPDATE * comp_vals.multiplier
+                if o_magnitude < self._magnitude:
+                    self._boids_avoided += 1
+                    self._d_theta_separation += Boid.__D_THETA_PER_UPDATE * multiplier
                 return
         # note, we do not need to consider a boids directly behind as we cannot see them
 
         # At this point, we know there is no boid directly in front,
         # but if it's not moving, don't need to avoid it.
-        if o_vec[0] == 0:
+        if o_magnitude == 0:
             return
 
         # last thing to check is if a collision will occur
-        if not in_range(o_adjusted_theta, (0, normalize_angle(pi + comp_vals.adjusted_angle))):
+        if not in_range(o_adjusted_theta, (0, normalize_angle(pi + adjusted_angle))):
             return
 
         # finally, since a collision may occur, we veer away from the other boid
-        if comp_vals.adjusted_angle <= 0:
-            self.__d_theta_separation += Boid.__D_THETA_PER_UPDATE * comp_vals.multiplier
+        if adjusted_angle <= 0:
+            self._d_theta_separation += Boid.__D_THETA_PER_UPDATE * multiplier
         else:
-            self.__d_theta_separation -= Boid.__D_THETA_PER_UPDATE * comp_vals.multiplier
+            self._d_theta_separation -= Boid.__D_THETA_PER_UPDATE * multiplier
 
-        self.__boids_avoided += 1
+        self._boids_avoided += 1
 
 
-    def __align(self, other, comp_vals):
+    def __align(self, other, multiplier):
         # we should only try to align with boids going in the same general direction
         # the rule will be that the angle difference cannot be more than pi/2
-        o_vec = other.get_vec()
-        angle_diff = o_vec[1] - self.__theta
+        angle_diff = other.__theta - self.__theta
 
         # the absolute value must be less than pi/2
         if not -pi/2 <= angle_diff <= pi/2:
@@ -316,33 +564,32 @@ class Boid:
             return
 
         # otherwise, we will try to fall into it's trajectory, but based on our distance to it.
-        self.__d_theta_alignment += angle_diff * comp_vals.multiplier
+        self._d_theta_alignment += angle_diff * multiplier
 
 
-    def __adjust_relative_center(self, comp_vals):
+    def __adjust_relative_center(self, diff_x, diff_y, distance):
         # we just add the values, no need to average as we want the angle in the end
-        self.__relative_group_center[0] += comp_vals.diff_pos[0] / comp_vals.multiplier
-        self.__relative_group_center[1] += comp_vals.diff_pos[1] / comp_vals.multiplier
+        self._center_x += diff_x * distance
+        self._center_y += diff_y * distance
 
 
     def __merge(self):
-        if self.__boids_in_view == 0:
-            return
-
         # at this point, we want to move toward the relative group center
-        absolute_angle = atan2(self.__relative_group_center[1], self.__relative_group_center[0])
+        absolute_angle = atan2(self._center_y, self._center_x)
         relative_angle = absolute_angle - self.__theta
-        self.__d_theta_cohesion += relative_angle / self.__boids_in_view
+        return relative_angle / self._boids_in_view
+
 
+    def _update_position(self):
+        # get update the position based on the speed, into the back buffer
+        self._next_x = self._x + self._magnitude * cos(self.__next_theta)
+        self._next_y = self._y + self._magnitude * sin(self.__next_theta)
 
-    def __update_position(self):
-        # get update the position based on the speed
-        delta = to_xy(self.__magnitude, self.__theta)
-        self.__pos[0] += delta[0]
-        self.__pos[1] += delta[1]
+        # safety check: limit theta to +/- pi
+        self.__next_theta = normalize_angle(self.__next_theta)
 
         # enforce bounding
-        self.__enforce_bounds()
+        self._enforce_bounds()
 # END class Boid
 
 def to_xy(magnitude, theta):
@@ -366,6 +613,13 @@ def transpose(coords, xy):
     return updated_coords
 
 
+def direction(diff_x, diff_y):
+    '''Returns the angle of the vector from the origin to (diff_x, diff_y)'''
+    if diff_x == 0:
+        return HALF_PI if diff_y >= 0 else -HALF_PI
+    return atan2(diff_y, diff_x)
+
+
 def normalize_angle(theta):
     '''Normalizez the provided theta to the range ]-pi, pi]'''
     if theta > pi:
@@ -0,0 +1,157 @@
+"""
+The view of the world shown in the window.
+
+The world can be much larger than the window. `Camera` maps world positions
+to the screen, panned and zoomed, and culls the boids outside the view
+before they are drawn. The view wraps around the edges of the world like the
+boids do, so it can be panned across them. Sprites keep their size whatever
+the zoom, a zoomed out view of a large world is a map of the flocks.
+
+While the whole world fits the window unzoomed, positions are passed through
+untouched, at no cost.
+"""
+
+import config
+
+# the view can be zoomed in up to this factor
+MAX_ZOOM = 4
+
+
+class Camera:
+    '''A panned and zoomed view of a wrapping world'''
+    def __init__(self, world_size, screen_size=config.SCREEN_SIZE):
+        self._world_size = world_size
+        self._screen_size = screen_size
+
+        # positions wrap around with this period, see Boid._enforce_bounds
+        self._period = (world_size[0] + 1, world_size[1] + 1)
+
+        # the world position of the top left corner of the window
+        self._x = 0.0
+        self._y = 0.0
+        self._zoom = 1.0
+        self._min_zoom = min(
+            1.0, screen_size[0] / world_size[0], screen_size[1] / world_size[1])
+        self.fit()
+
+
+    def get_state(self):
+        '''Returns the (x, y, zoom) of the view, which change whenever it moves'''
+        return (self._x, self._y, self._zoom)
+
+
+    def get_zoom(self):
+        '''Returns how many pixels a unit of the world spans on screen'''
+        return self._zoom
+
+
+    def fit(self):
+        '''Zooms out until the whole world fits the window, at most to 1:1, and
+        centers it'''
+        self._zoom = self._min_zoom
+        self._x = (self._world_size[0] - self._screen_size[0] / self._zoom) / 2
+        self._y = (self._world_size[1] - self._screen_size[1] / self._zoom) / 2
+
+
+    def pan(self, d_x, d_y):
+        '''Moves the view by the given number of pixels on screen'''
+        self._x += d_x / self._zoom
+        self._y += d_y / self._zoom
+
+        # only views narrower than the world wrap around it, the others stay centered
+        if self._wraps(0):
+            self._x %= self._period[0]
+        else:
+            self._x = (self._world_size[0] - self._screen_size[0] / self._zoom) / 2
+        if self._wraps(1):
+            self._y %= self._period[1]
+        else:
+            self._y = (self._world_size[1] - self._screen_size[1] / self._zoom) / 2
+
+
+    def zoom(self, factor):
+        '''Zooms in by factor, or out if below 1, around the center of the window'''
+        zoom = min(max(self._zoom * factor, self._min_zoom), MAX_ZOOM)
+        center_x = self._x + self._screen_size[0] / (2 * self._zoom)
+        center_y = self._y + self._screen_size[1] / (2 * self._zoom)
+
+        self._zoom = zoom
+        self._x = center_x - self._screen_size[0] / (2 * zoom)
+        self._y = center_y - self._screen_size[1] / (2 * zoom)
+        self.pan(0, 0)
+
+
+    def view(self, positions, thetas, states, margin=0):
+        '''Returns the screen (positions, thetas, states) of the boids within
+        margin pixels of the window, the others are left out'''
+        if self._zoom == 1 and self._x == 0 and self._y == 0 and \
+            not self._wraps(0) and not self._wraps(1):
+            return positions, thetas, states
+
+        zoom = self._zoom
+        # boids just before the top left corner are wrapped to it, not past
+        # the bottom right one, so they are drawn partly on screen
+        edge = margin / zoom
+        low_x, low_y = -margin, -margin
+        high_x = self._screen_size[0] + margin
+        high_y = self._screen_size[1] + margin
+        period_x = self._period[0] if self._wraps(0) else None
+        period_y = self._period[1] if self._wraps(1) else None
+
+        if hasattr(thetas, 'astype'):
+            # numpy arrays from the array engines, all at once
+            screen_x = positions[:, 0] - self._x
+            screen_y = positions[:, 1] - self._y
+            if period_x is not None:
+                screen_x = (screen_x + edge) % period_x - edge
+            if period_y is not None:
+                screen_y = (screen_y + edge) % period_y - edge
+            screen_x *= zoom
+            screen_y *= zoom
+
+            visible = (screen_x >= low_x) & (screen_x <= high_x) & \
+                (screen_y >= low_y) & (screen_y <= high_y)
+            screen = positions[visible]
+            screen[:, 0] = screen_x[visible]
+            screen[:, 1] = screen_y[visible]
+            return screen, thetas[visible], states[visible]
+
+        screen_positions = []
+        screen_thetas = []
+        screen_states = []
+        for (x, y), theta, state in zip(positions, thetas, states):
+            x -= self._x
+            y -= self._y
+            if period_x is not None:
+                x = (x + edge) % period_x - edge
+            if period_y is not None:
+                y = (y + edge) % period_y - edge
+            x *= zoom
+            y *= zoom
+
+            if low_x <= x <= high_x and low_y <= y <= high_y:
+                screen_positions.append((x, y))
+                screen_thetas.append(theta)
+                screen_states.append(state)
+
+        return screen_positions, screen_thetas, screen_states
+
+
+    def to_screen(self, x, y, margin=0):
+        '''Returns the screen position of a world position, wrapped around the
+        world like the boids in view, e.g. to draw a shape margin pixels wide'''
+        edge = margin / self._zoom
+        x -= self._x
+        y -= self._y
+        if self._wraps(0):
+            x = (x + edge) % self._period[0] - edge
+        if self._wraps(1):
+            y = (y + edge) % self._period[1] - edge
+        return x * self._zoom, y * self._zoom
+
+
+    def _wraps(self, axis):
+        # whether the view is narrower than the world along the axis, so
+        # that panning wraps around the world's edges
+        return self._screen_size[axis] / self._zoom < self._world_size[axis]
+# END class Camera
@@ -7,9 +7,90 @@ SCREEN_WIDTH = 1000
 SCREEN_HEIGHT = 750
 SCREEN_SIZE = (SCREEN_WIDTH, SCREEN_HEIGHT)
 
+# Size of the world the boids fly in, wrapping around at its edges. The window
+# shows a screen-sized view of it, which can be panned and zoomed when the
+# world is larger, see main.py
+WORLD_SIZE = SCREEN_SIZE
+
 BG_COLOR = (72, 72, 72)
 FONT_RED = (128, 16, 16)
 FONT_GREEN = (16, 128, 16)
 FONT_LIGHT_GRAY = (200, 200, 200)
+OBSTACLE_COLOR = (40, 40, 40)
+ATTRACTOR_COLOR = (16, 128, 16)
 
 BOID_COUNT = 75
+
+# Simulation engine: 'object' updates each Boid object in turn,
+# 'numpy' updates the whole flock at once with array operations (requires numpy),
+# 'parallel' splits the numpy engine's work between worker processes,
+# 'jit' runs the numpy engine's neighbor pass compiled by Numba, in parallel
+# (requires numba, or else falls back to the numpy engine's array code)
+ENGINE = 'object'
+
+# Worker processes of the parallel engine, None uses one per core
+WORKER_COUNT = None
+
+# Update mode of the object engine: 'sequential' boids see the updates made
+# earlier in the same tick, 'synchronous' boids all see the previous tick,
+# which lets each pair of boids be evaluated once for both
+UPDATE_MODE = 'sequential'
+
+# How nearby boids are found: 'grid' uses a uniform grid of cells,
+# 'sparse' the same grid only storing its occupied cells, for worlds much
+# larger than their flocks,
+# 'quadtree' an adaptive quadtree which copes better with clumped flocks,
+# 'verlet' neighbor lists reused until boids moved more than half the skin.
+# The numpy engine supports 'grid' and 'verlet', the parallel engine 'grid'
+NEIGHBOR_INDEX = 'grid'
+
+# Topological mode: each boid only reacts to this many of the nearest boids it
+# sees, e.g. 7 like starlings, which bounds its work however dense the flock
+# gets. None reacts to every boid in view
+NEAREST_NEIGHBORS = None
+
+# How the object engine carries headings: 'angle' as an angle, normalized
+# after every turn, 'vector' as a unit vector, testing other boids with dot
+# and cross products rather than atan2, for equivalent but faster flocking
+HEADING_KERNEL = 'angle'
+
+# Margin of the 'verlet' neighbor lists beyond the view distance, in pixels.
+# Larger skins are rebuilt less often, but hold more candidates
+VERLET_SKIN = 24
+
+# Boids are drawn from pre-rendered sprites, with headings rounded to one of
+# this many angles
+SPRITE_ANGLES = 64
+
+# Only push the parts of the window which changed to the display, i.e. around
+# the boids and overlays, rather than the whole window every frame. Cheaper
+# for small flocks, the full update wins once boids cover most of the window
+DIRTY_RECTS = False
+
+# Ticks and frames summarized by the profiling overlay and exports
+PROFILE_WINDOW = 120
+
+# Where the stream of the simulation is served to subscribers, see stream.py,
+# raw over TCP on one port and as WebSocket messages on the next one. Serve
+# on '0.0.0.0' for the rest of the LAN
+STREAM_HOST = '127.0.0.1'
+STREAM_PORT = 8765
+STREAM_WEBSOCKET_PORT = 8766
+
+# Streamed positions are rounded to 1/STREAM_SCALE pixels
+STREAM_SCALE = 8
+
+# Frames are dropped for a subscriber while this many bytes still wait to be
+# sent to it, rather than queueing up behind a slow connection
+STREAM_BUFFER_LIMIT = 64 * 1024
+
+# The obstacle field is sampled this many times across each cell of the
+# neighbor grid, about every 9 pixels, see obstacles.py
+OBSTACLE_FIELD_RESOLUTION = 8
+
+# Boids start turning away from obstacles this many pixels before them
+OBSTACLE_AVOID_DISTANCE = 50
+
+# Where sampled obstacle fields are cached, None caches them in the user's
+# cache directory, e.g. ~/.cache/py3-boids/fields
+OBSTACLE_CACHE_DIR = None
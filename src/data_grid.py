@@ -6,6 +6,7 @@ class DataGrid:
 
         self._data = [[[] for j in range(width)] for i in range(height)]
         self._cell_groups = [[[] for j in range(width)] for i in range(height)]
+        self._forward_cell_groups = [[[] for j in range(width)] for i in range(height)]
 
         self._precompute_cell_groups()
 
@@ -22,16 +23,43 @@ class DataGrid:
         return cell.remove(data)
 
 
+    def move_data(self, data, from_coords, to_coords):
+        from_coords = self._process_coords(from_coords)
+        to_coords = self._process_coords(to_coords)
+        if from_coords == to_coords:
+            return
+
+        self._data[from_coords[0]][from_coords[1]].remove(data)
+        self._data[to_coords[0]][to_coords[1]].append(data)
+
+
     def get_cell(self, coords):
         coords = self._process_coords(coords)
         return self._data[coords[0]][coords[1]]
 
 
+    def get_occupied_cells(self):
+        # the ([row, column], cell) of every cell holding data, row by row
+        return [
+            ([x, y], cell)
+            for x, row in enumerate(self._data)
+            for y, cell in enumerate(row)
+            if cell
+        ]
+
+
     def get_cell_group(self, coords):
         x, y = coords[0] % self._height, coords[1] % self._width
         return self._cell_groups[x][y]
 
 
+    def get_forward_cell_group(self, coords):
+        # the neighboring cells which come after this one, so that iterating
+        # every cell against its forward group visits each pair of cells once
+        x, y = coords[0] % self._height, coords[1] % self._width
+        return self._forward_cell_groups[x][y]
+
+
     def _process_coords(self, coords):
         if self._wraparound:
             coords[0] %= self._height
@@ -53,4 +81,147 @@ class DataGrid:
                 c8 = self.get_cell([x+1, y  ])
                 c9 = self.get_cell([x+1, y+1])
 
-                self._cell_groups[x][y] = [c1, c2, c3, c4, c5, c6, c7, c8, c9]
+                # on small grids several offsets can wrap onto the same cell,
+                # keep each distinct cell once
+                cells = [c1, c2, c3, c4, c5, c6, c7, c8, c9]
+                self._cell_groups[x][y] = \
+                    [cell for index, cell in enumerate(cells)
+                     if not any(cell is other for other in cells[:index])]
+
+                self._forward_cell_groups[x][y] = self._forward_cells(x, y)
+
+
+    def _forward_cells(self, x, y):
+        # neighbors with a greater index than the cell, each distinct cell only
+        # once, in case the grid is small enough for offsets to wrap onto the same cell
+        own_index = x * self._width + y
+        cells = {}
+        for d_x in (-1, 0, 1):
+            for d_y in (-1, 0, 1):
+                n_x, n_y = x + d_x, y + d_y
+                if self._wraparound:
+                    n_x %= self._height
+                    n_y %= self._width
+                elif not (0 <= n_x < self._height and 0 <= n_y < self._width):
+                    continue
+
+                index = n_x * self._width + n_y
+                if index > own_index:
+                    cells[index] = self._data[n_x][n_y]
+
+        return list(cells.values())
+# END class DataGrid
+
+class SparseDataGrid:
+    '''A grid which only stores its occupied cells, keyed by (row, column), for
+    worlds much larger than their flocks. Cell groups are gathered when first
+    asked for, and kept until a cell around them is filled or emptied'''
+    def __init__(self, width, height, wraparound):
+        self._width = width
+        self._height = height
+        self._wraparound = wraparound
+
+        self._data = {}
+        self._cell_groups = {}
+        self._forward_cell_groups = {}
+
+
+    def push_data(self, data, coords):
+        key = self._process_coords(coords)
+        cell = self._data.get(key)
+        if cell is None:
+            cell = self._data[key] = []
+            self._forget_cell_groups(key)
+        cell.append(data)
+
+
+    def pop_data(self, data, coords):
+        key = self._process_coords(coords)
+        cell = self._data[key]
+        cell.remove(data)
+
+        # empty cells are not kept
+        if not cell:
+            del self._data[key]
+            self._forget_cell_groups(key)
+
+
+    def move_data(self, data, from_coords, to_coords):
+        if self._process_coords(from_coords) == self._process_coords(to_coords):
+            return
+
+        self.pop_data(data, from_coords)
+        self.push_data(data, to_coords)
+
+
+    def get_cell(self, coords):
+        return self._data.get(self._process_coords(coords), EMPTY_CELL)
+
+
+    def get_occupied_cells(self):
+        # the ((row, column), cell) of every cell holding data, in the order
+        # they were filled
+        return self._data.items()
+
+
+    def get_cell_group(self, coords):
+        key = self._process_coords(coords)
+        group = self._cell_groups.get(key)
+        if group is None:
+            group = self._cell_groups[key] = self._gather_cells(key, False)
+        return group
+
+
+    def get_forward_cell_group(self, coords):
+        # the neighboring cells which come after this one, see DataGrid
+        key = self._process_coords(coords)
+        group = self._forward_cell_groups.get(key)
+        if group is None:
+            group = self._forward_cell_groups[key] = self._gather_cells(key, True)
+        return group
+
+
+    def _process_coords(self, coords):
+        if self._wraparound:
+            return (coords[0] % self._height, coords[1] % self._width)
+        return (coords[0], coords[1])
+
+
+    def _forget_cell_groups(self, key):
+        # the groups hold the cells themselves, so they only change when a
+        # cell appears or disappears, and only the groups around that cell
+        x, y = key
+        for d_x in (-1, 0, 1):
+            for d_y in (-1, 0, 1):
+                around = self._process_coords((x + d_x, y + d_y))
+                self._cell_groups.pop(around, None)
+                self._forward_cell_groups.pop(around, None)
+
+
+    def _gather_cells(self, key, forward):
+        # the occupied cells around key, in the same order as DataGrid, each
+        # distinct cell once in case offsets wrap onto the same cell
+        x, y = key
+        own_index = x * self._width + y
+        cells = {}
+        for d_x in (-1, 0, 1):
+            for d_y in (-1, 0, 1):
+                n_x, n_y = x + d_x, y + d_y
+                if self._wraparound:
+                    n_x %= self._height
+                    n_y %= self._width
+                elif not (0 <= n_x < self._height and 0 <= n_y < self._width):
+                    continue
+
+                if forward and n_x * self._width + n_y <= own_index:
+                    continue
+
+                cell = self._data.get((n_x, n_y))
+                if cell is not None:
+                    cells[(n_x, n_y)] = cell
+
+        return list(cells.values())
+# END class SparseDataGrid
+
+# the cell returned for unoccupied coordinates, never to be modified
+EMPTY_CELL = ()
@@ -0,0 +1,604 @@
+"""
+Struct-of-arrays flock engine.
+
+Stores every boid's position, magnitude and heading in contiguous NumPy arrays
+and evaluates the visibility, separation, alignment and cohesion rules of
+`boid.Boid` for all candidate pairs at once. Candidates come from the same
+3x3 cell groups used by `DataGrid`.
+
+Unlike the object engine, every boid reads the state of the previous tick,
+so the result does not depend on the order in which boids are visited.
+"""
+
+from collections import namedtuple
+from math import pi
+from sys import float_info
+import numpy as np
+import sim_state
+import config
+
+from boid import Boid
+from profiler import PROFILER, occupancy_histogram
+
+EPSILON = float_info.epsilon
+TWO_PI = 2 * pi
+
+# candidate pairs built and reduced at once, bounding the memory of a tick
+# however clumped the flock, whatever the number of boids in a cell group
+CHUNK_PAIRS = 1 << 17
+
+# constants of the rules, the shape of the grid of cells at least the view
+# distance wide, the periods with which positions wrap around, and how many of
+# the nearest boids in view each boid reacts to (None for all)
+SteeringParams = namedtuple('SteeringParams', (
+    'view_distance', 'view_angle', 'd_theta', 'grid_width', 'grid_height', 'period', 'nearest'))
+
+
+class Flock:
+    '''A whole flock of boids, stored as arrays'''
+    def __init__(self, positions, magnitudes, thetas, world_size=config.WORLD_SIZE,
+                 skin=None, nearest=None, field=None):
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+
+        self._x = np.ascontiguousarray(positions[:, 0])
+        self._y = np.ascontiguousarray(positions[:, 1])
+        self._magnitude = np.clip(
+            np.asarray(magnitudes, dtype=np.float64), 0, Boid.get_max_magnitude())
+        self._theta = normalize_angles(np.asarray(thetas, dtype=np.float64))
+        self._active = np.zeros(len(self._x), dtype=bool)
+
+        self._world_size = world_size
+        self._params = steering_params(world_size, nearest)
+
+        # an optional obstacles.ObstacleField, steering the boids on top of the rules
+        self._field = field
+
+        # optional neighbor lists of radius view distance + skin, reused
+        # until a boid moved more than half the skin
+        self._skin = skin
+        self._pairs = None
+        self._built_x = None
+        self._built_y = None
+        self._rebuild_count = 0
+
+
+    @classmethod
+    def from_boids(cls, boids, world_size=config.WORLD_SIZE, *args):
+        '''Builds a flock from a list of Boid objects'''
+        return cls(
+            [boid.get_pos() for boid in boids],
+            [boid.get_magnitude() for boid in boids],
+            [boid.get_theta() for boid in boids],
+            world_size,
+            *args
+        )
+
+
+    def __len__(self):
+        return len(self._x)
+
+
+    def get_positions(self):
+        '''Returns an (n, 2) array of the boid positions'''
+        return np.column_stack((self._x, self._y))
+
+
+    def get_magnitudes(self):
+        '''Returns the array of boid magnitudes'''
+        return self._magnitude
+
+
+    def get_thetas(self):
+        '''Returns the array of boid headings'''
+        return self._theta
+
+
+    def get_active(self):
+        '''Returns a boolean array, True where the boid saw another boid last tick'''
+        return self._active
+
+
+    def restore_active(self, active):
+        '''Sets whether each boid saw another boid in its last update, e.g. from a checkpoint'''
+        self._active[:] = active
+
+
+    def get_colors(self):
+        '''Returns the color of each boid'''
+        neutral = Boid.get_neutral_color()
+        active = Boid.get_active_color()
+        return [active if is_active else neutral for is_active in self._active]
+
+
+    def get_polys(self):
+        '''Returns an (n, 4, 2) array of the rotated and translated boid polys'''
+        poly = np.asarray(Boid.get_base_poly(), dtype=np.float64)
+        cos_t = np.cos(self._theta)[:, None]
+        sin_t = np.sin(self._theta)[:, None]
+
+        polys = np.empty((len(self._x), len(poly), 2))
+        polys[:, :, 0] = poly[:, 0] * cos_t - poly[:, 1] * sin_t + self._x[:, None]
+        polys[:, :, 1] = poly[:, 0] * sin_t + poly[:, 1] * cos_t + self._y[:, None]
+        return polys
+
+
+    def update(self):
+        '''Update every boid's heading, then position based on active rules'''
+        # read the state, in case it changes during execution.
+        rules = (sim_state.SEPARATION, sim_state.ALIGNMENT, sim_state.COHESION)
+
+        # boids which are not moving do nothing at all
+        moving = self._magnitude != 0
+
+        pairs = None
+        if self._skin is not None and any(rules):
+            with PROFILER.phase('index'):
+                pairs = self._neighbor_pairs()
+
+        # the neighbor scan and the rules are evaluated chunk by chunk, they
+        # are timed together
+        with PROFILER.phase('rules'):
+            d_theta, in_view = self._steer(moving, rules, pairs)
+        self._active = in_view > 0
+
+        if self._field is not None:
+            with PROFILER.phase('obstacles'):
+                d_theta = obstacle_turns(
+                    self._field, self._x, self._y, self._theta, d_theta, self._params.d_theta)
+
+        if PROFILER.is_enabled():
+            self._profile(in_view, pairs)
+
+        with PROFILER.phase('integrate'):
+            self._x, self._y, self._theta = move(
+                self._x, self._y, self._magnitude, self._theta + d_theta, self._world_size)
+
+
+    def get_occupancy(self):
+        '''Returns the number of boids in each cell of the grid, row by row'''
+        cell_x = cell_indices(self._x, self._params.period[0], self._params.grid_width)
+        cell_y = cell_indices(self._y, self._params.period[1], self._params.grid_height)
+        return np.bincount(
+            cell_y * self._params.grid_width + cell_x,
+            minlength=self._params.grid_width * self._params.grid_height)
+
+
+    def get_rebuild_count(self):
+        '''Returns how many times the neighbor lists were built'''
+        return self._rebuild_count
+
+
+    def _steer(self, queries, rules, pairs):
+        # the neighbor pass, see steer. Kept apart for engines which replace it
+        return steer(
+            self._x, self._y, self._magnitude, self._theta, queries, rules, self._params, pairs)
+
+
+    def _profile(self, in_view, pairs):
+        # counters of the tick, see profiler.py
+        occupancy = self.get_occupancy()
+        if pairs is None:
+            candidates = candidate_count(
+                occupancy, self._params.grid_width, self._params.grid_height)
+        else:
+            candidates = sum(len(i) for i, _ in pairs)
+
+        PROFILER.count('candidates', int(candidates))
+        PROFILER.count('visible', int(in_view.sum()))
+        PROFILER.set_histogram('occupancy', occupancy_histogram(occupancy.tolist()))
+
+
+    def _neighbor_pairs(self):
+        # no boid can come within view distance of another without one of
+        # them moving more than half the skin since the lists were built
+        if self._pairs is not None:
+            period = wrap_periods(self._world_size)
+            d_x = wrapped_differences(self._x - self._built_x, period[0])
+            d_y = wrapped_differences(self._y - self._built_y, period[1])
+            if np.max(d_x * d_x + d_y * d_y, initial=0) <= (self._skin / 2) ** 2:
+                return self._pairs
+
+        self._rebuild_count += 1
+        self._built_x = self._x.copy()
+        self._built_y = self._y.copy()
+        self._pairs = neighbor_pairs(
+            self._x, self._y, self._params.view_distance + self._skin, self._world_size)
+        return self._pairs
+# END class Flock
+
+def steering_params(world_size, nearest=None):
+    '''Returns the SteeringParams of Boids in a world of the given size'''
+    view_distance = Boid.get_view_distance()
+    period = wrap_periods(world_size)
+    return SteeringParams(
+        view_distance,
+        Boid.get_view_angle(),
+        Boid.get_d_theta_per_update(),
+        *grid_shape(period, view_distance),
+        period,
+        nearest
+    )
+
+
+def steer(x, y, magnitude, theta, queries, rules, params, pairs=None):
+    '''Returns the clamped change in heading of each boid, and how many boids it sees.
+    Only the boids where queries is True react to the others, the others get 0.
+    The candidate (i, j) index arrays come from the cell groups, unless given'''
+    separation, alignment, cohesion = rules
+    n = len(x)
+    in_view = np.zeros(n)
+    if not (separation or alignment or cohesion):
+        return np.zeros(n), in_view
+
+    avoided = np.zeros(n)
+    d_theta_separation = np.zeros(n)
+    d_theta_alignment = np.zeros(n)
+    center_x = np.zeros(n)
+    center_y = np.zeros(n)
+
+    if pairs is None:
+        cell_x = cell_indices(x, params.period[0], params.grid_width)
+        cell_y = cell_indices(y, params.period[1], params.grid_height)
+        pairs = cell_group_pairs(cell_x, cell_y, params.grid_width, params.grid_height, queries)
+    else:
+        pairs = (
+            (i[start:start + CHUNK_PAIRS], j[start:start + CHUNK_PAIRS])
+            for i, j in ((i[queries[i]], j[queries[i]]) for i, j in pairs)
+            for start in range(0, len(i), CHUNK_PAIRS))
+
+    visible_pairs = (visible_pairs_of(x, y, theta, i, j, params) for i, j in pairs)
+
+    # in topological mode, every boid only reacts to the nearest boids it
+    # sees, which can only be told once all its candidates were seen
+    if params.nearest is not None:
+        visible_pairs = [reduce_nearest_pairs(visible_pairs, params.nearest)]
+
+    for i, j, dx, dy, adjusted_angle, distance in visible_pairs:
+        multiplier = 1 / distance
+
+        in_view += np.bincount(i, minlength=n)
+
+        if separation:
+            weight, avoids = avoid_collision(
+                magnitude[i], theta[i], magnitude[j], theta[j], adjusted_angle, params)
+            d_theta_separation += np.bincount(i, weights=weight * multiplier, minlength=n)
+            avoided += np.bincount(i, weights=avoids, minlength=n)
+
+        if alignment:
+            angle_diff = theta[j] - theta[i]
+            aligns = (np.abs(angle_diff) <= pi / 2) & (np.abs(angle_diff) > EPSILON)
+            d_theta_alignment += \
+                np.bincount(i, weights=angle_diff * multiplier * aligns, minlength=n)
+
+        # cohesion only accumulates the relative center, it is merged below
+        if cohesion:
+            center_x += np.bincount(i, weights=dx * distance, minlength=n)
+            center_y += np.bincount(i, weights=dy * distance, minlength=n)
+    # end cell group loop
+
+    seen = in_view > 0
+    safe_in_view = np.where(seen, in_view, 1)
+
+    final_d_theta = d_theta_alignment / safe_in_view
+
+    # once we've found the relative center, we try to move towards it
+    if cohesion:
+        relative_angle = np.arctan2(center_y, center_x) - theta
+        final_d_theta += relative_angle / safe_in_view / safe_in_view
+
+    # only account for separation if we've actually avoided any
+    final_d_theta += np.where(
+        avoided > 0, d_theta_separation / np.where(avoided > 0, avoided, 1), 0)
+
+    # cannot exceed the max change in theta per update
+    final_d_theta = np.clip(final_d_theta, -params.d_theta, params.d_theta)
+    final_d_theta[~seen] = 0
+
+    return final_d_theta, in_view
+
+
+def obstacle_turns(field, x, y, theta, d_theta, max_d_theta):
+    '''Returns the changes in heading d_theta of the boids, with the turns of
+    an obstacles.ObstacleField added, like ObstacleField.turn, clamped again'''
+    indices = np.frombuffer(field.get_indices(), dtype=np.int64)
+    if len(indices) == 0:
+        return d_theta
+    distance, gradient_x, gradient_y, pull_x, pull_y = (
+        np.frombuffer(values, dtype=np.float32) for values in field.get_samples())
+    columns, rows = field.get_shape()
+    cell_width, cell_height = field.get_cell_size()
+    i = (y // cell_height).astype(np.int64) % rows * columns + \
+        (x // cell_width).astype(np.int64) % columns
+
+    # only the samples near obstacles and attractors are kept, the boids
+    # elsewhere do not turn
+    slot = np.minimum(np.searchsorted(indices, i), len(indices) - 1)
+    near = np.flatnonzero(indices[slot] == i)
+    slot = slot[near]
+    theta = theta[near]
+
+    # the closer to an obstacle, the harder a boid turns away from it
+    distance = distance[slot].astype(np.float64)
+    avoid_distance = field.get_avoid_distance()
+    away = np.arctan2(gradient_y[slot].astype(np.float64), gradient_x[slot].astype(np.float64))
+    turn = np.where(
+        distance < avoid_distance,
+        (1 - distance / avoid_distance) * normalize_angles(away - theta), 0)
+
+    pull_x = pull_x[slot].astype(np.float64)
+    pull_y = pull_y[slot].astype(np.float64)
+    turn += np.where(
+        (pull_x != 0) | (pull_y != 0),
+        np.hypot(pull_x, pull_y) * normalize_angles(np.arctan2(pull_y, pull_x) - theta), 0)
+
+    d_theta = d_theta.copy()
+    d_theta[near] = np.clip(d_theta[near] + turn, -max_d_theta, max_d_theta)
+    return d_theta
+
+
+def visible_pairs_of(x, y, theta, i, j, params):
+    '''Returns the (i, j, dx, dy, adjusted_angle, distance) arrays of the candidate
+    pairs where boid i sees boid j'''
+    # don't check self
+    keep = i != j
+    i, j = i[keep], j[keep]
+
+    # the shortest offsets, wrapping around the world like the boids do
+    dx = wrapped_differences(x[j] - x[i], params.period[0])
+    dy = wrapped_differences(y[j] - y[i], params.period[1])
+    squared_distance = dx * dx + dy * dy
+
+    # if the other is too far from self, we cannot see it. Boids sharing
+    # the exact same position have no direction to one another either.
+    close = (squared_distance <= params.view_distance ** 2) & (squared_distance > 0)
+    i, j = i[close], j[close]
+    dx, dy, squared_distance = dx[close], dy[close], squared_distance[close]
+
+    # determine the other boid's angle relative to self
+    adjusted_angle = normalize_angles(np.arctan2(dy, dx) - theta[i])
+    visible = np.abs(adjusted_angle) < params.view_angle
+    return (i[visible], j[visible], dx[visible], dy[visible], adjusted_angle[visible],
+            np.sqrt(squared_distance[visible]))
+
+
+def reduce_nearest_pairs(visible_pairs, nearest):
+    '''Returns the pairs of each boid i with its given number of nearest boids
+    j, from an iterable of chunks of visible pairs. The pairs kept so far are
+    merged with the chunks as they come, only ever holding about CHUNK_PAIRS
+    more pairs than those kept'''
+    kept = []
+    pending = []
+    pending_count = 0
+    for chunk in visible_pairs:
+        pending.append(chunk)
+        pending_count += len(chunk[0])
+        if pending_count >= CHUNK_PAIRS:
+            kept = [nearest_pairs(kept + pending, nearest)]
+            pending = []
+            pending_count = 0
+    return nearest_pairs(kept + pending, nearest)
+
+
+def nearest_pairs(visible_pairs, nearest):
+    '''Merges chunks of visible pairs, keeping for each boid i only the pairs
+    of the given number of nearest boids j'''
+    if not visible_pairs:
+        empty = np.empty(0)
+        return (empty.astype(np.int64), empty.astype(np.int64)) + (empty,) * 4
+    i, j, dx, dy, adjusted_angle, distance = (
+        np.concatenate(field) for field in zip(*visible_pairs))
+
+    # boids which see no more than enough keep every pair, the others only
+    # those closer than their nearest-th nearest boid
+    counts = np.bincount(i)
+    crowded_boids = np.flatnonzero(counts > nearest)
+    if len(crowded_boids) == 0:
+        return i, j, dx, dy, adjusted_angle, distance
+
+    threshold = np.full(len(counts), np.inf)
+    threshold[crowded_boids] = nearest_distances(i, distance, counts, crowded_boids, nearest)
+    keep = distance < threshold[i]
+
+    # boids at exactly the threshold distance fill the remaining places,
+    # lowest j first, as if sorted by distance then j
+    tied = np.flatnonzero(distance == threshold[i])
+    if len(tied):
+        missing = nearest - np.bincount(i[keep], minlength=len(counts))
+        tied = tied[np.lexsort((j[tied], i[tied]))]
+        keep[tied[ranks_in_groups(i[tied]) < missing[i[tied]]]] = True
+
+    return i[keep], j[keep], dx[keep], dy[keep], adjusted_angle[keep], distance[keep]
+
+
+def nearest_distances(i, distance, counts, boids, nearest):
+    '''Returns the distance of the nearest-th nearest pair of each of the
+    boids, from the pairs (i, distance) and how many pairs each boid i has,
+    by partial selection rather than sorting every pair of each boid'''
+    pairs = np.flatnonzero(np.isin(i, boids))
+    pairs = pairs[np.argsort(i[pairs], kind='stable')]
+    starts = np.cumsum(counts[boids]) - counts[boids]
+
+    # boids with about as many pairs are padded with inf to the same width,
+    # at most twice their count, and selected from as the rows of one matrix
+    widths = np.left_shift(1, np.ceil(np.log2(counts[boids])).astype(np.int64))
+    selected = np.empty(len(boids))
+    for width in np.unique(widths):
+        rows = np.flatnonzero(widths == width)
+        columns = np.arange(width)
+        valid = columns < counts[boids[rows], None]
+        index = np.where(valid, starts[rows, None] + columns, 0)
+        matrix = np.where(valid, distance[pairs[index]], np.inf)
+        selected[rows] = np.partition(matrix, nearest - 1, axis=1)[:, nearest - 1]
+    return selected
+
+
+def ranks_in_groups(group):
+    '''Returns the rank of each element within its run of equal, sorted group values'''
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    return np.arange(len(group)) - np.repeat(starts, np.diff(np.r_[starts, len(group)]))
+
+
+def avoid_collision(magnitude, theta, o_magnitude, o_theta, adjusted_angle, params):
+    '''Returns the signed separation weight of each pair, and whether it was avoided'''
+    o_adjusted_theta = normalize_angles(o_theta - theta)
+    stationary = o_magnitude == 0
+
+    # case 1: boid is directly in front. Either it is stationary, or it
+    # is moving directly away, in which case we only dodge it if too slow
+    in_front = np.abs(adjusted_angle) <= EPSILON
+    same_heading = np.abs(o_adjusted_theta) <= EPSILON
+    front_handled = in_front & (stationary | same_heading)
+    front_dodge = in_front & (stationary | (same_heading & (o_magnitude < magnitude)))
+
+    # otherwise, check if a collision will occur with a moving boid
+    collision_bound = normalize_angles(pi + adjusted_angle)
+    collides = ~front_handled & ~stationary & \
+        (o_adjusted_theta >= np.minimum(collision_bound, 0)) & \
+        (o_adjusted_theta <= np.maximum(collision_bound, 0))
+
+    # veer away from the other boid
+    veer = np.where(adjusted_angle <= 0, 1.0, -1.0)
+    weight = params.d_theta * (front_dodge + veer * collides)
+    return weight, front_dodge | collides
+
+
+def move(x, y, magnitude, theta, world_size):
+    '''Returns the new (x, y, theta) of boids moving along their heading'''
+    x = x + magnitude * np.cos(theta)
+    y = y + magnitude * np.sin(theta)
+
+    # enforce bounding
+    wrap_coordinates(x, world_size[0])
+    wrap_coordinates(y, world_size[1])
+    return x, y, normalize_angles(theta)
+
+
+def neighbor_pairs(x, y, radius, world_size):
+    '''Returns the (i, j) index arrays of every ordered pair of boids within
+    radius of one another, measured the shortest way around the world.
+    The pairs are split in chunks, like those of cell_group_pairs'''
+    period = wrap_periods(world_size)
+    grid_width, grid_height = grid_shape(period, radius)
+    cell_x = cell_indices(x, period[0], grid_width)
+    cell_y = cell_indices(y, period[1], grid_height)
+
+    found = []
+    for i, j in cell_group_pairs(cell_x, cell_y, grid_width, grid_height):
+        d_x = wrapped_differences(x[j] - x[i], period[0])
+        d_y = wrapped_differences(y[j] - y[i], period[1])
+        within = (i != j) & (d_x * d_x + d_y * d_y <= radius * radius)
+        found.append((i[within], j[within]))
+    return found
+
+
+def wrap_periods(world_size):
+    '''Returns the periods with which positions wrap around, see wrap_coordinates'''
+    return (world_size[0] + 1, world_size[1] + 1)
+
+
+def wrapped_differences(differences, period):
+    '''Returns the shortest equivalents of differences of coordinates wrapping with period'''
+    return differences - period * np.round(differences / period)
+
+
+def candidate_count(occupancy, grid_width, grid_height):
+    '''Returns the number of (boid, other) pairs tested through the cell groups,
+    given the number of boids in each cell'''
+    grid = occupancy.reshape(grid_height, grid_width)
+
+    # the same offsets as cell_group_pairs, which are deduplicated on small grids
+    around = np.zeros_like(grid)
+    for d_y in {d % grid_height for d in (-1, 0, 1)}:
+        for d_x in {d % grid_width for d in (-1, 0, 1)}:
+            around += np.roll(grid, (-d_y, -d_x), axis=(0, 1))
+
+    # every boid is tested against all those around it but itself
+    return int((grid * around).sum() - grid.sum())
+
+
+def grid_shape(period, cell_size):
+    '''Returns the (width, height) in cells of a grid tiling a world wrapping
+    with the given periods, with cells at least cell_size wide, so that
+    neighboring cells wrap around correctly'''
+    return (
+        max(int(period[0] // cell_size), 1),
+        max(int(period[1] // cell_size), 1)
+        )
+
+
+def cell_indices(values, period, cells):
+    '''Returns the indices of the cells containing the coordinates, along an
+    axis of period tiled by the given number of cells'''
+    return (values // (period / cells)).astype(np.int64) % cells
+
+
+def cell_group_pairs(cell_x, cell_y, grid_width, grid_height, queries=None):
+    '''Yields (i, j) index arrays pairing every boid i with every boid j in
+    one of the 9 cells of its cell group, one neighboring cell at a time, in
+    chunks of about CHUNK_PAIRS pairs at most, unless a single boid has more
+    candidates. If given, only the boids where queries is True are used as i'''
+    cells = cell_y * grid_width + cell_x
+
+    # sort the boids by cell so each cell's boids are a contiguous run
+    order = np.argsort(cells, kind='stable')
+    if grid_width * grid_height <= len(cells):
+        occupied = None
+        counts = np.bincount(cells, minlength=grid_width * grid_height)
+        starts = np.cumsum(counts) - counts
+    else:
+        # on grids with more cells than boids, e.g. sparse flocks in large
+        # worlds, only the occupied cells are counted, and looked up by search
+        occupied, starts, counts = np.unique(
+            cells[order], return_index=True, return_counts=True)
+
+    if queries is None:
+        boid_indices = np.arange(len(cells))
+    else:
+        boid_indices = np.flatnonzero(queries)
+    query_x, query_y = cell_x[boid_indices], cell_y[boid_indices]
+
+    # on grids smaller than 3 cells across, several offsets reach the same
+    # cell, which must only be visited once
+    for d_y in {d % grid_height for d in (-1, 0, 1)}:
+        for d_x in {d % grid_width for d in (-1, 0, 1)}:
+            neighbor_cells = \
+                ((query_y + d_y) % grid_height) * grid_width + (query_x + d_x) % grid_width
+            if occupied is None:
+                neighbor_starts = starts[neighbor_cells]
+                neighbor_counts = counts[neighbor_cells]
+            else:
+                found = np.minimum(np.searchsorted(occupied, neighbor_cells), len(occupied) - 1)
+                neighbor_starts = starts[found]
+                neighbor_counts = np.where(occupied[found] == neighbor_cells, counts[found], 0)
+            total = neighbor_counts.sum()
+            if total == 0:
+                continue
+
+            # the boids split into runs of about CHUNK_PAIRS candidates
+            if total <= CHUNK_PAIRS:
+                bounds = (0, len(boid_indices))
+            else:
+                bounds = np.unique(np.r_[0, np.searchsorted(
+                    np.cumsum(neighbor_counts), np.arange(CHUNK_PAIRS, total, CHUNK_PAIRS)),
+                    len(boid_indices)])
+            for first, last in zip(bounds[:-1], bounds[1:]):
+                chunk_counts = neighbor_counts[first:last]
+                chunk_total = chunk_counts.sum()
+                if chunk_total == 0:
+                    continue
+                i = np.repeat(boid_indices[first:last], chunk_counts)
+                offsets = np.arange(chunk_total) - np.repeat(
+                    np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+                j = order[np.repeat(neighbor_starts[first:last], chunk_counts) + offsets]
+                yield i, j
+
+
+def normalize_angles(theta):
+    '''Normalizes the provided thetas to the range ]-pi, pi]'''
+    return theta - TWO_PI * np.ceil((theta - pi) / TWO_PI)
+
+
+def wrap_coordinates(values, size):
+    '''Wraps the coordinates outside [0, size] around to the other end, in place'''
+    outside = (values > size) | (values < 0)
+    values[outside] = np.mod(values[outside], size + 1)
@@ -0,0 +1,89 @@
+"""
+Overlays drawn on top of the flock: the rule toggles and the pause screen.
+
+Text is costly to render, so each label is rendered once per state and the
+pause overlay once, then only blitted every frame. The profiling overlay is
+only rendered again when given a new summary.
+"""
+
+import pygame
+import config
+
+# the rule toggles, top to bottom, with their key
+RULE_LABELS = ('[1] SEPARATION', '[2] ALIGNMENT', '[3] COHESION')
+
+
+class Hud:
+    '''Cached surfaces of the config and pause overlays'''
+    def __init__(self, font, screen_size=config.SCREEN_SIZE):
+        self._font = font
+        self._screen_size = screen_size
+
+        # (label, enabled) -> surface, filled as the rules get toggled
+        self._labels = {}
+        self._pause_overlay = None
+        self._profile_lines = []
+
+
+    def draw_config(self, surface, rules):
+        '''Draws the state of each rule, returns the rects drawn to'''
+        rects = []
+        for i, (label, enabled) in enumerate(zip(RULE_LABELS, rules)):
+            rects.append(surface.blit(self._get_label(label, enabled), (5, 5 + 20 * i)))
+        return rects
+
+
+    def draw_paused(self, surface):
+        '''Draws the pause screen, returns the rect drawn to'''
+        if self._pause_overlay is None:
+            self._pause_overlay = self._render_pause_overlay()
+        return surface.blit(self._pause_overlay, (0, 0))
+
+
+    def set_profile(self, summary):
+        '''Renders the lines of the profiling overlay from a profiler summary'''
+        lines = [
+            f"{name:<14}{phase['mean_ms']:>8.2f} ms  max {phase['max_ms']:>7.2f}"
+            for name, phase in summary['phases'].items()
+        ]
+        lines += [f'{name:<14}{value:>8.0f}' for name, value in summary['counters'].items()]
+
+        occupancy = summary['histograms'].get('occupancy')
+        if occupancy:
+            cells = sum(occupancy)
+            lines.append(f'{"cells":<14}{cells:>8}  empty {occupancy[0]}  '
+                         f'fullest {len(occupancy) - 1}')
+
+        self._profile_lines = [
+            self._font.render(line, True, config.FONT_LIGHT_GRAY) for line in lines
+        ]
+
+
+    def draw_profile(self, surface):
+        '''Draws the profiling overlay in the top right corner, returns the rects drawn to'''
+        rects = []
+        for i, line in enumerate(self._profile_lines):
+            rects.append(surface.blit(line, (self._screen_size[0] - 300, 5 + 20 * i)))
+        return rects
+
+
+    def _get_label(self, label, enabled):
+        key = (label, enabled)
+        text = self._labels.get(key)
+        if text is None:
+            color = config.FONT_GREEN if enabled else config.FONT_RED
+            text = self._font.render(label, True, color)
+            self._labels[key] = text
+        return text
+
+
+    def _render_pause_overlay(self):
+        overlay = pygame.Surface(self._screen_size, pygame.SRCALPHA)
+        overlay.fill((*config.FONT_LIGHT_GRAY, 64))
+
+        text_paused = self._font.render('PAUSED', True, config.FONT_LIGHT_GRAY)
+        text_rect_paused = text_paused.get_rect(
+            center=(self._screen_size[0] / 2, self._screen_size[1] / 2))
+        overlay.blit(text_paused, text_rect_paused)
+        return overlay
+# END class Hud
@@ -0,0 +1,303 @@
+"""
+Compiled flock engine.
+
+`JitFlock` follows the rules of `flock.Flock`, with the same results, but
+runs the whole neighbor pass (visibility, separation, alignment and cohesion)
+in one kernel compiled by Numba. The boids are sorted by grid cell, like the
+cells of `DataGrid` laid out end to end, and visited cell by cell in parallel
+across the cores, each boid scanning its 3x3 cell group straight from the
+sorted arrays. No arrays of candidate pairs are built, so memory stays flat
+however crowded the cells get. An obstacle field only takes one lookup per
+boid, it is left to the array code of `Flock`.
+
+Numba is optional. Without it, `JitFlock` falls back to the array code of
+`Flock`, see JIT_AVAILABLE. The kernel is cached on disk next to this module,
+so only the first launch pays for compiling it.
+"""
+
+from math import atan2, ceil, pi, sqrt
+import numpy as np
+
+from flock import Flock, EPSILON, TWO_PI, cell_indices
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# whether the kernel is compiled, or JitFlock falls back to the array code
+JIT_AVAILABLE = numba is not None
+
+prange = numba.prange if JIT_AVAILABLE else range
+
+
+def compiled(parallel=False):
+    '''Decorates a function to be compiled by Numba and cached on disk, or
+    left as is without Numba'''
+    if not JIT_AVAILABLE:
+        return lambda function: function
+    return numba.njit(cache=True, parallel=parallel)
+
+
+class JitFlock(Flock):
+    '''A whole flock of boids, stored as arrays, steered by a compiled kernel'''
+    def _steer(self, queries, rules, pairs):
+        if not JIT_AVAILABLE:
+            return super()._steer(queries, rules, pairs)
+
+        n = len(self._x)
+        if not any(rules):
+            return np.zeros(n), np.zeros(n)
+
+        # sort the boids by cell so each cell's boids are a contiguous run.
+        # Only the occupied cells are counted, the grid is never scanned
+        params = self._params
+        cell_x = cell_indices(self._x, params.period[0], params.grid_width)
+        cell_y = cell_indices(self._y, params.period[1], params.grid_height)
+        cells = cell_y * params.grid_width + cell_x
+        order = np.argsort(cells, kind='stable')
+        occupied, starts, counts = np.unique(cells[order], return_index=True, return_counts=True)
+
+        separation, alignment, cohesion = rules
+        return steer_cells(
+            self._x, self._y, self._magnitude, self._theta, queries, order, occupied, starts,
+            counts, cell_x, cell_y, params.grid_width, params.grid_height,
+            float(params.period[0]), float(params.period[1]), float(params.view_distance),
+            float(params.view_angle), float(params.d_theta), params.nearest or 0,
+            separation, alignment, cohesion)
+# END class JitFlock
+
+def load_kernel():
+    '''Compiles the kernel, or loads it from the disk cache, ahead of the first tick'''
+    flock = JitFlock([(0, 0), (1, 1)], [1, 1], [0, 0], (10, 10))
+    flock._steer(np.ones(2, dtype=bool), (True, True, True), None)
+
+
+@compiled(parallel=True)
+def steer_cells(x, y, magnitude, theta, queries, order, occupied, starts, counts, cell_x,
+                cell_y, grid_width, grid_height, period_x, period_y, view_distance, view_angle,
+                d_theta, nearest, separation, alignment, cohesion):
+    '''Returns the clamped change in heading of each boid, and how many boids
+    it sees, like flock.steer. The boids are visited in the order given,
+    sorted by cell, with starts and counts locating the boids of each of the
+    occupied cells in it, see cell_run. nearest 0 reacts to every boid in view'''
+    n = len(x)
+    final_d_theta = np.zeros(n)
+    in_view = np.zeros(n)
+
+    for k in prange(n):
+        i = order[k]
+        if queries[i]:
+            final_d_theta[i], in_view[i] = steer_boid(
+                i, x, y, magnitude, theta, order, occupied, starts, counts, cell_x, cell_y,
+                grid_width, grid_height, period_x, period_y, view_distance, view_angle,
+                d_theta, nearest, separation, alignment, cohesion)
+
+    return final_d_theta, in_view
+
+
+@compiled()
+def steer_boid(i, x, y, magnitude, theta, order, occupied, starts, counts, cell_x, cell_y,
+               grid_width, grid_height, period_x, period_y, view_distance, view_angle,
+               d_theta, nearest, separation, alignment, cohesion):
+    '''Returns the clamped change in heading of boid i, and how many boids it sees'''
+    squared_view_distance = view_distance * view_distance
+
+    # the cells around are searched from the boid's own, which is close to
+    # them in the sorted order
+    near = np.searchsorted(occupied, cell_y[i] * grid_width + cell_x[i])
+
+    # in topological mode, every boid in view is kept until the nearest are known
+    capacity = 0
+    if nearest > 0:
+        for d_y in range(-1, 2):
+            if (d_y == 1 and grid_height <= 2) or (d_y == -1 and grid_height == 1):
+                continue
+            for d_x in range(-1, 2):
+                if (d_x == 1 and grid_width <= 2) or (d_x == -1 and grid_width == 1):
+                    continue
+                capacity += cell_run(
+                    occupied, starts, counts, near,
+                    ((cell_y[i] + d_y) % grid_height) * grid_width + (cell_x[i] + d_x) % grid_width
+                )[1]
+    kept_j = np.empty(capacity, dtype=np.int64)
+    kept = np.empty((capacity, 4))
+    kept_count = 0
+
+    seen = 0
+    avoided = 0.0
+    d_theta_separation = 0.0
+    d_theta_alignment = 0.0
+    center_x = 0.0
+    center_y = 0.0
+
+    # on grids smaller than 3 cells across, several offsets reach the same
+    # cell, which must only be visited once
+    for d_y in range(-1, 2):
+        if (d_y == 1 and grid_height <= 2) or (d_y == -1 and grid_height == 1):
+            continue
+        for d_x in range(-1, 2):
+            if (d_x == 1 and grid_width <= 2) or (d_x == -1 and grid_width == 1):
+                continue
+
+            start, count = cell_run(
+                occupied, starts, counts, near,
+                ((cell_y[i] + d_y) % grid_height) * grid_width + (cell_x[i] + d_x) % grid_width)
+            for slot in range(start, start + count):
+                j = order[slot]
+                # don't check self
+                if j == i:
+                    continue
+
+                # the shortest offset, wrapping around the world like the boids do
+                dx = x[j] - x[i]
+                dx -= period_x * round(dx / period_x)
+                dy = y[j] - y[i]
+                dy -= period_y * round(dy / period_y)
+
+                # if the other is too far from self, we cannot see it. Boids
+                # sharing the exact same position have no direction to one another
+                squared_distance = dx * dx + dy * dy
+                if squared_distance > squared_view_distance or squared_distance == 0:
+                    continue
+
+                adjusted_angle = normalize_angle(atan2(dy, dx) - theta[i])
+                if abs(adjusted_angle) >= view_angle:
+                    continue
+                distance = sqrt(squared_distance)
+
+                if nearest > 0:
+                    kept_j[kept_count] = j
+                    kept[kept_count, 0] = distance
+                    kept[kept_count, 1] = dx
+                    kept[kept_count, 2] = dy
+                    kept[kept_count, 3] = adjusted_angle
+                    kept_count += 1
+                    continue
+
+                seen += 1
+                weight, avoids, alignment_weight = react(
+                    magnitude[i], theta[i], magnitude[j], theta[j], adjusted_angle, distance,
+                    d_theta, separation, alignment)
+                d_theta_separation += weight
+                avoided += avoids
+                d_theta_alignment += alignment_weight
+                if cohesion:
+                    center_x += dx * distance
+                    center_y += dy * distance
+
+    # only react to the nearest boids in view, by distance then index like
+    # flock.nearest_pairs, selected in place as there are only a few
+    if nearest > 0:
+        reacted = min(kept_count, nearest)
+        for rank in range(reacted):
+            best = rank
+            for other in range(rank + 1, kept_count):
+                if kept[other, 0] < kept[best, 0] or \
+                        (kept[other, 0] == kept[best, 0] and kept_j[other] < kept_j[best]):
+                    best = other
+            if best != rank:
+                kept_j[rank], kept_j[best] = kept_j[best], kept_j[rank]
+                for field in range(4):
+                    kept[rank, field], kept[best, field] = kept[best, field], kept[rank, field]
+
+            j = kept_j[rank]
+            distance = kept[rank, 0]
+            seen += 1
+            weight, avoids, alignment_weight = react(
+                magnitude[i], theta[i], magnitude[j], theta[j], kept[rank, 3], distance,
+                d_theta, separation, alignment)
+            d_theta_separation += weight
+            avoided += avoids
+            d_theta_alignment += alignment_weight
+            if cohesion:
+                center_x += kept[rank, 1] * distance
+                center_y += kept[rank, 2] * distance
+
+    if seen == 0:
+        return 0.0, 0.0
+
+    final_d_theta = d_theta_alignment / seen
+
+    # once we've found the relative center, we try to move towards it
+    if cohesion:
+        final_d_theta += (atan2(center_y, center_x) - theta[i]) / seen / seen
+
+    # only account for separation if we've actually avoided any
+    if avoided > 0:
+        final_d_theta += d_theta_separation / avoided
+
+    # cannot exceed the max change in theta per update
+    return min(max(final_d_theta, -d_theta), d_theta), float(seen)
+
+
+@compiled()
+def cell_run(occupied, starts, counts, near, cell):
+    '''Returns the (start, count) of the boids of a cell in the sorted order,
+    found among the occupied cells by searching outwards from the index near,
+    the faster the closer. Empty cells hold no boids'''
+    # the step doubles until the cell is bracketed, which is then searched
+    size = len(occupied)
+    step = 1
+    if occupied[near] < cell:
+        low = near + 1
+        high = min(near + step, size)
+        while high < size and occupied[high] < cell:
+            low = high + 1
+            step *= 2
+            high = min(near + step, size)
+    else:
+        high = near
+        low = max(near - step, 0)
+        while low > 0 and occupied[low] >= cell:
+            high = low
+            step *= 2
+            low = max(near - step, 0)
+    found = low + np.searchsorted(occupied[low:high], cell)
+
+    if found < size and occupied[found] == cell:
+        return starts[found], counts[found]
+    return 0, 0
+
+
+@compiled()
+def react(magnitude, theta, o_magnitude, o_theta, adjusted_angle, distance, d_theta,
+          separation, alignment):
+    '''Returns the separation weight, whether the other was avoided, and the
+    alignment weight of a boid seeing another, like flock.avoid_collision'''
+    multiplier = 1 / distance
+    weight = 0.0
+    avoids = 0.0
+    if separation:
+        o_adjusted_theta = normalize_angle(o_theta - theta)
+        stationary = o_magnitude == 0
+
+        # case 1: boid is directly in front. Either it is stationary, or it
+        # is moving directly away, in which case we only dodge it if too slow
+        in_front = abs(adjusted_angle) <= EPSILON
+        same_heading = abs(o_adjusted_theta) <= EPSILON
+        if in_front and (stationary or same_heading):
+            if stationary or o_magnitude < magnitude:
+                weight = d_theta * multiplier
+                avoids = 1.0
+        elif not stationary:
+            # otherwise, check if a collision will occur with a moving boid
+            collision_bound = normalize_angle(pi + adjusted_angle)
+            if min(collision_bound, 0.0) <= o_adjusted_theta <= max(collision_bound, 0.0):
+                # veer away from the other boid
+                weight = (d_theta if adjusted_angle <= 0 else -d_theta) * multiplier
+                avoids = 1.0
+
+    alignment_weight = 0.0
+    if alignment:
+        angle_diff = o_theta - theta
+        if EPSILON < abs(angle_diff) <= pi / 2:
+            alignment_weight = angle_diff * multiplier
+
+    return weight, avoids, alignment_weight
+
+
+@compiled()
+def normalize_angle(theta):
+    '''Normalizes the provided theta to the range ]-pi, pi], like flock.normalize_angles'''
+    return theta - TWO_PI * ceil((theta - pi) / TWO_PI)
@@ -1,132 +1,142 @@
+import argparse
 import time
+from math import hypot
 import pygame
-from math import pi
 from pygame.locals import *
-from random import random, randint
 from config import *
 import sim_state
 
-from boid import Boid
-from data_grid import DataGrid
+import checkpoint
+from simulation import Simulation, ENGINES
+from obstacles import Circle, load_field
+from camera import Camera
+from sprites import SpriteCache
+from hud import Hud
+from scheduler import SimulationThread, interpolate, interpolation_factor
+from recording import Replay, TrajectoryReader, TrajectoryRecorder
+from stream import StreamServer
+from profiler import PROFILER
 
 # defaults/constants
 UPS = 60  # updates per second
 FPS = 60  # frames per second
-M_BOID_0 = 'boid_0'
-
-# setup
-pygame.init()
-SCREEN = pygame.display.set_mode(SCREEN_SIZE)
-FONT = pygame.font.Font(None, 24)
-
-pygame.display.set_caption('Boids Simulation')
-SCREEN.fill(BG_COLOR)
-
-BOID_VIEW_DISTANCE = Boid.get_view_distance()
-BOID_MAX_MAGNITUDE = Boid.get_max_magnitude()
-
-GRID_WIDTH = SCREEN_WIDTH // BOID_VIEW_DISTANCE
-if SCREEN_WIDTH % BOID_VIEW_DISTANCE != 0:
-    GRID_WIDTH += 1
-
-GRID_HEIGHT = SCREEN_HEIGHT // BOID_VIEW_DISTANCE
-if SCREEN_HEIGHT % BOID_VIEW_DISTANCE != 0:
-    GRID_HEIGHT += 1
-
-
-def get_grid_coords(boid):
-    pos = boid.get_pos()
-    return [
-        int((pos[1] // BOID_VIEW_DISTANCE) % GRID_HEIGHT),
-        int((pos[0] // BOID_VIEW_DISTANCE) % GRID_WIDTH)
-        ]
-
-
-def generate_rand_boid():
-    pos = [randint(0, SCREEN_SIZE[0]), randint(0, SCREEN_SIZE[1])]
-    magnitude = BOID_MAX_MAGNITUDE
-    theta = 2 * random() * pi
-
-    return Boid(pos, magnitude, theta)
-
-
-def update():
-    # initialize the grid to improve updates
-    grid = DataGrid(GRID_WIDTH, GRID_HEIGHT, True)
-    for boid in BOIDS:
-        grid.push_data(boid, get_grid_coords(boid))
-
-    # instead of iterating over the boids and always fetching its cell
-    # and surrounding cells, fetch each cell only once, and iterate
-    # over the boids in each cell
-    for i in range(GRID_HEIGHT):
-        for j in range(GRID_WIDTH):
-            # fetch the cell, and the cell-group
-            cell = grid.get_cell([i, j])
-            cell_group = grid.get_cell_group([i, j])
-
-            # now iterate over the boids in this cell
-            for boid in cell:
-                boid.update(cell_group)
-
-
-def draw_boid(boid):
-    '''Draw a boid to the screen'''
-    pygame.draw.polygon(SCREEN, boid.get_color(), boid.get_poly())
-
-
-def render_paused():
-    '''Renders the pause screen'''
-    pause_surface = pygame.Surface(SCREEN_SIZE, pygame.SRCALPHA)
-    pause_surface.fill((*FONT_LIGHT_GRAY, 64))
-
-    text_paused = FONT.render('PAUSED', True, FONT_LIGHT_GRAY)
-    text_rect_paused = text_paused.get_rect(center=(SCREEN_WIDTH/2, SCREEN_HEIGHT/2))
-
-    SCREEN.blit(pause_surface, (0, 0))
-    SCREEN.blit(text_paused, text_rect_paused)
-
-
-def render_config():
-    text_separation = \
-        FONT.render('[1] SEPARATION', True, FONT_GREEN if sim_state.SEPARATION else FONT_RED)
-    text_rect_separation = text_separation.get_rect()
-    text_rect_separation.x = 5
-    text_rect_separation.y = 5
-
-    text_alignment = \
-        FONT.render('[2] ALIGNMENT', True, FONT_GREEN if sim_state.ALIGNMENT else FONT_RED)
-    text_rect_alignment = text_alignment.get_rect()
-    text_rect_alignment.x = 5
-    text_rect_alignment.y = 25
-
-    text_cohesion = \
-        FONT.render('[3] COHESION', True, FONT_GREEN if sim_state.COHESION else FONT_RED)
-    text_rect_cohesion = text_cohesion.get_rect()
-    text_rect_cohesion.x = 5
-    text_rect_cohesion.y = 45
-
-    SCREEN.blit(text_separation, text_rect_separation)
-    SCREEN.blit(text_alignment, text_rect_alignment)
-    SCREEN.blit(text_cohesion, text_rect_cohesion)
-
-
-def render():
-    # clear the screen
-    SCREEN.fill(BG_COLOR)
+SEEK_SECONDS = 5  # seconds of a replay skipped per second an arrow key is held
+PROFILE_REFRESH = 0.5  # seconds between refreshes of the profiling overlay
+PROFILE_EXPORT = 5  # seconds between exports of the profile, see --profile
+PAN_SPEED = 600  # pixels on screen the view pans per second a w/a/s/d key is held
+ZOOM_STEP = 1.25  # factor the view zooms in or out by per press of = or -
+ATTRACTOR_MARK = 6  # radius in pixels of the rings marking attractors
+
+# setup, done in main() so the module can be imported without a display
+SCREEN = None
+FONT = None
+SIM = None
+SPRITES = None
+CAMERA = None
+FIELD = None
+HUD = None
+PROFILE_PATH = None
+
+# what was drawn last frame, so that only what changed is pushed to the
+# display when DIRTY_RECTS is set
+PREV_RECTS = []
+PREV_HUD_STATE = None
+LAST_PROFILE_REFRESH = 0
+
+
+def render(previous, current, alpha):
+    '''Renders the flock a fraction alpha of the way between two snapshots'''
+    global PREV_RECTS, PREV_HUD_STATE, LAST_PROFILE_REFRESH
+
+    # any change to the overlays redraws the whole window
+    hud_state = (
+        sim_state.PAUSED, sim_state.SHOW_CONFIG, sim_state.SHOW_PROFILE, Simulation.get_rules(),
+        CAMERA.get_state())
+    full = not DIRTY_RECTS or hud_state != PREV_HUD_STATE
+
+    # nothing moves while paused, what is on screen is still up to date,
+    # unless the profile needs refreshing. The translucent pause overlay
+    # cannot be drawn over itself, that takes the whole window
+    if not full and sim_state.PAUSED:
+        if not sim_state.SHOW_PROFILE:
+            return
+        full = True
+
+    start = time.perf_counter()
+
+    # clear the screen, or only where something was drawn last frame
+    with PROFILER.phase('render_clear'):
+        if full:
+            SCREEN.fill(BG_COLOR)
+        else:
+            for rect in PREV_RECTS:
+                SCREEN.fill(BG_COLOR, rect)
+
+    # obstacles are drawn every frame, the boids cleared over them are redrawn
+    if FIELD is not None:
+        with PROFILER.phase('render_obstacles'):
+            draw_obstacles()
 
     # render the boids
-    for boid in BOIDS:
-        draw_boid(boid)
+    with PROFILER.phase('render_boids'):
+        positions, thetas = interpolate(previous, current, alpha, WORLD_SIZE)
+        positions, thetas, active = CAMERA.view(
+            positions, thetas, current.active, SPRITES.get_radius())
+        rects = SPRITES.draw(SCREEN, positions, thetas, active, doreturn=DIRTY_RECTS) or []
+
+    with PROFILER.phase('render_hud'):
+        if sim_state.PAUSED:
+            HUD.draw_paused(SCREEN)
+
+        if sim_state.SHOW_CONFIG:
+            rects += HUD.draw_config(SCREEN, Simulation.get_rules())
+
+        if sim_state.SHOW_PROFILE:
+            # the numbers would be unreadable if they changed every frame
+            now = time.perf_counter()
+            if now - LAST_PROFILE_REFRESH > PROFILE_REFRESH:
+                HUD.set_profile(PROFILER.get_summary())
+                LAST_PROFILE_REFRESH = now
+            rects += HUD.draw_profile(SCREEN)
 
-    if sim_state.PAUSED:
-        render_paused()
+    #re-render
+    with PROFILER.phase('render_display'):
+        if full:
+            pygame.display.update()
+        else:
+            pygame.display.update(PREV_RECTS + rects)
+
+    if PROFILER.is_enabled():
+        PROFILER.record('render', time.perf_counter() - start)
+
+    PREV_RECTS = rects
+    PREV_HUD_STATE = hud_state
+
+
+def draw_obstacles():
+    '''Draws the obstacles and attractors of the field, under the boids'''
+    zoom = CAMERA.get_zoom()
+    for obstacle in FIELD.get_obstacles():
+        if isinstance(obstacle, Circle):
+            radius = obstacle.radius * zoom
+            center = CAMERA.to_screen(obstacle.x, obstacle.y, radius)
+            pygame.draw.circle(SCREEN, OBSTACLE_COLOR, center, radius)
+            continue
 
-    if sim_state.SHOW_CONFIG:
-        render_config()
+        # polygons are placed by their center, like the circles
+        points = obstacle.points
+        center_x = sum(x for x, _ in points) / len(points)
+        center_y = sum(y for _, y in points) / len(points)
+        radius = max(hypot(x - center_x, y - center_y) for x, y in points) * zoom
+        screen_x, screen_y = CAMERA.to_screen(center_x, center_y, radius)
+        pygame.draw.polygon(SCREEN, OBSTACLE_COLOR, [
+            (screen_x + (x - center_x) * zoom, screen_y + (y - center_y) * zoom)
+            for x, y in points
+        ])
 
-    #re-render
-    pygame.display.update()
+    for attractor in FIELD.get_attractors():
+        center = CAMERA.to_screen(attractor.x, attractor.y, ATTRACTOR_MARK)
+        pygame.draw.circle(SCREEN, ATTRACTOR_COLOR, center, ATTRACTOR_MARK, 2)
 
 
 def reset_key_state(key_state, *exceptions):
@@ -142,7 +152,10 @@ def process_events(key_state):
     _2_released = False
     _3_released = False
     _c_released = False
+    _f_released = False
     _p_released = False
+    _zoom_in_released = False
+    _zoom_out_released = False
 
     # check for events
     pygame.event.pump()
@@ -183,7 +196,41 @@ def process_events(key_state):
     elif key_state['c']:
         _c_released = True
 
+    # toggle the profiling overlay
+    if keys[K_f]:
+        key_state['f'] = True
+    elif key_state['f']:
+        _f_released = True
+
+    # zoom the view in or out
+    if keys[K_EQUALS]:
+        key_state['='] = True
+    elif key_state['=']:
+        _zoom_in_released = True
+
+    if keys[K_MINUS]:
+        key_state['-'] = True
+    elif key_state['-']:
+        _zoom_out_released = True
+
+    # pan the view while held, even while paused
+    pan = PAN_SPEED / FPS
+    CAMERA.pan((keys[K_d] - keys[K_a]) * pan, (keys[K_s] - keys[K_w]) * pan)
+
     # now that we know which keys have been released, we can act on them
+    if _zoom_in_released:
+        CAMERA.zoom(ZOOM_STEP)
+        key_state['='] = False
+
+    if _zoom_out_released:
+        CAMERA.zoom(1 / ZOOM_STEP)
+        key_state['-'] = False
+
+    if _f_released:
+        sim_state.SHOW_PROFILE = not sim_state.SHOW_PROFILE
+        PROFILER.set_enabled(sim_state.SHOW_PROFILE or PROFILE_PATH is not None)
+        key_state['f'] = False
+
     if _c_released:
         sim_state.SHOW_CONFIG = not sim_state.SHOW_CONFIG
         key_state['c'] = False
@@ -195,7 +242,7 @@ def process_events(key_state):
     # if in paused state, return 1 to signal continue
     if sim_state.PAUSED:
         # reset the key state for boid controls to avoid weird behaior
-        reset_key_state(key_state, 'p', 'c')
+        reset_key_state(key_state, 'p', 'c', 'f', '=', '-')
         return 1
 
     # process all events normally, return 0 to signal normal flow
@@ -214,63 +261,212 @@ def process_events(key_state):
     return 0
 
 
-def main_loop():
-    prev_update_time = prev_render_time = time.time()
+def main_loop(recorders=()):
+    # the simulation steps on its own thread, this one only handles events
+    # and renders the snapshots it publishes
+    sim_thread = SimulationThread(SIM, UPS, paused=lambda: sim_state.PAUSED, recorders=recorders)
+    sim_thread.start()
 
-    render()
-
-    delta_update_threshold = 1 / UPS
-    delta_render_threshold = 1 / FPS
+    frame_time = 1 / FPS
 
     keys_state = {
         '1': False,
         '2': False,
         '3': False,
         'c': False,
+        'f': False,
         'p': False,
+        '=': False,
+        '-': False,
     }
 
-    exit_loop = False
-    while not exit_loop:
-        curr_time = time.time()
+    next_frame = time.perf_counter()
+    next_export = next_frame + PROFILE_EXPORT
+    try:
+        while True:
+            game_status = process_events(keys_state)
 
-        # get the time elapsed since the last update and last render
-        delta_update = curr_time - prev_update_time
-        delta_render = curr_time - prev_render_time
+            if game_status == -1:
+                break
 
-        game_status = process_events(keys_state)
+            #render state
+            previous, current = sim_thread.get_snapshots()
+            render(previous, current, interpolation_factor(previous, current, time.perf_counter()))
+
+            if PROFILE_PATH is not None and time.perf_counter() >= next_export:
+                PROFILER.export(PROFILE_PATH, current.tick)
+                next_export += PROFILE_EXPORT
+
+            # sleep until the next frame is due, rather than polling the time
+            next_frame += frame_time
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # running late, don't try to catch up on frames
+                next_frame = time.perf_counter()
+    finally:
+        sim_thread.stop()
+    # end of main_loop()
 
-        if game_status == -1:
-            break
 
-        if game_status == 0:
-            # update and process event if it's time
-            if delta_update > delta_update_threshold:
-                # update state
-                update()
+def process_replay_keys(key_state, replay):
+    '''Seeks with the left and right arrows, changes the speed with up and down'''
+    keys = pygame.key.get_pressed()
 
-                # update the prev time
-                prev_update_time = time.time()
+    # seek while held
+    if keys[K_LEFT]:
+        replay.seek(replay.get_position() - SEEK_SECONDS * UPS / FPS)
+    if keys[K_RIGHT]:
+        replay.seek(replay.get_position() + SEEK_SECONDS * UPS / FPS)
 
-        # render if it's time
-        if delta_render > delta_render_threshold:
-            #render state
-            render()
+    # double or halve the speed on release
+    if keys[K_UP]:
+        key_state['up'] = True
+    elif key_state['up']:
+        replay.set_speed(replay.get_speed() * 2)
+        key_state['up'] = False
 
-            # update the prev time
-            prev_render_time = time.time()
-    # end of main_loop()
+    if keys[K_DOWN]:
+        key_state['down'] = True
+    elif key_state['down']:
+        replay.set_speed(replay.get_speed() / 2)
+        key_state['down'] = False
 
 
-print('Starting . . . ')
+def replay_loop(replay):
+    frame_time = 1 / FPS
 
-BOIDS = [generate_rand_boid() for i in range(BOID_COUNT)]
-# BOIDS = [Boid((100, 400), BOID_MAX_MAGNITUDE/4, -pi/4), Boid((100, 100), BOID_MAX_MAGNITUDE/4, pi/4)]
+    keys_state = {
+        '1': False,
+        '2': False,
+        '3': False,
+        'c': False,
+        'f': False,
+        'p': False,
+        '=': False,
+        '-': False,
+        'up': False,
+        'down': False,
+    }
 
-main_loop()
+    next_frame = time.perf_counter()
+    while True:
+        game_status = process_events(keys_state)
 
-# clean up
-pygame.display.quit()
-pygame.quit()
+        if game_status == -1:
+            break
+
+        process_replay_keys(keys_state, replay)
+        if game_status == 0:
+            replay.advance(frame_time)
+
+        #render state
+        render(*replay.get_snapshots())
+
+        # sleep until the next frame is due, rather than polling the time
+        next_frame += frame_time
+        delay = next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            # running late, don't try to catch up on frames
+            next_frame = time.perf_counter()
+    # end of replay_loop()
+
+
+def parse_args(args=None):
+    '''Parses the command line arguments of the interactive window'''
+    parser = argparse.ArgumentParser(description='Run the boid simulation in a window.')
+    parser.add_argument('--restore', metavar='PATH',
+                        help='resume the simulation saved in this checkpoint')
+    parser.add_argument('--checkpoint', metavar='PATH',
+                        help='save the simulation to this checkpoint on exit')
+    parser.add_argument('--record', metavar='PATH',
+                        help='record every tick of the simulation to this file')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='profile the simulation and rendering, appending a summary to '
+                             'this .csv or JSON lines file every few seconds')
+    parser.add_argument('--stream', action='store_true',
+                        help='stream every tick of the simulation to subscribers, e.g. '
+                             f'stream_client.py, on port {STREAM_PORT}')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='play back a recording instead of simulating')
+    parser.add_argument('--obstacles', metavar='PATH',
+                        help='steer around the obstacles and towards the attractors of this '
+                             'JSON file, or only draw them over a replay')
+    parser.add_argument('--seed', type=int,
+                        help='spawn the same flock on every run with this seed')
+    parser.add_argument('--engine', choices=ENGINES, default=ENGINE,
+                        help='engine used to update the flock')
+    parser.add_argument('--workers', type=int, default=WORKER_COUNT,
+                        help='worker processes of the parallel engine (default: one per core)')
+    return parser.parse_args(args)
+
+
+def main(args):
+    global SCREEN, FONT, SIM, WORLD_SIZE, SPRITES, CAMERA, FIELD, HUD, PROFILE_PATH
+
+    pygame.init()
+    SCREEN = pygame.display.set_mode(SCREEN_SIZE)
+    FONT = pygame.font.Font(None, 24)
+    SPRITES = SpriteCache()
+    HUD = Hud(FONT)
+
+    pygame.display.set_caption('Boids Simulation')
+    SCREEN.fill(BG_COLOR)
 
-print('Done!')
+    print('Starting . . . ')
+
+    PROFILE_PATH = args.profile
+    PROFILER.set_enabled(PROFILE_PATH is not None)
+
+    if args.replay:
+        reader = TrajectoryReader(args.replay)
+        if reader.get_tick_count() == 0:
+            raise SystemExit(f'{args.replay} holds no ticks')
+
+        WORLD_SIZE = reader.get_world_size()
+        CAMERA = Camera(WORLD_SIZE)
+        if args.obstacles:
+            FIELD = load_field(args.obstacles, WORLD_SIZE)
+        try:
+            replay_loop(Replay(reader, UPS))
+        finally:
+            reader.close()
+    else:
+        if args.restore:
+            SIM = checkpoint.load(args.restore, args.workers)
+        else:
+            SIM = Simulation(BOID_COUNT, args.engine, world_size=WORLD_SIZE, seed=args.seed,
+                             workers=args.workers, obstacles=args.obstacles)
+        # SIM = Simulation(boids=[Boid((100, 400), 2, -pi/4), Boid((100, 100), 2, pi/4)])
+        WORLD_SIZE = SIM.get_world_size()
+        CAMERA = Camera(WORLD_SIZE)
+        FIELD = SIM.get_obstacle_field()
+
+        recorders = []
+        if args.record:
+            recorders.append(TrajectoryRecorder(
+                args.record, SIM.get_boid_count(), WORLD_SIZE, SIM.get_tick()))
+        if args.stream:
+            recorders.append(StreamServer(SIM.get_boid_count(), WORLD_SIZE, SIM.get_tick()))
+
+        try:
+            main_loop(recorders)
+        finally:
+            # clean up, keeping what was recorded even when interrupted
+            if args.checkpoint:
+                checkpoint.save(SIM, args.checkpoint)
+            SIM.close()
+            for recorder in recorders:
+                recorder.close()
+
+    pygame.display.quit()
+    pygame.quit()
+
+    print('Done!')
+
+
+if __name__ == '__main__':
+    main(parse_args())
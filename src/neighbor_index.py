@@ -0,0 +1,441 @@
+"""
+Neighbor indexes of the object engine.
+
+A neighbor index finds the boids which may be within view distance of one
+another. Every index answers the same questions:
+ - neighborhoods(): for each boid, the groups of boids it may see
+ - candidate_pairs(): each pair of boids which may see one another, once
+and is refreshed once all boids moved at the end of a tick.
+
+`GridIndex` is the uniform grid of cells the size of the view distance.
+`SparseGridIndex` is the same grid, only storing its occupied cells, for
+worlds much larger than their flocks.
+`QuadtreeIndex` rebuilds a quadtree every tick and answers radius queries,
+which keeps the candidates close to the view circle when flocks clump into
+a few overloaded cells.
+`VerletIndex` keeps per-boid neighbor lists with a skin around the view
+distance, and only rebuilds them once boids moved far enough.
+
+Like the grid, the quadtree and neighbor lists are exact in synchronous mode.
+In sequential mode, boids which already moved this tick are found where
+they were at the start of the tick.
+"""
+
+import config
+
+from boid import Boid
+from data_grid import DataGrid, SparseDataGrid
+
+# leaves of the quadtree are split once they hold more boids than this,
+# up to a maximum depth in case many boids share the same position
+QUADTREE_LEAF_SIZE = 16
+QUADTREE_MAX_DEPTH = 16
+
+
+class NeighborIndex:
+    '''Finds the boids which may see one another'''
+    def __init__(self, boids, world_size=config.WORLD_SIZE):
+        self._boids = boids
+        self._world_size = world_size
+        self._view_distance = Boid.get_view_distance()
+
+
+    def refresh(self):
+        '''Updates the index once the boids have moved'''
+        raise NotImplementedError
+
+
+    def neighborhoods(self):
+        '''Yields (boid, groups) for every boid, where groups is a list of
+        lists of the boids it may see, including itself'''
+        raise NotImplementedError
+
+
+    def candidate_pairs(self):
+        '''Yields (boid, others) such that every pair of boids which may see
+        one another is made of a boid and one of its others exactly once'''
+        raise NotImplementedError
+
+
+    def get_occupancy(self):
+        '''Returns the number of boids in each cell, or None if the index has no cells'''
+        return None
+# END class NeighborIndex
+
+class GridIndex(NeighborIndex):
+    '''Uniform grid of cells at least the view distance wide'''
+    _grid_class = DataGrid
+
+    def __init__(self, boids, world_size=config.WORLD_SIZE):
+        super().__init__(boids, world_size)
+
+        # positions wrap around with this period, see Boid._enforce_bounds
+        period = (world_size[0] + 1, world_size[1] + 1)
+
+        # cells tiling the world exactly, so that boids which see one another
+        # across the edges of the world are in neighboring cells
+        self._grid_width = max(int(period[0] // self._view_distance), 1)
+        self._grid_height = max(int(period[1] // self._view_distance), 1)
+        self._cell_width = period[0] / self._grid_width
+        self._cell_height = period[1] / self._grid_height
+
+        # the grid is kept for the whole simulation and updated as boids move
+        self._grid = self._grid_class(self._grid_width, self._grid_height, True)
+        for boid in boids:
+            self._grid.push_data(boid, self.get_grid_coords(boid))
+
+
+    def get_grid_coords(self, boid):
+        '''Returns the [row, column] of the grid cell containing the boid'''
+        pos = boid.get_pos()
+        return [
+            int((pos[1] // self._cell_height) % self._grid_height),
+            int((pos[0] // self._cell_width) % self._grid_width)
+            ]
+
+
+    def get_occupancy(self):
+        '''Returns the number of boids in each cell'''
+        return [
+            len(self._grid.get_cell([i, j]))
+            for i in range(self._grid_height)
+            for j in range(self._grid_width)
+        ]
+
+
+    def refresh(self):
+        '''Moves the boids which changed cells'''
+        # boids only change cells once the whole tick is done, so that the cell
+        # groups seen during the tick are the same for every boid
+        moves = []
+        for coords, cell in self._grid.get_occupied_cells():
+            for boid in cell:
+                to_coords = self.get_grid_coords(boid)
+                if to_coords[0] != coords[0] or to_coords[1] != coords[1]:
+                    moves.append((boid, coords, to_coords))
+
+        # the grid persists between ticks, only move the boids which changed cells
+        for boid, from_coords, to_coords in moves:
+            self._grid.move_data(boid, from_coords, to_coords)
+
+
+    def neighborhoods(self):
+        '''Yields every boid with the cell group around its cell'''
+        # instead of iterating over the boids and always fetching its cell
+        # and surrounding cells, fetch each cell only once, and iterate
+        # over the boids in each cell
+        for coords, cell in self._grid.get_occupied_cells():
+            # fetch the cell-group
+            cell_group = self._grid.get_cell_group(coords)
+
+            # now iterate over the boids in this cell
+            for boid in cell:
+                yield boid, cell_group
+
+
+    def candidate_pairs(self):
+        '''Yields the pairs of every cell against itself and its forward cell group'''
+        # visit every cell against itself and the forward half of its
+        # neighbors, so that every pair of nearby boids is visited once
+        for coords, cell in self._grid.get_occupied_cells():
+            for index, boid in enumerate(cell):
+                yield boid, cell[index + 1:]
+
+            for neighbor in self._grid.get_forward_cell_group(coords):
+                for boid in cell:
+                    yield boid, neighbor
+# END class GridIndex
+
+class SparseGridIndex(GridIndex):
+    '''Uniform grid of cells the size of the view distance, only storing and
+    visiting the occupied cells, so that its cost follows the number of boids
+    rather than the area of the world'''
+    _grid_class = SparseDataGrid
+
+    def get_occupancy(self):
+        '''Returns the number of boids in each occupied cell, empty cells are not kept'''
+        return [len(cell) for _, cell in self._grid.get_occupied_cells()]
+# END class SparseGridIndex
+
+class QuadtreeNode:
+    '''A square of the quadtree, holding either boids or 4 smaller squares'''
+    __slots__ = ('x0', 'y0', 'x1', 'y1', 'items', 'children')
+
+    def __init__(self, x0, y0, x1, y1):
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x1
+        self.y1 = y1
+        self.items = None
+        self.children = None
+# END class QuadtreeNode
+
+class QuadtreeIndex(NeighborIndex):
+    '''Quadtree rebuilt every tick, queried with a box around the view circle'''
+    def __init__(self, boids, world_size=config.WORLD_SIZE):
+        super().__init__(boids, world_size)
+
+        # positions wrap around with this period, see Boid._enforce_bounds
+        self._period = (world_size[0] + 1, world_size[1] + 1)
+        self._root = None
+        self._stale = True
+
+
+    def refresh(self):
+        '''Marks the quadtree as stale, it is rebuilt when next queried'''
+        self._stale = True
+
+
+    def rebuild(self):
+        '''Rebuilds the quadtree around the current positions'''
+        self._stale = False
+        items = []
+        for index, boid in enumerate(self._boids):
+            pos = boid.get_pos()
+            items.append((pos[0], pos[1], index, boid))
+
+        if not items:
+            self._root = None
+            return
+
+        x0 = min(item[0] for item in items)
+        y0 = min(item[1] for item in items)
+        x1 = max(item[0] for item in items)
+        y1 = max(item[1] for item in items)
+        self._root = build_quadtree(items, x0, y0, x1, y1, 0)
+
+
+    def query(self, pos, radius):
+        '''Returns the (x, y, index, boid) of the boids in the square of the
+        given radius around pos, wrapping around the world edges'''
+        if self._stale:
+            self.rebuild()
+
+        boxes = self._wrapped_boxes(pos, radius)
+        if len(boxes) == 1:
+            return query_quadtree(self._root, *boxes[0])
+
+        # with several boxes, a boid could be found more than once
+        found = {}
+        for box in boxes:
+            for item in query_quadtree(self._root, *box):
+                found[item[2]] = item
+        return list(found.values())
+
+
+    def neighborhoods(self):
+        '''Yields every boid, in order, with the boids around it'''
+        for boid in self._boids:
+            yield boid, [[item[3] for item in self.query(boid.get_pos(), self._view_distance)]]
+
+
+    def candidate_pairs(self):
+        '''Yields every boid with the boids around it which come after it'''
+        for index, boid in enumerate(self._boids):
+            yield boid, [
+                item[3] for item in self.query(boid.get_pos(), self._view_distance)
+                if item[2] > index
+            ]
+
+
+    def _wrapped_boxes(self, pos, radius):
+        # the box around pos, split where it crosses the edges of the world
+        x_ranges = wrapped_ranges(pos[0] - radius, pos[0] + radius, self._period[0])
+        y_ranges = wrapped_ranges(pos[1] - radius, pos[1] + radius, self._period[1])
+        return [
+            (x_range[0], y_range[0], x_range[1], y_range[1])
+            for x_range in x_ranges
+            for y_range in y_ranges
+        ]
+# END class QuadtreeIndex
+
+class VerletIndex(NeighborIndex):
+    '''Neighbor lists of radius view distance + skin, reused over several ticks.
+    No boid can come within view distance of another without one of them
+    moving more than half the skin, so the lists are only rebuilt then'''
+    def __init__(self, boids, world_size=config.WORLD_SIZE, skin=config.VERLET_SKIN):
+        super().__init__(boids, world_size)
+
+        self._skin = skin
+        self._radius = self._view_distance + skin
+
+        # positions wrap around with this period, see Boid._enforce_bounds
+        self._period = (world_size[0] + 1, world_size[1] + 1)
+
+        # cells at least the list radius wide, tiling the world exactly so
+        # that neighboring cells wrap around correctly
+        self._grid_width = max(int(self._period[0] // self._radius), 1)
+        self._grid_height = max(int(self._period[1] // self._radius), 1)
+
+        self._built_positions = []
+        self._neighbors = []
+        self._forward_neighbors = []
+        self._rebuild_count = 0
+        self.rebuild()
+
+
+    def get_rebuild_count(self):
+        '''Returns how many times the neighbor lists were built'''
+        return self._rebuild_count
+
+
+    def refresh(self):
+        '''Rebuilds the neighbor lists once a boid moved more than half the skin'''
+        limit = (self._skin / 2) ** 2
+        for boid, built_pos in zip(self._boids, self._built_positions):
+            pos = boid.get_pos()
+            d_x = wrapped_difference(pos[0] - built_pos[0], self._period[0])
+            d_y = wrapped_difference(pos[1] - built_pos[1], self._period[1])
+            if d_x * d_x + d_y * d_y > limit:
+                self.rebuild()
+                return
+
+
+    def rebuild(self):
+        '''Builds the neighbor lists from the current positions'''
+        self._rebuild_count += 1
+        positions = [boid.get_pos() for boid in self._boids]
+        self._built_positions = positions
+
+        cell_width = self._period[0] / self._grid_width
+        cell_height = self._period[1] / self._grid_height
+        cells = {}
+        for index, pos in enumerate(positions):
+            key = (int(pos[0] // cell_width) % self._grid_width,
+                   int(pos[1] // cell_height) % self._grid_height)
+            cells.setdefault(key, []).append(index)
+
+        squared_radius = self._radius ** 2
+        period_x, period_y = self._period
+        half_x, half_y = period_x / 2, period_y / 2
+        boids = self._boids
+        neighbors = [[] for _ in positions]
+        forward_neighbors = [[] for _ in positions]
+        for (c_x, c_y), cell in cells.items():
+            # each distinct neighboring cell once, even on tiny grids
+            keys = {
+                ((c_x + d_x) % self._grid_width, (c_y + d_y) % self._grid_height)
+                for d_x in (-1, 0, 1)
+                for d_y in (-1, 0, 1)
+            }
+            others = [index for key in keys for index in cells.get(key, ())]
+
+            for index in cell:
+                x, y = positions[index]
+                for other in others:
+                    if other <= index:
+                        continue
+
+                    # the shortest offset, wrapping around the world, inlined
+                    # from wrapped_difference as this loop is hot
+                    o_x, o_y = positions[other]
+                    d_x = o_x - x
+                    if d_x > half_x:
+                        d_x -= period_x
+                    elif d_x < -half_x:
+                        d_x += period_x
+                    d_y = o_y - y
+                    if d_y > half_y:
+                        d_y -= period_y
+                    elif d_y < -half_y:
+                        d_y += period_y
+
+                    if d_x * d_x + d_y * d_y <= squared_radius:
+                        neighbors[index].append(boids[other])
+                        neighbors[other].append(boids[index])
+                        forward_neighbors[index].append(boids[other])
+
+        self._neighbors = neighbors
+        self._forward_neighbors = forward_neighbors
+
+
+    def neighborhoods(self):
+        '''Yields every boid, in order, with its neighbor list'''
+        for boid, neighbors in zip(self._boids, self._neighbors):
+            yield boid, [neighbors]
+
+
+    def candidate_pairs(self):
+        '''Yields every boid with the neighbors which come after it'''
+        return zip(self._boids, self._forward_neighbors)
+# END class VerletIndex
+
+NEIGHBOR_INDEXES = {
+    'grid': GridIndex,
+    'sparse': SparseGridIndex,
+    'quadtree': QuadtreeIndex,
+    'verlet': VerletIndex,
+}
+
+
+def build_quadtree(items, x0, y0, x1, y1, depth):
+    '''Returns the root of a quadtree holding the (x, y, ...) items'''
+    node = QuadtreeNode(x0, y0, x1, y1)
+    if len(items) <= QUADTREE_LEAF_SIZE or depth >= QUADTREE_MAX_DEPTH:
+        node.items = items
+        return node
+
+    # split the square in 4, by which side of the middle each item falls
+    mid_x = (x0 + x1) / 2
+    mid_y = (y0 + y1) / 2
+    quadrants = ([], [], [], [])
+    for item in items:
+        quadrants[(item[0] >= mid_x) + 2 * (item[1] >= mid_y)].append(item)
+
+    bounds = (
+        (x0, y0, mid_x, mid_y),
+        (mid_x, y0, x1, mid_y),
+        (x0, mid_y, mid_x, y1),
+        (mid_x, mid_y, x1, y1),
+    )
+    node.children = [
+        build_quadtree(quadrant, *bound, depth + 1)
+        for quadrant, bound in zip(quadrants, bounds)
+        if quadrant
+    ]
+    return node
+
+
+def query_quadtree(root, x0, y0, x1, y1):
+    '''Returns the items of the quadtree within the box'''
+    found = []
+    if root is None:
+        return found
+
+    stack = [root]
+    while stack:
+        node = stack.pop()
+
+        # skip the squares which do not overlap the box
+        if node.x0 > x1 or node.x1 < x0 or node.y0 > y1 or node.y1 < y0:
+            continue
+
+        if node.children is not None:
+            stack.extend(node.children)
+            continue
+
+        for item in node.items:
+            if x0 <= item[0] <= x1 and y0 <= item[1] <= y1:
+                found.append(item)
+
+    return found
+
+
+def wrapped_difference(difference, period):
+    '''Returns the shortest equivalent of a difference of coordinates wrapping with period'''
+    if difference > period / 2:
+        return difference - period
+    if difference < -period / 2:
+        return difference + period
+    return difference
+
+
+def wrapped_ranges(low, high, period):
+    '''Splits the range [low, high] where it crosses 0 or period'''
+    if high - low >= period:
+        return [(0, period)]
+    if low < 0:
+        return [(0, high), (low + period, period)]
+    if high >= period:
+        return [(low, period), (0, high - period)]
+    return [(low, high)]
@@ -0,0 +1,436 @@
+"""
+Static obstacles and attractors, sampled once into a field the boids steer by.
+
+Obstacles are circles and polygons the boids steer around, and attractors
+are points they are drawn towards, loaded from a JSON file:
+
+    {
+        "obstacles": [
+            {"circle": [500, 375], "radius": 60},
+            {"polygon": [[150, 100], [300, 120], [220, 240]]}
+        ],
+        "attractors": [
+            {"point": [850, 600], "radius": 200, "strength": 0.1}
+        ]
+    }
+
+Rather than testing every boid against every obstacle each tick, the world is
+sampled once on a fine grid, aligned with the cells of the neighbor grid and
+OBSTACLE_FIELD_RESOLUTION times finer: the signed distance to the nearest
+obstacle (negative inside it) with its gradient, pointing away from the
+obstacle, and the sum of the pulls of the attractors. Each boid then reads the
+sample under it, whatever the number of obstacles. Like the boids, obstacles
+and attractors reach around the edges of the world.
+
+Only the samples which steer a boid are kept: those within the avoid distance
+of an obstacle or the radius of an attractor. They are found from the
+bounding box of each obstacle and attractor, so sampling takes time and memory
+in proportion to the area the obstacles cover, not the area of the world.
+The field is cached on disk all the same, keyed by the contents of the
+obstacle file, the shape of the grid and the avoid distance, in
+OBSTACLE_CACHE_DIR.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from math import atan2, hypot, inf
+import config
+
+from boid import Boid, normalize_angle
+
+Circle = namedtuple('Circle', ('x', 'y', 'radius'))
+Polygon = namedtuple('Polygon', ('points',))
+Attractor = namedtuple('Attractor', ('x', 'y', 'radius', 'strength'))
+
+# attractors pull within this many pixels, this hard, unless given
+ATTRACTOR_RADIUS = 200
+ATTRACTOR_STRENGTH = 0.1
+
+# cached fields: a header, then the int64 indices of the samples kept, row by
+# row, and the float32 distance, gradient x and y, and pull x and y of each
+MAGIC = b'BOIDFELD'
+VERSION = 2
+HEADER = struct.Struct('<8sI32sIII')
+FIELDS = ('distance', 'gradient_x', 'gradient_y', 'pull_x', 'pull_y')
+
+# what a position far from every obstacle and attractor samples
+EMPTY_SAMPLE = (inf, 0.0, 0.0, 0.0, 0.0)
+
+
+class ObstacleField:
+    '''The obstacles and attractors of a world, sampled on a fine grid'''
+    def __init__(self, obstacles, attractors, world_size, columns, rows, indices, samples,
+                 avoid_distance=config.OBSTACLE_AVOID_DISTANCE):
+        self._obstacles = obstacles
+        self._attractors = attractors
+        self._world_size = world_size
+        self._columns = columns
+        self._rows = rows
+
+        # the samples tile the period of the world, like the neighbor grid
+        self._cell_width = (world_size[0] + 1) / columns
+        self._cell_height = (world_size[1] + 1) / rows
+        self._indices = indices
+        self._distance, self._gradient_x, self._gradient_y, self._pull_x, self._pull_y = \
+            samples
+
+        # where each sample kept is stored, by its index on the grid
+        self._slots = {index: slot for slot, index in enumerate(indices)}
+        self._avoid_distance = avoid_distance
+
+
+    def get_obstacles(self):
+        '''Returns the Circle and Polygon obstacles'''
+        return self._obstacles
+
+
+    def get_attractors(self):
+        '''Returns the Attractors'''
+        return self._attractors
+
+
+    def get_shape(self):
+        '''Returns the (columns, rows) of the grid of samples'''
+        return (self._columns, self._rows)
+
+
+    def get_cell_size(self):
+        '''Returns the (width, height) of the area each sample covers'''
+        return (self._cell_width, self._cell_height)
+
+
+    def get_avoid_distance(self):
+        '''Returns the distance from an obstacle at which boids start turning away'''
+        return self._avoid_distance
+
+
+    def get_indices(self):
+        '''Returns the sorted int64 array of the indices on the grid, row by
+        row, of the samples kept'''
+        return self._indices
+
+
+    def get_samples(self):
+        '''Returns the float32 arrays of the distance, gradient x and y, and
+        pull x and y of each sample kept, in the order of get_indices'''
+        return (self._distance, self._gradient_x, self._gradient_y, self._pull_x, self._pull_y)
+
+
+    def sample(self, x, y):
+        '''Returns the (distance, gradient_x, gradient_y, pull_x, pull_y) of the
+        sample covering a position'''
+        i = self._slots.get(self._index(x, y))
+        if i is None:
+            return EMPTY_SAMPLE
+        return (self._distance[i], self._gradient_x[i], self._gradient_y[i],
+                self._pull_x[i], self._pull_y[i])
+
+
+    def turn(self, x, y, theta):
+        '''Returns the change in heading of a boid steering away from the
+        obstacles and towards the attractors, before it is clamped'''
+        i = self._slots.get(self._index(x, y))
+        if i is None:
+            return 0.0
+        turn = 0.0
+
+        # the closer to an obstacle, the harder the boid turns away from it
+        distance = self._distance[i]
+        if distance < self._avoid_distance:
+            away = atan2(self._gradient_y[i], self._gradient_x[i])
+            turn += (1 - distance / self._avoid_distance) * normalize_angle(away - theta)
+
+        pull_x = self._pull_x[i]
+        pull_y = self._pull_y[i]
+        if pull_x != 0 or pull_y != 0:
+            turn += hypot(pull_x, pull_y) * normalize_angle(atan2(pull_y, pull_x) - theta)
+
+        return turn
+
+
+    def _index(self, x, y):
+        # the sample of the position, like flock.cell_indices
+        column = int(x // self._cell_width) % self._columns
+        row = int(y // self._cell_height) % self._rows
+        return row * self._columns + column
+# END class ObstacleField
+
+def load_field(path, world_size=config.WORLD_SIZE, resolution=config.OBSTACLE_FIELD_RESOLUTION,
+               avoid_distance=config.OBSTACLE_AVOID_DISTANCE, cache_dir=None):
+    '''Returns the ObstacleField of the obstacle file at path, from the cache
+    if it was sampled before for the same grid, sampling and caching it
+    otherwise. The cache is in cache_dir, or else cache_directory()'''
+    with open(path, 'rb') as obstacle_file:
+        contents = obstacle_file.read()
+    obstacles, attractors = parse(json.loads(contents), path)
+    columns, rows = field_shape(world_size, resolution)
+
+    # the field depends on nothing but the file, the grid it is sampled on and
+    # how far from the obstacles samples are kept
+    key = hashlib.sha256(contents + struct.pack(
+        '<Idddii', VERSION, *world_size, avoid_distance, columns, rows)).digest()
+    cache_path = os.path.join(cache_dir or cache_directory(), key.hex()[:32] + '.field')
+
+    cached = read_samples(cache_path, key, columns, rows)
+    if cached is None:
+        cached = sample_field(obstacles, attractors, world_size, columns, rows, avoid_distance)
+        try:
+            write_samples(cache_path, key, columns, rows, *cached)
+        except OSError:
+            # e.g. no writable cache directory, the field is simply sampled every time
+            pass
+
+    return ObstacleField(
+        obstacles, attractors, world_size, columns, rows, *cached, avoid_distance)
+
+
+def cache_directory():
+    '''Returns the directory sampled fields are cached in: OBSTACLE_CACHE_DIR,
+    or else the user's cache directory'''
+    if config.OBSTACLE_CACHE_DIR is not None:
+        return config.OBSTACLE_CACHE_DIR
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'py3-boids', 'fields')
+
+
+def parse(description, path='obstacles'):
+    '''Returns the (obstacles, attractors) of the decoded JSON of an obstacle file'''
+    obstacles = []
+    attractors = []
+    try:
+        for obstacle in description.get('obstacles', ()):
+            if 'circle' in obstacle:
+                x, y = obstacle['circle']
+                obstacles.append(Circle(float(x), float(y), float(obstacle['radius'])))
+            elif 'polygon' in obstacle:
+                points = tuple((float(x), float(y)) for x, y in obstacle['polygon'])
+                if len(points) < 3:
+                    raise ValueError('a polygon needs at least 3 points')
+                obstacles.append(Polygon(points))
+            else:
+                raise ValueError(f'expected a circle or a polygon, not {obstacle}')
+
+        for attractor in description.get('attractors', ()):
+            x, y = attractor['point']
+            attractors.append(Attractor(
+                float(x), float(y), float(attractor.get('radius', ATTRACTOR_RADIUS)),
+                float(attractor.get('strength', ATTRACTOR_STRENGTH))))
+    except (AttributeError, KeyError, TypeError, ValueError) as error:
+        raise ValueError(f'{path} is not a valid obstacle file: {error!r}') from error
+
+    return obstacles, attractors
+
+
+def field_shape(world_size, resolution=config.OBSTACLE_FIELD_RESOLUTION):
+    '''Returns the (columns, rows) of the samples of a world, resolution times
+    those of the neighbor grid, see neighbor_index.GridIndex'''
+    view_distance = Boid.get_view_distance()
+    return (
+        max(int((world_size[0] + 1) // view_distance), 1) * resolution,
+        max(int((world_size[1] + 1) // view_distance), 1) * resolution
+        )
+
+
+def sample_field(obstacles, attractors, world_size, columns, rows,
+                 avoid_distance=config.OBSTACLE_AVOID_DISTANCE):
+    '''Returns the sorted int64 array of the indices of the samples within
+    avoid_distance of an obstacle or the radius of an attractor, and the
+    float32 arrays of the distance, gradient x and y, and pull x and y at
+    the center of each'''
+    period = (world_size[0] + 1, world_size[1] + 1)
+    cell_width = period[0] / columns
+    cell_height = period[1] / rows
+
+    # the nearest obstacle wins, only those closer than the avoid distance count
+    nearest = {}
+    for obstacle in obstacles:
+        if isinstance(obstacle, Circle):
+            distance_to = circle_distance
+            box = (obstacle.x - obstacle.radius, obstacle.y - obstacle.radius,
+                   obstacle.x + obstacle.radius, obstacle.y + obstacle.radius)
+        else:
+            distance_to = polygon_distance
+            box = (min(x for x, _ in obstacle.points), min(y for _, y in obstacle.points),
+                   max(x for x, _ in obstacle.points), max(y for _, y in obstacle.points))
+
+        for i, x, y in box_samples(box, avoid_distance, cell_width, cell_height, columns, rows):
+            sampled = distance_to(obstacle, x, y, period)
+            if sampled[0] < avoid_distance and sampled[0] < nearest.get(i, EMPTY_SAMPLE)[0]:
+                nearest[i] = sampled
+
+    # the pulls of the attractors add up
+    pulls = {}
+    for attractor in attractors:
+        box = (attractor.x, attractor.y, attractor.x, attractor.y)
+        for i, x, y in box_samples(box, attractor.radius, cell_width, cell_height, columns, rows):
+            pulled = pull((attractor,), x, y, period, cap=False)
+            if pulled != (0.0, 0.0):
+                pull_x, pull_y = pulls.get(i, (0.0, 0.0))
+                pulls[i] = (pull_x + pulled[0], pull_y + pulled[1])
+
+    indices = array('q', sorted(nearest.keys() | pulls.keys()))
+    samples = tuple(array('f') for _ in FIELDS)
+    for i in indices:
+        pull_x, pull_y = capped(*pulls.get(i, (0.0, 0.0)))
+        for values, value in zip(samples, nearest.get(i, EMPTY_SAMPLE)[:3] + (pull_x, pull_y)):
+            values.append(value)
+
+    return indices, samples
+
+
+def box_samples(box, margin, cell_width, cell_height, columns, rows):
+    '''Yields the index and center (i, x, y) of each sample within margin of
+    a (left, top, right, bottom) box, once each, around the world's edges'''
+    left, top, right, bottom = box
+    column_range = wrapped_range(
+        int((left - margin) // cell_width), int((right + margin) // cell_width), columns)
+    for row in wrapped_range(
+            int((top - margin) // cell_height), int((bottom + margin) // cell_height), rows):
+        y = (row + 0.5) * cell_height
+        for column in column_range:
+            yield row * columns + column, (column + 0.5) * cell_width, y
+
+
+def wrapped_range(first, last, count):
+    '''Returns the indices from first to last inclusive, wrapped into range(count)
+    and at most count of them'''
+    if last - first + 1 >= count:
+        return range(count)
+    return [index % count for index in range(first, last + 1)]
+
+
+def circle_distance(circle, x, y, period):
+    '''Returns the signed distance from a position to a circle, and its gradient'''
+    d_x = wrapped_difference(x - circle.x, period[0])
+    d_y = wrapped_difference(y - circle.y, period[1])
+    distance = hypot(d_x, d_y)
+    if distance == 0:
+        # the center, any direction leads out
+        return -circle.radius, 1.0, 0.0
+    return distance - circle.radius, d_x / distance, d_y / distance
+
+
+def polygon_distance(polygon, x, y, period):
+    '''Returns the signed distance from a position to a polygon, and its gradient'''
+    points = polygon.points
+
+    # the image of the position nearest to the polygon, around the world's edges
+    center_x = sum(point[0] for point in points) / len(points)
+    center_y = sum(point[1] for point in points) / len(points)
+    x = center_x + wrapped_difference(x - center_x, period[0])
+    y = center_y + wrapped_difference(y - center_y, period[1])
+
+    # the nearest point on the edges, and whether the position is inside,
+    # counting the edges crossed by a ray towards +x
+    best = inf
+    best_x, best_y = x, y
+    inside = False
+    for (a_x, a_y), (b_x, b_y) in zip(points, points[1:] + points[:1]):
+        e_x, e_y = b_x - a_x, b_y - a_y
+        length = e_x * e_x + e_y * e_y
+        t = 0.0 if length == 0 else min(max(((x - a_x) * e_x + (y - a_y) * e_y) / length, 0), 1)
+        near_x, near_y = a_x + t * e_x, a_y + t * e_y
+        squared_distance = (x - near_x) ** 2 + (y - near_y) ** 2
+        if squared_distance < best:
+            best, best_x, best_y = squared_distance, near_x, near_y
+
+        if (a_y > y) != (b_y > y) and x < a_x + (y - a_y) * e_x / e_y:
+            inside = not inside
+
+    distance = best ** 0.5
+    if distance == 0:
+        # on an edge, leave towards the outside of the polygon, roughly
+        d_x, d_y = x - center_x, y - center_y
+        norm = hypot(d_x, d_y) or 1.0
+        return 0.0, d_x / norm, d_y / norm
+
+    # the gradient points away from the polygon, outwards from inside too
+    sign = -1 if inside else 1
+    return sign * distance, sign * (x - best_x) / distance, sign * (y - best_y) / distance
+
+
+def pull(attractors, x, y, period, cap=True):
+    '''Returns the summed pull of the attractors on a position, weaker further
+    away, as a vector at most 1 long unless cap is False'''
+    pull_x = pull_y = 0.0
+    for attractor in attractors:
+        d_x = wrapped_difference(attractor.x - x, period[0])
+        d_y = wrapped_difference(attractor.y - y, period[1])
+        distance = hypot(d_x, d_y)
+        if 0 < distance < attractor.radius:
+            weight = attractor.strength * (1 - distance / attractor.radius) / distance
+            pull_x += weight * d_x
+            pull_y += weight * d_y
+
+    if cap:
+        return capped(pull_x, pull_y)
+    return pull_x, pull_y
+
+
+def capped(x, y):
+    '''Returns the vector scaled down to at most 1 long'''
+    length = hypot(x, y)
+    if length > 1:
+        return x / length, y / length
+    return x, y
+
+
+def wrapped_difference(difference, period):
+    '''Returns the shortest equivalent of a difference of coordinates wrapping with period'''
+    return difference - period * round(difference / period)
+
+
+def read_samples(path, key, columns, rows):
+    '''Returns the (indices, samples) cached at path, None if absent or not of
+    this key and grid'''
+    try:
+        with open(path, 'rb') as cache:
+            header = cache.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return None
+            magic, version, cached_key, cached_columns, cached_rows, count = \
+                HEADER.unpack(header)
+            if (magic, version, cached_key, cached_columns, cached_rows) != \
+                    (MAGIC, VERSION, key, columns, rows):
+                return None
+
+            arrays = []
+            for type_code in 'q' + 'f' * len(FIELDS):
+                values = array(type_code)
+                data = cache.read(values.itemsize * count)
+                if len(data) != values.itemsize * count:
+                    # e.g. cut short while another run was writing it
+                    return None
+                values.frombytes(data)
+                arrays.append(values)
+            indices, *samples = arrays
+            if sys.byteorder == 'big':
+                for values in (indices, *samples):
+                    values.byteswap()
+    except OSError:
+        return None
+    return indices, tuple(samples)
+
+
+def write_samples(path, key, columns, rows, indices, samples):
+    '''Caches indices and samples at path, atomically like checkpoint.write_state'''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'wb') as cache:
+        cache.write(HEADER.pack(MAGIC, VERSION, key, columns, rows, len(indices)))
+        for values in (indices, *samples):
+            if sys.byteorder == 'big':
+                values = array(values.typecode, values)
+                values.byteswap()
+            cache.write(values.tobytes())
+    os.replace(temporary_path, path)
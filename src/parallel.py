@@ -0,0 +1,394 @@
+"""
+Multi-process flock engine.
+
+The grid of cells is split into horizontal strips of rows, and each strip is
+updated by its own worker process. The whole flock lives in shared memory,
+double-buffered: every tick, the workers read the previous state and write
+the next one for the boids they own, so no locks are needed.
+
+Each worker keeps the list of the boids in its strip from one tick to the
+next, so the main process does little more than signal the ticks. A boid's 3x3
+cell group only reaches one row above and below its own, so a worker only
+reads its own boids and those of the two halo rows around its strip. After
+moving its boids, every worker publishes to the others, in its outbox in
+shared memory, which of its boids are now in its first and last rows, and
+which left its strip. The next tick, its neighbors read their halos from
+those rows, and the workers whose strips the leaving boids entered adopt
+them. The outboxes are double-buffered like the flock, so each tick reads
+what the previous one wrote.
+
+The outboxes share one buffer of n boids: a worker only publishes boids it
+owns, so its outbox never holds more than it owns. Every worker tells the
+main process in which strips its boids ended up, from which it knows how
+many each will own the next tick and where their outboxes start.
+
+The workers are never forked from the main process, see START_METHOD, so a
+script building a ParallelFlock must guard its main code with
+`if __name__ == '__main__':`, like on platforms without fork.
+"""
+
+import os
+from collections import namedtuple
+from multiprocessing import get_all_start_methods, get_context
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import sim_state
+import config
+
+from flock import Flock, candidate_count, cell_indices, move, obstacle_turns, steer
+from profiler import PROFILER, occupancy_histogram
+
+# views of the flock in shared memory. x, y and theta have two buffers,
+# the one read this tick and the one written, and so have the outboxes of the
+# workers: the boids of their first row, of their last row and those which
+# left their strip, at the (start, count) in the buffer given in their headers
+SharedState = namedtuple(
+    'SharedState', ('x', 'y', 'theta', 'magnitude', 'headers', 'outboxes', 'active'))
+
+# the (start, count) pairs of each outbox header
+FIRST_ROW, LAST_ROW, LEFT = range(3)
+
+# workers are not forked from the main process, which is unsafe once Numba's
+# thread pool was started, e.g. by the jit engine: a fork server, preloaded
+# with this module, forks them where available, they are spawned otherwise
+START_METHOD = 'forkserver' if 'forkserver' in get_all_start_methods() else 'spawn'
+
+
+class ParallelFlock(Flock):
+    '''A flock whose grid rows are split between worker processes'''
+    def __init__(self, positions, magnitudes, thetas, world_size=config.WORLD_SIZE,
+                 workers=config.WORKER_COUNT, nearest=None, field=None):
+        super().__init__(positions, magnitudes, thetas, world_size, nearest=nearest, field=field)
+
+        n = len(self._x)
+        grid_height = self._params.grid_height
+
+        # each worker needs at least one row of its own
+        workers = min(workers or os.cpu_count(), grid_height)
+
+        self._shm = SharedMemory(create=True, size=max(shared_size(n, workers), 1))
+        self._shared = map_shared_state(self._shm.buf, n, workers)
+        self._current = 0
+
+        self._shared.x[0] = self._x
+        self._shared.y[0] = self._y
+        self._shared.theta[0] = self._theta
+        self._shared.magnitude[:] = self._magnitude
+        self._shared.active[:] = False
+        self._bind_current()
+
+        bounds = tuple(int(bound) for bound in np.linspace(0, grid_height, workers + 1))
+        rows = cell_indices(self._y, self._params.period[1], grid_height)
+        self._set_offsets([np.bincount(strip_indices(rows, bounds), minlength=workers)])
+
+        context = get_context(START_METHOD)
+        if START_METHOD == 'forkserver':
+            context.set_forkserver_preload([__name__])
+        self._connections = []
+        self._workers = []
+        for worker_index in range(workers):
+            connection, worker_connection = context.Pipe()
+            worker = context.Process(
+                target=work,
+                args=(self._shm.name, n, world_size, self._params, field, bounds, worker_index,
+                      self._offsets[worker_index], worker_connection),
+                daemon=True
+            )
+            worker.start()
+            self._connections.append(connection)
+            self._workers.append(worker)
+
+        # the workers find their boids and publish their first outboxes
+        for connection in self._connections:
+            connection.recv()
+
+
+    def get_worker_count(self):
+        '''Returns the number of worker processes'''
+        return len(self._workers)
+
+
+    def get_thetas(self):
+        '''Returns a copy of the boid headings, the shared buffer is reused'''
+        return self._theta.copy()
+
+
+    def get_active(self):
+        '''Returns a copy of the active flags, the shared buffer is reused'''
+        return self._active.copy()
+
+
+    def update(self):
+        '''Update every boid's heading, then position based on active rules'''
+        # read the state, in case it changes during execution.
+        rules = (sim_state.SEPARATION, sim_state.ALIGNMENT, sim_state.COHESION)
+
+        profile = PROFILER.is_enabled()
+
+        # the workers exchange their halos and migrating boids, run the rules
+        # and move their boids in one go
+        with PROFILER.phase('workers'):
+            for connection, offset in zip(self._connections, self._offsets):
+                connection.send((self._current, offset, rules, profile))
+            replies = [connection.recv() for connection in self._connections]
+
+        self._set_offsets([strips for strips, _ in replies])
+        if profile:
+            self._profile_workers([counters for _, counters in replies])
+
+        # the buffer just written becomes the one read next tick
+        self._current = 1 - self._current
+        self._bind_current()
+
+
+    def close(self):
+        '''Stops the workers and releases the shared memory'''
+        if self._shm is None:
+            return
+
+        for connection in self._connections:
+            connection.send(None)
+        for worker in self._workers:
+            worker.join()
+
+        # the views must be gone before the memory can be released
+        self._x = self._x.copy()
+        self._y = self._y.copy()
+        self._theta = self._theta.copy()
+        self._active = self._active.copy()
+        self._shared = None
+
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+
+
+    def _set_offsets(self, strips):
+        # the outboxes of the next tick start where the boids the workers
+        # will own, given how many each left in every strip, add up
+        owned = np.sum(strips, axis=0)
+        self._offsets = [0] + [int(offset) for offset in np.cumsum(owned)[:-1]]
+
+
+    def _profile_workers(self, counters):
+        # counters of the tick, see profiler.py. The occupancies of the
+        # strips follow each other row by row
+        occupancy = np.concatenate([strip_occupancy for strip_occupancy, _ in counters])
+        PROFILER.count('candidates', candidate_count(
+            occupancy, self._params.grid_width, self._params.grid_height))
+        PROFILER.count('visible', sum(visible for _, visible in counters))
+        PROFILER.set_histogram('occupancy', occupancy_histogram(occupancy.tolist()))
+
+
+    def _bind_current(self):
+        # the inherited getters read the buffer of the current tick
+        self._x = self._shared.x[self._current]
+        self._y = self._shared.y[self._current]
+        self._theta = self._shared.theta[self._current]
+        self._active = self._shared.active
+# END class ParallelFlock
+
+def shared_size(n, workers):
+    '''Returns the number of bytes needed to share a flock of n boids between workers'''
+    return 8 * (3 * 2 * n + n + 2 * workers * 6) + 4 * 2 * n + n
+
+
+def map_shared_state(buffer, n, workers):
+    '''Returns the SharedState views of a shared memory buffer'''
+    offset = 0
+
+    def view(shape, dtype):
+        nonlocal offset
+        array = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+        offset += array.nbytes
+        return array
+
+    # 8 byte fields first, keeping every array aligned. The boids in an
+    # outbox are all owned by its worker, so n holds all the outboxes
+    return SharedState(
+        x=view((2, n), np.float64),
+        y=view((2, n), np.float64),
+        theta=view((2, n), np.float64),
+        magnitude=view((n,), np.float64),
+        headers=view((2, workers, 3, 2), np.int64),
+        outboxes=view((2, n), np.int32),
+        active=view((n,), np.bool_)
+    )
+
+
+def work(shm_name, n, world_size, params, field, bounds, worker_index, offset, connection):
+    '''Worker process loop: updates its strip of rows every time it is asked to,
+    answering in which strips its boids ended up, and its counters if profiling'''
+    shm = SharedMemory(name=shm_name)
+    shared = map_shared_state(shm.buf, n, len(bounds) - 1)
+    strip = Strip(shared, params, bounds, worker_index, offset)
+    connection.send(True)
+
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+
+        current, offset, rules, profile = message
+        connection.send(strip.update(current, offset, rules, world_size, field, profile))
+
+    del strip, shared
+    shm.close()
+
+
+class Strip:
+    '''The boids of a worker's strip of rows, kept from one tick to the next'''
+    def __init__(self, shared, params, bounds, worker_index, offset):
+        self._shared = shared
+        self._params = params
+        self._bounds = bounds
+        self._worker_index = worker_index
+        self._rows = (bounds[worker_index], bounds[worker_index + 1])
+
+        # the boids of the strip are only found by looking at the whole flock once
+        rows = cell_indices(shared.y[0], params.period[1], params.grid_height)
+        self._owned = np.flatnonzero(self._in_strip(rows)).astype(np.int32)
+        self._publish(0, offset, rows[self._owned], self._owned[:0])
+
+
+    def update(self, current, offset, rules, world_size, field=None, profile=False):
+        '''Updates the boids of the strip, writing them to the other buffer and
+        its outbox at the given offset, steered by the obstacle field if given.
+        Returns how many of its boids are in each strip, and if profiling, the
+        occupancy of its cells and how many boids its boids saw'''
+        shared = self._shared
+        halo_rows = self._halo_rows()
+        arrivals, arrived_halo = self._arrivals(current, halo_rows)
+        # in index order, so that sums over neighbors only depend on the state
+        # of the flock, not on which boids migrated when, e.g. after a restore
+        owned = np.sort(np.concatenate((self._owned, arrivals)))
+        local = np.concatenate(
+            (owned, np.sort(np.concatenate((self._halo(current, halo_rows), arrived_halo)))))
+
+        x = shared.x[current][local]
+        y = shared.y[current][local]
+        theta = shared.theta[current][local]
+        magnitude = shared.magnitude[local]
+
+        # only the owned boids which are moving react to others
+        owned_count = len(owned)
+        queries = np.zeros(len(local), dtype=bool)
+        queries[:owned_count] = magnitude[:owned_count] != 0
+
+        d_theta, in_view = steer(x, y, magnitude, theta, queries, rules, self._params)
+
+        counters = None
+        if profile:
+            counters = (self._occupancy(x[:owned_count], y[:owned_count]),
+                        int(in_view[:owned_count].sum()))
+
+        x, y, theta = x[:owned_count], y[:owned_count], theta[:owned_count]
+        d_theta = d_theta[:owned_count]
+        if field is not None:
+            d_theta = obstacle_turns(field, x, y, theta, d_theta, self._params.d_theta)
+
+        x, y, theta = move(x, y, magnitude[:owned_count], theta + d_theta, world_size)
+
+        written = 1 - current
+        shared.x[written][owned] = x
+        shared.y[written][owned] = y
+        shared.theta[written][owned] = theta
+        shared.active[owned] = in_view[:owned_count] > 0
+
+        # the boids which crossed a border of the strip leave it
+        rows = cell_indices(y, self._params.period[1], self._params.grid_height)
+        staying = self._in_strip(rows)
+        self._owned = owned[staying]
+        self._publish(written, offset, rows[staying], owned[~staying])
+        strips = np.bincount(strip_indices(rows, self._bounds), minlength=len(self._bounds) - 1)
+        return strips, counters
+
+
+    def _in_strip(self, rows):
+        return (rows >= self._rows[0]) & (rows < self._rows[1])
+
+
+    def _occupancy(self, x, y):
+        # the number of boids in each cell of the strip, row by row
+        params = self._params
+        cell_x = cell_indices(x, params.period[0], params.grid_width)
+        cell_y = cell_indices(y, params.period[1], params.grid_height) - self._rows[0]
+        return np.bincount(
+            cell_y * params.grid_width + cell_x,
+            minlength=(self._rows[1] - self._rows[0]) * params.grid_width)
+
+
+    def _arrivals(self, current, halo_rows):
+        # the boids which left the other strips for this one, and those which
+        # left any strip for the halo rows, not yet published with the rows
+        # they entered
+        shared = self._shared
+        arrivals = []
+        arrived_halo = []
+        # a boid which left this strip may have entered its halo rows
+        for worker_index in range(len(self._bounds) - 1):
+            left = self._outbox(current, worker_index, LEFT)
+            rows = cell_indices(shared.y[current][left], self._params.period[1],
+                                self._params.grid_height)
+            arrivals.append(left[self._in_strip(rows)])
+            arrived_halo.append(left[np.isin(rows, [row for row, _ in halo_rows])])
+
+        empty = self._owned[:0]
+        return (np.concatenate(arrivals) if arrivals else empty,
+                np.concatenate(arrived_halo) if arrived_halo else empty)
+
+
+    def _halo_rows(self):
+        # the rows just above and below the strip with the worker and part of
+        # the outbox they are published in: the last row of the strip before
+        # and the first of the one after. The same row on grids only a couple
+        # of strips high, and none with a single strip
+        grid_height = self._params.grid_height
+        workers = len(self._bounds) - 1
+        above = (self._rows[0] - 1) % grid_height
+        below = self._rows[1] % grid_height
+
+        halo_rows = []
+        if not self._rows[0] <= above < self._rows[1]:
+            halo_rows.append((above, ((self._worker_index - 1) % workers, LAST_ROW)))
+        if below != above and not self._rows[0] <= below < self._rows[1]:
+            halo_rows.append((below, ((self._worker_index + 1) % workers, FIRST_ROW)))
+        return halo_rows
+
+
+    def _halo(self, current, halo_rows):
+        # the boids which stayed in the halo rows, as their workers published them
+        halo = [self._outbox(current, *published) for _, published in halo_rows]
+        return np.concatenate(halo) if halo else self._owned[:0]
+
+
+    def _outbox(self, current, worker_index, part):
+        start, count = self._shared.headers[current, worker_index, part]
+        return self._shared.outboxes[current, start:start + count]
+
+
+    def _publish(self, written, offset, rows, left):
+        # the boids of the first and last rows of the strip, then those which
+        # left it, which are the same row on strips one row high
+        first = self._owned[rows == self._rows[0]]
+        last = self._owned[rows == self._rows[1] - 1]
+        header = self._shared.headers[written, self._worker_index]
+        outbox = self._shared.outboxes[written, offset:]
+
+        header[FIRST_ROW] = (offset, len(first))
+        outbox[:len(first)] = first
+        if self._rows[1] - self._rows[0] == 1:
+            header[LAST_ROW] = header[FIRST_ROW]
+            start = len(first)
+        else:
+            header[LAST_ROW] = (offset + len(first), len(last))
+            outbox[len(first):len(first) + len(last)] = last
+            start = len(first) + len(last)
+        header[LEFT] = (offset + start, len(left))
+        outbox[start:start + len(left)] = left
+# END class Strip
+
+
+def strip_indices(rows, bounds):
+    '''Returns the index of the strip each grid row belongs to, given the strip bounds'''
+    return np.searchsorted(bounds[1:-1], rows, side='right')
@@ -0,0 +1,181 @@
+"""
+Built-in profiling of the simulation and rendering.
+
+`PROFILER` times the phases of each tick and frame, and keeps counters such
+as the candidate pairs tested and the pairs of boids which see one another,
+plus the occupancy histogram of the grid cells. It keeps the last
+`PROFILE_WINDOW` values of each, and summarizes them for the on-screen
+overlay or periodic CSV/JSON exports.
+
+Profiling is off by default. While off, timing a phase costs a single check,
+and the engines skip gathering the counters altogether, e.g.
+
+    with PROFILER.phase('index'):
+        index.refresh()
+    if PROFILER.is_enabled():
+        PROFILER.count('visible', visible)
+"""
+
+import csv
+import json
+import os
+import time
+from collections import deque
+import config
+
+
+class Profiler:
+    '''Rolling timings of named phases, counters and histograms'''
+    def __init__(self, window=config.PROFILE_WINDOW):
+        self._window = window
+        self._enabled = False
+        self._timings = {}
+        self._counters = {}
+        self._histograms = {}
+
+
+    def is_enabled(self):
+        '''Returns whether phases and counters are being recorded'''
+        return self._enabled
+
+
+    def set_enabled(self, enabled):
+        '''Starts or stops recording, starting over from empty windows'''
+        if enabled and not self._enabled:
+            self.reset()
+        self._enabled = enabled
+
+
+    def reset(self):
+        '''Forgets everything recorded so far'''
+        self._timings = {}
+        self._counters = {}
+        self._histograms = {}
+
+
+    def phase(self, name):
+        '''Returns a context manager timing its block as the phase name'''
+        if not self._enabled:
+            return NULL_PHASE
+        return Phase(self, name)
+
+
+    def record(self, name, seconds):
+        '''Records that the phase name took this many seconds'''
+        values = self._timings.get(name)
+        if values is None:
+            values = self._timings[name] = deque(maxlen=self._window)
+        values.append(seconds)
+
+
+    def count(self, name, value):
+        '''Records a value of the counter name'''
+        values = self._counters.get(name)
+        if values is None:
+            values = self._counters[name] = deque(maxlen=self._window)
+        values.append(value)
+
+
+    def set_histogram(self, name, histogram):
+        '''Records the latest histogram name, a list of bucket counts'''
+        self._histograms[name] = histogram
+
+
+    def get_summary(self):
+        '''Returns the mean and max milliseconds of each phase, the mean of each
+        counter, and the latest histograms, over the window'''
+        # copied first, the simulation thread may record while this runs
+        timings = {name: list(values) for name, values in list(self._timings.items())}
+        counters = {name: list(values) for name, values in list(self._counters.items())}
+
+        return {
+            'phases': {
+                name: {
+                    'mean_ms': 1000 * sum(values) / len(values),
+                    'max_ms': 1000 * max(values),
+                }
+                for name, values in sorted(timings.items()) if values
+            },
+            'counters': {
+                name: sum(values) / len(values)
+                for name, values in sorted(counters.items()) if values
+            },
+            'histograms': dict(self._histograms),
+        }
+
+
+    def export(self, path, tick=None):
+        '''Appends the summary to path, as a CSV row if it ends in .csv, or else
+        as a line of JSON'''
+        summary = self.get_summary()
+        if not path.endswith('.csv'):
+            with open(path, 'a') as export_file:
+                export_file.write(json.dumps({'time': time.time(), 'tick': tick, **summary}) + '\n')
+            return
+
+        # the histograms do not fit in a row, only their totals are kept
+        row = {'time': time.time(), 'tick': tick}
+        for name, phase in summary['phases'].items():
+            row[f'{name}_mean_ms'] = phase['mean_ms']
+            row[f'{name}_max_ms'] = phase['max_ms']
+        row.update(summary['counters'])
+
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        if new_file:
+            fieldnames = list(row)
+        else:
+            with open(path, newline='') as export_file:
+                fieldnames = next(csv.reader(export_file))
+
+        # phases which first ran after the header was written are left out
+        with open(path, 'a', newline='') as export_file:
+            writer = csv.DictWriter(export_file, fieldnames, extrasaction='ignore')
+            if new_file:
+                writer.writeheader()
+            writer.writerow(row)
+# END class Profiler
+
+class Phase:
+    '''Times a block of code into a profiler'''
+    __slots__ = ('_profiler', '_name', '_start')
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+        self._start = None
+
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self._profiler.record(self._name, time.perf_counter() - self._start)
+        return False
+# END class Phase
+
+class NullPhase:
+    '''Stands in for a Phase while profiling is off'''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        return False
+# END class NullPhase
+
+NULL_PHASE = NullPhase()
+
+# the profiler shared by the engines, the window and the exports
+PROFILER = Profiler()
+
+
+def occupancy_histogram(occupancies):
+    '''Returns how many cells hold 0, 1, 2, ... boids, given the count of each cell'''
+    histogram = [0] * (max(occupancies, default=0) + 1)
+    for occupancy in occupancies:
+        histogram[occupancy] += 1
+    return histogram
@@ -0,0 +1,241 @@
+"""
+Trajectory recordings: every tick of a flock, stored to be replayed later.
+
+A recording is an append-only binary file. It starts with a header, then
+holds one fixed-width record per tick:
+
+    header  magic b'BOIDTRAJ', then little-endian uint32 version, boid count,
+            first tick, and float32 world width and height (28 bytes)
+    record  for each boid, little-endian float32 x, y, theta and color state
+            (16 bytes per boid)
+
+`TrajectoryRecorder` writes the records from a background thread, so that
+recording never holds up the simulation. `TrajectoryReader` memory-maps a
+recording and reads any tick directly, and `Replay` plays it back at any
+speed for the interactive window, without simulating anything.
+"""
+
+import mmap
+import queue
+import struct
+import sys
+import threading
+from array import array
+
+from scheduler import Snapshot
+
+MAGIC = b'BOIDTRAJ'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIff')
+
+# float32 x, y, theta and color state of each boid
+RECORD_FIELDS = 4
+
+
+class TrajectoryRecorder:
+    '''Appends the state of a flock to a recording, once per tick'''
+    def __init__(self, path, boid_count, world_size, first_tick=0):
+        self._boid_count = boid_count
+        self._file = open(path, 'wb')
+        self._file.write(
+            HEADER.pack(MAGIC, VERSION, boid_count, first_tick, world_size[0], world_size[1]))
+
+        # the records are packed and written by the writer thread. The queue
+        # is unbounded, so record() never blocks while the writer catches up
+        self._queue = queue.Queue()
+        self._error = None
+        self._record_count = 0
+        self._writer = threading.Thread(target=self._write, name='recorder', daemon=True)
+        self._writer.start()
+
+
+    def get_record_count(self):
+        '''Returns the number of ticks recorded so far, some may still be queued'''
+        return self._record_count
+
+
+    def record(self, positions, thetas, active):
+        '''Queues a tick to be written. The sequences must not be mutated afterwards'''
+        if self._error is not None:
+            raise RuntimeError('the recording could not be written') from self._error
+        if len(thetas) != self._boid_count:
+            raise ValueError(f'expected {self._boid_count} boids, got {len(thetas)}')
+
+        self._queue.put((positions, thetas, active))
+        self._record_count += 1
+
+
+    def close(self):
+        '''Writes the queued ticks and closes the recording'''
+        if self._file is None:
+            return
+
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+        self._file = None
+
+        if self._error is not None:
+            raise RuntimeError('the recording could not be written') from self._error
+
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is not None:
+                continue
+
+            try:
+                self._file.write(pack_record(*item))
+            except Exception as error:
+                self._error = error
+# END class TrajectoryRecorder
+
+class TrajectoryReader:
+    '''Random access to the ticks of a recording, through a memory map'''
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._map) < HEADER.size:
+            self.close()
+            raise ValueError(f'{path} is too short to be a recording')
+        magic, version, boid_count, first_tick, width, height = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f'{path} is not a version {VERSION} recording')
+
+        self._boid_count = boid_count
+        self._first_tick = first_tick
+        self._world_size = (width, height)
+        self._record_size = 4 * RECORD_FIELDS * boid_count
+
+
+    def get_boid_count(self):
+        '''Returns the number of boids in each tick'''
+        return self._boid_count
+
+
+    def get_world_size(self):
+        '''Returns the (width, height) of the recorded world'''
+        return self._world_size
+
+
+    def get_first_tick(self):
+        '''Returns the simulation tick of the first record'''
+        return self._first_tick
+
+
+    def get_tick_count(self):
+        '''Returns the number of complete ticks in the recording'''
+        if self._record_size == 0:
+            return 0
+        # a recording cut short may end with a partial record, ignored
+        return (len(self._map) - HEADER.size) // self._record_size
+
+
+    def get_frame(self, index):
+        '''Returns the (positions, thetas, active) of the index-th recorded tick'''
+        if not 0 <= index < self.get_tick_count():
+            raise IndexError(f'tick {index} is not in the recording')
+
+        start = HEADER.size + index * self._record_size
+        values = array('f')
+        values.frombytes(self._map[start:start + self._record_size])
+        if sys.byteorder == 'big':
+            values.byteswap()
+
+        positions = list(zip(values[0::RECORD_FIELDS], values[1::RECORD_FIELDS]))
+        thetas = values[2::RECORD_FIELDS].tolist()
+        active = [state != 0 for state in values[3::RECORD_FIELDS]]
+        return positions, thetas, active
+
+
+    def close(self):
+        '''Releases the memory map and the file'''
+        self._map.close()
+        self._file.close()
+# END class TrajectoryReader
+
+class Replay:
+    '''Plays a recording back, at a speed in ticks per second which can be changed'''
+    def __init__(self, reader, speed):
+        self._reader = reader
+        self._speed = speed
+        self._position = 0.0
+        self._frames = {}
+
+
+    def get_reader(self):
+        '''Returns the reader of the recording played'''
+        return self._reader
+
+
+    def get_speed(self):
+        '''Returns the playback speed, in ticks per second'''
+        return self._speed
+
+
+    def set_speed(self, speed):
+        '''Sets the playback speed, in ticks per second, negative plays backwards'''
+        self._speed = speed
+
+
+    def get_position(self):
+        '''Returns the index of the tick shown, with the fraction towards the next one'''
+        return self._position
+
+
+    def seek(self, position):
+        '''Moves to the given tick index, clamped to the recording'''
+        last = max(self._reader.get_tick_count() - 1, 0)
+        self._position = min(max(position, 0.0), float(last))
+
+
+    def advance(self, seconds):
+        '''Moves the playback on by the given number of seconds'''
+        self.seek(self._position + self._speed * seconds)
+
+
+    def get_snapshots(self):
+        '''Returns the (previous, current) snapshots around the playback position,
+        and how far the position is from the first to the second'''
+        index = int(self._position)
+        alpha = self._position - index
+        last = self._reader.get_tick_count() - 1
+        return self._snapshot(index), self._snapshot(min(index + 1, last)), alpha
+
+
+    def _snapshot(self, index):
+        # only the two frames around the playback position are kept
+        snapshot = self._frames.get(index)
+        if snapshot is None:
+            positions, thetas, active = self._reader.get_frame(index)
+            # the time a tick was due is not recorded, nor needed to replay it
+            snapshot = Snapshot(
+                self._reader.get_first_tick() + index, None, positions, thetas, active)
+            self._frames = {
+                kept: frame for kept, frame in self._frames.items()
+                if abs(kept - index) <= 1
+            }
+            self._frames[index] = snapshot
+        return snapshot
+# END class Replay
+
+def pack_record(positions, thetas, active):
+    '''Returns the bytes of the record of a single tick'''
+    if hasattr(thetas, 'tolist'):
+        # numpy arrays from the array engines
+        positions, thetas, active = positions.tolist(), thetas.tolist(), active.tolist()
+
+    values = array('f', [
+        value
+        for (x, y), theta, state in zip(positions, thetas, active)
+        for value in (x, y, theta, state)
+    ])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
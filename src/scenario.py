@@ -0,0 +1,63 @@
+"""
+Seeded scenarios: flocks spawned the same way on every run.
+
+Each spawn pattern draws from a `random.Random` of its own rather than the
+global random module, and `spawn` numbers the boids from 0, so the same seed
+always gives the same flock with the same IDs. This is what makes runs
+comparable, e.g. engines against one another in validate.py, or benchmarks
+against a baseline.
+"""
+
+import random
+from math import pi
+import config
+
+from boid import Boid
+
+SPAWNS = ('uniform', 'clumped')
+
+# clumped flocks spawn around this many centers, with this spread in pixels
+CLUMP_COUNT = 5
+CLUMP_SPREAD = 40
+
+
+def spawn(count, seed, pattern='uniform', world_size=config.WORLD_SIZE):
+    '''Returns a flock of count boids spawned in a pattern from a seed, the
+    same on every run, with IDs from 0. New boids are numbered from count on'''
+    Boid.set_next_id(0)
+    return SPAWNERS[pattern](count, random.Random(seed), world_size)
+
+
+def spawn_uniform(count, rng, world_size=config.WORLD_SIZE):
+    '''Returns boids spread uniformly over the world'''
+    return [
+        Boid(
+            [rng.randint(0, world_size[0]), rng.randint(0, world_size[1])],
+            Boid.get_max_magnitude(),
+            2 * rng.random() * pi
+        ) for _ in range(count)
+    ]
+
+
+def spawn_clumped(count, rng, world_size=config.WORLD_SIZE):
+    '''Returns boids packed in a few dense clumps'''
+    centers = [
+        (rng.uniform(0, world_size[0]), rng.uniform(0, world_size[1]))
+        for _ in range(CLUMP_COUNT)
+    ]
+
+    boids = []
+    for i in range(count):
+        center = centers[i % CLUMP_COUNT]
+        pos = [
+            rng.gauss(center[0], CLUMP_SPREAD) % world_size[0],
+            rng.gauss(center[1], CLUMP_SPREAD) % world_size[1]
+        ]
+        boids.append(Boid(pos, Boid.get_max_magnitude(), 2 * rng.random() * pi))
+    return boids
+
+
+SPAWNERS = {
+    'uniform': spawn_uniform,
+    'clumped': spawn_clumped,
+}
@@ -0,0 +1,178 @@
+"""
+Fixed-timestep scheduling of the simulation, decoupled from rendering.
+
+`SimulationThread` steps a `Simulation` on its own thread, at a fixed number
+of updates per second. It sleeps until each tick is due, and catches up with a
+bounded number of ticks when an update ran late, so the simulation speed does
+not depend on the frame rate. After every tick it publishes an immutable
+`Snapshot` of the flock, which can also be recorded, or streamed.
+
+The render loop only ever reads snapshots. It draws the flock in between the
+last two of them, with `interpolate`, so motion stays smooth even when the
+update and frame rates differ.
+"""
+
+import threading
+import time
+from collections import namedtuple
+from math import pi
+
+# the state of the flock after a tick, and when that tick was due.
+# The sequences are fresh copies, never mutated once published
+Snapshot = namedtuple('Snapshot', ('tick', 'time', 'positions', 'thetas', 'active'))
+
+# ticks run in a row at most to catch up, beyond that the backlog is dropped
+MAX_SUBSTEPS = 5
+
+
+class SimulationThread(threading.Thread):
+    '''Steps a simulation at a fixed timestep, publishing a snapshot after every tick.
+    Every tick is also handed to the record method of each recorder, e.g. a
+    TrajectoryRecorder or a StreamServer'''
+    def __init__(self, sim, ups, max_substeps=MAX_SUBSTEPS, paused=lambda: False,
+                 recorders=()):
+        super().__init__(name='simulation', daemon=True)
+        self._sim = sim
+        self._timestep = 1 / ups
+        self._max_substeps = max_substeps
+        self._paused = paused
+        self._recorders = recorders
+
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._error = None
+        self._dropped_ticks = 0
+
+        # until the first tick, both snapshots show the initial state
+        snapshot = self._take_snapshot(time.perf_counter())
+        self._previous = snapshot
+        self._current = snapshot
+        for recorder in recorders:
+            recorder.record(snapshot.positions, snapshot.thetas, snapshot.active)
+
+
+    def get_timestep(self):
+        '''Returns the simulated seconds per tick'''
+        return self._timestep
+
+
+    def get_dropped_ticks(self):
+        '''Returns how many ticks were skipped because the updates could not keep up'''
+        return self._dropped_ticks
+
+
+    def get_snapshots(self):
+        '''Returns the (previous, current) snapshots, raising if the simulation failed'''
+        if self._error is not None:
+            raise RuntimeError('the simulation thread failed') from self._error
+
+        with self._lock:
+            return self._previous, self._current
+
+
+    def stop(self):
+        '''Stops stepping the simulation and waits for the thread to finish'''
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+
+
+    def run(self):
+        try:
+            self._run()
+        except Exception as error:
+            self._error = error
+
+
+    def _run(self):
+        next_tick = time.perf_counter() + self._timestep
+
+        # wait() doubles as an interruptible sleep until the next tick is due
+        while not self._stopped.wait(max(next_tick - time.perf_counter(), 0)):
+            if self._paused():
+                # resume from now, rather than catching up on the pause
+                next_tick = time.perf_counter() + self._timestep
+                continue
+
+            substeps = 0
+            while next_tick <= time.perf_counter() and substeps < self._max_substeps:
+                self._sim.step()
+                self._publish(self._take_snapshot(next_tick))
+                next_tick += self._timestep
+                substeps += 1
+
+            # too far behind to catch up, drop the backlog instead of spiraling
+            now = time.perf_counter()
+            if next_tick <= now:
+                dropped = int((now - next_tick) // self._timestep) + 1
+                self._dropped_ticks += dropped
+                next_tick += dropped * self._timestep
+
+
+    def _take_snapshot(self, due):
+        return Snapshot(
+            tick=self._sim.get_tick(),
+            time=due,
+            positions=self._sim.get_positions(),
+            thetas=self._sim.get_thetas(),
+            active=self._sim.get_active()
+        )
+
+
+    def _publish(self, snapshot):
+        with self._lock:
+            self._previous = self._current
+            self._current = snapshot
+
+        for recorder in self._recorders:
+            recorder.record(snapshot.positions, snapshot.thetas, snapshot.active)
+# END class SimulationThread
+
+def interpolation_factor(previous, current, now):
+    '''Returns how far now is from the previous snapshot to the current one, in [0, 1]'''
+    # the flock is drawn one tick behind, reaching the current snapshot
+    # one timestep after it was due
+    span = current.time - previous.time
+    if span <= 0:
+        return 1
+    return min(max((now - current.time) / span, 0), 1)
+
+
+def interpolate(previous, current, alpha, world_size):
+    '''Returns the (positions, thetas) a fraction alpha of the way from the
+    previous snapshot to the current one. Boids which wrapped around the
+    world in between are drawn at their current position'''
+    if previous.tick == current.tick or alpha >= 1:
+        return current.positions, current.thetas
+
+    half_width = world_size[0] / 2
+    half_height = world_size[1] / 2
+
+    if hasattr(current.thetas, 'astype'):
+        # numpy arrays from the array engines, interpolated all at once
+        delta = current.positions - previous.positions
+        wrapped = (abs(delta[:, 0]) > half_width) | (abs(delta[:, 1]) > half_height)
+        delta[wrapped] = 0
+        positions = current.positions - (1 - alpha) * delta
+
+        d_theta = current.thetas - previous.thetas
+        d_theta -= 2 * pi * (d_theta / (2 * pi)).round()
+        return positions, current.thetas - (1 - alpha) * d_theta
+
+    beta = 1 - alpha
+    positions = []
+    for (x, y), (prev_x, prev_y) in zip(current.positions, previous.positions):
+        d_x = x - prev_x
+        d_y = y - prev_y
+        if -half_width <= d_x <= half_width and -half_height <= d_y <= half_height:
+            positions.append((x - beta * d_x, y - beta * d_y))
+        else:
+            positions.append((x, y))
+
+    thetas = []
+    for theta, prev_theta in zip(current.thetas, previous.thetas):
+        d_theta = theta - prev_theta
+        d_theta -= 2 * pi * round(d_theta / (2 * pi))
+        thetas.append(theta - beta * d_theta)
+
+    return positions, thetas
@@ -8,4 +8,5 @@ ALIGNMENT = False
 COHESION = False
 
 SHOW_CONFIG = False
+SHOW_PROFILE = False
 PAUSED = False
@@ -0,0 +1,575 @@
+"""
+Headless boid simulation.
+
+`Simulation` owns the flock and advances it one tick at a time, without any
+display. The interactive window in `main.py` drives a `Simulation`, and so can
+scripts which only need the flock's state, e.g.
+
+    sim = Simulation(1000, engine='numpy')
+    sim.set_rules(separation=True, cohesion=True)
+    sim.step(500)
+    positions = sim.get_positions()
+
+Running this module steps a flock as fast as possible and reports the
+update throughput.
+"""
+
+import argparse
+import time
+from collections import namedtuple
+from math import pi
+from random import random, randint
+import sim_state
+import config
+
+from boid import Boid
+from vector_boid import VectorBoid
+from neighbor_index import NEIGHBOR_INDEXES
+from scenario import spawn
+from profiler import PROFILER, occupancy_histogram
+
+ENGINES = ('object', 'numpy', 'parallel', 'jit')
+UPDATE_MODES = ('sequential', 'synchronous')
+
+# the flocking rules, in the order Simulation.set_rules takes them
+RULES = ('separation', 'alignment', 'cohesion')
+
+# the boid class of each heading kernel of the object engine
+HEADING_KERNELS = {
+    'angle': Boid,
+    'vector': VectorBoid,
+}
+
+# the neighbor indexes the array engines can use, the object engine can use any
+ARRAY_NEIGHBOR_INDEXES = {
+    'numpy': ('grid', 'verlet'),
+    'parallel': ('grid',),
+    'jit': ('grid',),
+}
+
+# everything needed to resume a simulation, see Simulation.get_state. The
+# per-boid sequences are lists with the object engine, arrays otherwise
+SimulationState = namedtuple('SimulationState', (
+    'engine', 'update_mode', 'neighbor_index', 'nearest', 'heading_kernel', 'obstacles',
+    'world_size', 'tick', 'rules', 'next_id', 'ids', 'positions', 'magnitudes', 'thetas', 'active'
+))
+
+# a flock as columns, which the array engines take in place of Boid objects,
+# e.g. restored from a checkpoint: the IDs, an (n, 2) array of positions, and
+# the magnitudes and headings
+FlockArrays = namedtuple('FlockArrays', ('ids', 'positions', 'magnitudes', 'thetas'))
+
+
+class Simulation:
+    '''A flock of boids and the rules it follows'''
+    def __init__(self, boid_count=config.BOID_COUNT, engine=config.ENGINE,
+                 world_size=config.WORLD_SIZE, boids=None, update_mode=config.UPDATE_MODE,
+                 workers=config.WORKER_COUNT, neighbor_index=config.NEIGHBOR_INDEX,
+                 nearest=config.NEAREST_NEIGHBORS, heading_kernel=config.HEADING_KERNEL,
+                 seed=None, obstacles=None):
+        if engine not in ENGINES:
+            raise ValueError(f'unknown engine {engine!r}, expected one of {ENGINES}')
+        if update_mode not in UPDATE_MODES:
+            raise ValueError(
+                f'unknown update mode {update_mode!r}, expected one of {UPDATE_MODES}')
+        if neighbor_index not in NEIGHBOR_INDEXES:
+            raise ValueError(f'unknown neighbor index {neighbor_index!r}, '
+                             f'expected one of {tuple(NEIGHBOR_INDEXES)}')
+        if engine != 'object' and neighbor_index not in ARRAY_NEIGHBOR_INDEXES[engine]:
+            raise ValueError(f'the {engine} engine does not support the {neighbor_index} index, '
+                             f'expected one of {ARRAY_NEIGHBOR_INDEXES[engine]}')
+        if nearest is not None and nearest < 1:
+            raise ValueError(f'nearest must be at least 1, or None, not {nearest!r}')
+        if heading_kernel not in HEADING_KERNELS:
+            raise ValueError(f'unknown heading kernel {heading_kernel!r}, '
+                             f'expected one of {tuple(HEADING_KERNELS)}')
+        if engine != 'object' and heading_kernel != 'angle':
+            raise ValueError(f'the {engine} engine only supports the angle heading kernel')
+
+        self._engine = engine
+        self._update_mode = update_mode
+        self._neighbor_index = neighbor_index
+        self._nearest = nearest
+        self._heading_kernel = heading_kernel
+        self._world_size = world_size
+        self._tick = 0
+
+        # the obstacle file, sampled into a field every boid steers by
+        self._obstacles = obstacles
+        self._field = None
+        if obstacles is not None:
+            # only import the obstacles when used, they are not needed to simulate
+            from obstacles import load_field
+            self._field = load_field(obstacles, world_size)
+
+        if boids is None and seed is not None:
+            # the same flock, with the same IDs, on every run with this seed
+            boids = spawn(boid_count, seed, world_size=world_size)
+
+        if isinstance(boids, FlockArrays) and engine == 'object':
+            raise ValueError('the object engine takes Boid objects, not FlockArrays')
+
+        if boids is None:
+            boids = [self.generate_rand_boid() for i in range(boid_count)]
+        elif engine == 'object':
+            # boids of another kernel carry on as boids of this one, keeping their IDs
+            boid_class = HEADING_KERNELS[heading_kernel]
+            boids = [
+                boid if type(boid) is boid_class else boid_class.restore(
+                    boid.get_id(), boid.get_pos(), boid.get_magnitude(), boid.get_theta(),
+                    boid.is_active())
+                for boid in boids
+            ]
+            # the boids wrap around this world, whichever they were made for
+            for boid in boids:
+                boid.set_world_size(world_size)
+        self._ids = None
+        self._index = None
+        self._flock = None
+        if engine == 'object':
+            self._boids = boids
+            self._index = NEIGHBOR_INDEXES[neighbor_index](boids, world_size)
+        else:
+            # the array engines keep the flock in arrays, and no Boid objects
+            self._boids = None
+            if not isinstance(boids, FlockArrays):
+                boids = FlockArrays(
+                    [boid.get_id() for boid in boids], [boid.get_pos() for boid in boids],
+                    [boid.get_magnitude() for boid in boids], [boid.get_theta() for boid in boids])
+            self._ids = boids.ids
+            self._flock = self._build_flock(boids, workers)
+
+
+    def _build_flock(self, arrays, workers):
+        # the flock of an array engine, from FlockArrays
+        args = (arrays.positions, arrays.magnitudes, arrays.thetas, self._world_size)
+        if self._engine == 'numpy':
+            # only import the array engine when used, numpy is an optional dependency
+            from flock import Flock
+            skin = config.VERLET_SKIN if self._neighbor_index == 'verlet' else None
+            return Flock(*args, skin, self._nearest, self._field)
+        if self._engine == 'parallel':
+            from parallel import ParallelFlock
+            return ParallelFlock(*args, workers, self._nearest, self._field)
+        from jit_flock import JitFlock
+        return JitFlock(*args, nearest=self._nearest, field=self._field)
+
+
+    @classmethod
+    def from_state(cls, state, workers=config.WORKER_COUNT):
+        '''Returns a simulation resumed from a SimulationState, restoring the rules too'''
+        if state.engine == 'object':
+            positions = state.positions
+            if hasattr(positions, 'tolist'):
+                # numpy arrays from the array engines
+                positions = positions.tolist()
+
+            boid_class = HEADING_KERNELS[state.heading_kernel]
+            boids = [
+                boid_class.restore(*boid_state) for boid_state in
+                zip(state.ids, positions, state.magnitudes, state.thetas, state.active)
+            ]
+        else:
+            # the array engines take the columns as they are
+            boids = FlockArrays(state.ids, state.positions, state.magnitudes, state.thetas)
+        Boid.set_next_id(state.next_id)
+        cls.set_rules(*state.rules)
+
+        sim = cls(engine=state.engine, world_size=state.world_size, boids=boids,
+                  update_mode=state.update_mode, workers=workers,
+                  neighbor_index=state.neighbor_index, nearest=state.nearest,
+                  heading_kernel=state.heading_kernel, obstacles=state.obstacles)
+        if sim._flock is not None:
+            sim._flock.restore_active(state.active)
+        sim._tick = state.tick
+        return sim
+
+
+    def generate_rand_boid(self):
+        '''Returns a boid at a random position with a random heading'''
+        pos = [randint(0, self._world_size[0]), randint(0, self._world_size[1])]
+        magnitude = Boid.get_max_magnitude()
+        theta = 2 * random() * pi
+
+        return HEADING_KERNELS[self._heading_kernel](pos, magnitude, theta, self._world_size)
+
+
+    def get_engine(self):
+        '''Returns the name of the engine updating the flock'''
+        return self._engine
+
+
+    def get_update_mode(self):
+        '''Returns the update mode of the object engine, the array engines are always synchronous'''
+        return self._update_mode
+
+
+    def get_neighbor_index(self):
+        '''Returns the name of the neighbor index used to find nearby boids'''
+        return self._neighbor_index
+
+
+    def get_nearest(self):
+        '''Returns how many of the nearest boids in view each boid reacts to, None for all'''
+        return self._nearest
+
+
+    def get_heading_kernel(self):
+        '''Returns the name of the heading kernel of the object engine'''
+        return self._heading_kernel
+
+
+    def get_obstacles(self):
+        '''Returns the path of the obstacle file, None without obstacles'''
+        return self._obstacles
+
+
+    def get_obstacle_field(self):
+        '''Returns the obstacles.ObstacleField the boids steer by, None without obstacles'''
+        return self._field
+
+
+    def get_world_size(self):
+        '''Returns the (width, height) of the world'''
+        return self._world_size
+
+
+    def get_tick(self):
+        '''Returns the number of ticks simulated so far'''
+        return self._tick
+
+
+    def get_boid_count(self):
+        '''Returns the number of boids in the flock'''
+        if self._flock is not None:
+            return len(self._flock)
+        return len(self._boids)
+
+
+    def get_boids(self):
+        '''Returns the Boid objects of the object engine, None with the array engines'''
+        return self._boids
+
+
+    def get_positions(self):
+        '''Returns the (x, y) position of each boid'''
+        if self._flock is not None:
+            return self._flock.get_positions()
+        return [boid.get_pos() for boid in self._boids]
+
+
+    def get_thetas(self):
+        '''Returns the heading of each boid'''
+        if self._flock is not None:
+            return self._flock.get_thetas()
+        return [boid.get_theta() for boid in self._boids]
+
+
+    def get_colors(self):
+        '''Returns the color of each boid'''
+        if self._flock is not None:
+            return self._flock.get_colors()
+        return [boid.get_color() for boid in self._boids]
+
+
+    def get_active(self):
+        '''Returns whether each boid saw another boid in its last update'''
+        if self._flock is not None:
+            return self._flock.get_active()
+        return [boid.is_active() for boid in self._boids]
+
+
+    def get_polys(self):
+        '''Returns the rotated poly of each boid, ready to be drawn'''
+        if self._flock is not None:
+            return self._flock.get_polys().tolist()
+        return [boid.get_poly() for boid in self._boids]
+
+
+    @staticmethod
+    def get_rules():
+        '''Returns the (separation, alignment, cohesion) toggles'''
+        return (sim_state.SEPARATION, sim_state.ALIGNMENT, sim_state.COHESION)
+
+
+    @staticmethod
+    def set_rules(separation=None, alignment=None, cohesion=None):
+        '''Turns the given rules on or off, leaving the others as they are'''
+        if separation is not None:
+            sim_state.SEPARATION = separation
+        if alignment is not None:
+            sim_state.ALIGNMENT = alignment
+        if cohesion is not None:
+            sim_state.COHESION = cohesion
+
+
+    @staticmethod
+    def get_boid_constants():
+        '''Returns the constants of the rules followed by the boids, see set_boid_constants'''
+        return {
+            'max_magnitude': Boid.get_max_magnitude(),
+            'view_distance': Boid.get_view_distance(),
+            'view_angle': Boid.get_view_angle(),
+            'd_theta_per_update': Boid.get_d_theta_per_update(),
+        }
+
+
+    @staticmethod
+    def set_boid_constants(max_magnitude=None, view_distance=None, view_angle=None,
+                           d_theta_per_update=None):
+        '''Changes the constants of the rules of every heading kernel, leaving
+        those not given as they are. Simulations read them when built, so
+        only simulations built afterwards follow them entirely'''
+        Boid.configure(max_magnitude, view_distance, view_angle, d_theta_per_update)
+        VectorBoid.configure()
+
+
+    def get_state(self):
+        '''Returns a SimulationState of the whole simulation, to resume it later'''
+        if self._flock is not None:
+            positions = self._flock.get_positions()
+            magnitudes = self._flock.get_magnitudes().copy()
+            thetas = self._flock.get_thetas().copy()
+            active = self._flock.get_active().copy()
+        else:
+            positions = self.get_positions()
+            magnitudes = [boid.get_magnitude() for boid in self._boids]
+            thetas = self.get_thetas()
+            active = self.get_active()
+
+        return SimulationState(
+            engine=self._engine,
+            update_mode=self._update_mode,
+            neighbor_index=self._neighbor_index,
+            nearest=self._nearest,
+            heading_kernel=self._heading_kernel,
+            obstacles=self._obstacles,
+            world_size=tuple(self._world_size),
+            tick=self._tick,
+            rules=self.get_rules(),
+            next_id=Boid.get_next_id(),
+            ids=self._get_ids(),
+            positions=positions,
+            magnitudes=magnitudes,
+            thetas=thetas,
+            active=active
+        )
+
+
+    def close(self):
+        '''Releases the resources held by the engine, e.g. worker processes'''
+        if self._engine == 'parallel':
+            self._flock.close()
+
+
+    def step(self, n=1):
+        '''Advances the simulation by n ticks'''
+        for _ in range(n):
+            self._update()
+            self._tick += 1
+
+
+    def _update(self):
+        # the array engine updates the whole flock at once
+        if self._flock is not None:
+            with PROFILER.phase('update'):
+                self._flock.update()
+            return
+
+        # read the state, in case it changes during execution.
+        rules = self.get_rules()
+        profiling = PROFILER.is_enabled()
+        candidates = 0
+
+        with PROFILER.phase('update'):
+            if self._nearest is not None:
+                # each boid must see all its candidates before it knows which
+                # are the nearest, so pairs cannot be shared between boids
+                synchronous = self._update_mode == 'synchronous'
+                with PROFILER.phase('rules'):
+                    for boid, boid_groups in self._index.neighborhoods():
+                        if profiling:
+                            candidates += sum(len(group) for group in boid_groups) - 1
+                        boid.update(boid_groups, synchronous, self._nearest, self._field)
+
+                if synchronous:
+                    with PROFILER.phase('integrate'):
+                        for boid in self._boids:
+                            boid.swap_buffers()
+            elif self._update_mode == 'synchronous':
+                # every boid reads the state of the previous tick, so each pair of
+                # boids can be evaluated once for both, before any of them moves
+                with PROFILER.phase('begin'):
+                    for boid in self._boids:
+                        boid.begin_update()
+
+                # the neighbor scan and the rules are interleaved pair by pair,
+                # they are timed together
+                with PROFILER.phase('rules'):
+                    if any(rules):
+                        for boid, others in self._index.candidate_pairs():
+                            if profiling:
+                                candidates += 2 * len(others)
+                            for other in others:
+                                boid.interact(other, rules)
+
+                with PROFILER.phase('steer'):
+                    for boid in self._boids:
+                        boid.apply_steering(rules, self._field)
+
+                with PROFILER.phase('integrate'):
+                    for boid in self._boids:
+                        boid.move()
+            else:
+                with PROFILER.phase('rules'):
+                    for boid, boid_groups in self._index.neighborhoods():
+                        if profiling:
+                            candidates += sum(len(group) for group in boid_groups) - 1
+                        boid.update(boid_groups, field=self._field)
+
+            with PROFILER.phase('index'):
+                self._index.refresh()
+
+        if profiling:
+            PROFILER.count('candidates', candidates)
+            PROFILER.count('visible', sum(boid.get_boids_in_view() for boid in self._boids))
+            occupancy = self._index.get_occupancy()
+            if occupancy is not None:
+                PROFILER.set_histogram('occupancy', occupancy_histogram(occupancy))
+
+
+    def _get_ids(self):
+        # the flock never changes, so the IDs are only gathered once. The
+        # array engines keep them from the start
+        if self._ids is None:
+            self._ids = [boid.get_id() for boid in self._boids]
+        return self._ids
+# END class Simulation
+
+def parse_rules(text):
+    '''Returns the names of the rules in a combination like 'separation+cohesion' '''
+    if text == 'none':
+        return ()
+
+    rules = tuple(text.split('+'))
+    for rule in rules:
+        if rule not in RULES:
+            raise ValueError(f'unknown rule {rule!r}, expected one of {RULES}')
+    return rules
+
+
+def non_negative_int(text):
+    '''Parses a count which cannot be negative, like a number of ticks'''
+    value = int(text)
+    if value < 0:
+        raise argparse.ArgumentTypeError(f'{value} is negative')
+    return value
+
+
+def parse_args(args=None):
+    '''Parses the command line arguments of a headless run'''
+    parser = argparse.ArgumentParser(description='Run the boid simulation without a display.')
+    parser.add_argument('-n', '--boids', type=int, default=config.BOID_COUNT,
+                        help='number of boids')
+    parser.add_argument('--world-size', type=int, nargs=2, default=config.WORLD_SIZE,
+                        metavar=('WIDTH', 'HEIGHT'), help='size of the world')
+    parser.add_argument('-t', '--ticks', type=non_negative_int, default=1000,
+                        help='number of ticks to simulate')
+    parser.add_argument('-s', '--seed', type=int,
+                        help='spawn the same flock on every run with this seed')
+    parser.add_argument('-e', '--engine', choices=ENGINES, default=config.ENGINE,
+                        help='engine used to update the flock')
+    parser.add_argument('-w', '--workers', type=int, default=config.WORKER_COUNT,
+                        help='worker processes of the parallel engine (default: one per core)')
+    parser.add_argument('-i', '--neighbor-index', choices=NEIGHBOR_INDEXES,
+                        default=config.NEIGHBOR_INDEX,
+                        help='how nearby boids are found')
+    parser.add_argument('-k', '--nearest', type=int, default=config.NEAREST_NEIGHBORS,
+                        help='only react to this many of the nearest boids in view '
+                             '(default: every boid in view)')
+    parser.add_argument('--heading-kernel', choices=HEADING_KERNELS,
+                        default=config.HEADING_KERNEL,
+                        help='whether boids head along an angle or a unit vector (object engine only)')
+    parser.add_argument('-m', '--update-mode', choices=UPDATE_MODES, default=config.UPDATE_MODE,
+                        help='whether boids see the updates of this tick (object engine only)')
+    parser.add_argument('--obstacles', metavar='PATH',
+                        help='steer around the obstacles and towards the attractors of this '
+                             'JSON file, see obstacles.py')
+    parser.add_argument('--separation', action='store_true', help='enable the separation rule')
+    parser.add_argument('--alignment', action='store_true', help='enable the alignment rule')
+    parser.add_argument('--cohesion', action='store_true', help='enable the cohesion rule')
+    parser.add_argument('--restore', metavar='PATH',
+                        help='resume the simulation saved in this checkpoint, with its engine, '
+                             'rules and flock, instead of starting a new one')
+    parser.add_argument('--checkpoint', metavar='PATH',
+                        help='save the simulation to this checkpoint periodically and at the end')
+    parser.add_argument('--checkpoint-every', type=int, default=1000, metavar='TICKS',
+                        help='ticks between checkpoints')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='profile the phases of each tick, appending a summary to this '
+                             '.csv or JSON lines file periodically')
+    parser.add_argument('--profile-every', type=int, default=100, metavar='TICKS',
+                        help='ticks between profile summaries')
+    parser.add_argument('--record', metavar='PATH',
+                        help='record every tick to this file, to replay it in the window later')
+    return parser.parse_args(args)
+
+
+def run_headless(args):
+    '''Runs a simulation as fast as possible and prints its throughput'''
+    if args.restore:
+        # only import checkpoints when used, they are not needed to simulate
+        import checkpoint
+        sim = checkpoint.load(args.restore, args.workers)
+    else:
+        sim = Simulation(args.boids, args.engine, tuple(args.world_size),
+                         update_mode=args.update_mode,
+                         workers=args.workers, neighbor_index=args.neighbor_index,
+                         nearest=args.nearest, heading_kernel=args.heading_kernel,
+                         seed=args.seed, obstacles=args.obstacles)
+        sim.set_rules(args.separation, args.alignment, args.cohesion)
+
+    if args.checkpoint:
+        import checkpoint
+
+    recorder = None
+    if args.record:
+        # only import the recorder when used, it is not needed to simulate
+        from recording import TrajectoryRecorder
+        recorder = TrajectoryRecorder(
+            args.record, sim.get_boid_count(), sim.get_world_size(), sim.get_tick())
+        recorder.record(sim.get_positions(), sim.get_thetas(), sim.get_active())
+
+    start = time.perf_counter()
+    PROFILER.set_enabled(args.profile is not None)
+
+    if recorder is None and not args.checkpoint and not args.profile:
+        sim.step(args.ticks)
+    else:
+        for _ in range(args.ticks):
+            sim.step()
+            if recorder is not None:
+                recorder.record(sim.get_positions(), sim.get_thetas(), sim.get_active())
+
+            # ticks are counted from the start of the simulation, so a resumed
+            # run keeps checkpointing on the same schedule
+            if args.checkpoint and sim.get_tick() % args.checkpoint_every == 0:
+                checkpoint.save(sim, args.checkpoint)
+
+            if args.profile and sim.get_tick() % args.profile_every == 0:
+                PROFILER.export(args.profile, sim.get_tick())
+    elapsed = time.perf_counter() - start
+
+    if args.checkpoint:
+        checkpoint.save(sim, args.checkpoint)
+    sim.close()
+
+    if recorder is not None:
+        recorder.close()
+
+    print(f'{args.ticks} ticks of {sim.get_boid_count()} boids ({sim.get_engine()}) '
+          f'in {elapsed:.3f}s: {args.ticks / elapsed:.1f} ticks/s')
+
+
+if __name__ == '__main__':
+    run_headless(parse_args())
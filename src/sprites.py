@@ -0,0 +1,96 @@
+"""
+Batched boid rendering.
+
+Rotating and drawing each boid's poly every frame costs a few trigonometric
+calls and allocations per boid. Instead, headings are rounded to one of
+`SPRITE_ANGLES` angles, the poly is drawn once per angle and color into a
+small sprite, and the whole flock is drawn with a single `Surface.blits` call.
+"""
+
+from math import ceil, cos, hypot, pi, sin
+import pygame
+import config
+
+from boid import Boid
+
+
+class SpriteCache:
+    '''Boid sprites, pre-rendered for each color state and rounded heading'''
+    def __init__(self, poly=Boid.get_base_poly(),
+                 colors=(Boid.get_neutral_color(), Boid.get_active_color()),
+                 angles=config.SPRITE_ANGLES):
+        self._poly = poly
+        self._angles = angles
+
+        # the sprites are centered on the boid's position, and big enough to
+        # hold the poly at any angle
+        self._radius = ceil(max(hypot(x, y) for x, y in poly)) + 1
+
+        # all the angles of the first color, then of the next one, and so on
+        self._sprites = [
+            self._render(color, 2 * pi * k / angles)
+            for color in colors
+            for k in range(angles)
+        ]
+
+
+    def get_angle_count(self):
+        '''Returns the number of headings a sprite is rendered for'''
+        return self._angles
+
+
+    def get_radius(self):
+        '''Returns the distance from a sprite's center to its edges'''
+        return self._radius
+
+
+    def get_sprite(self, state, theta):
+        '''Returns the sprite of the given color state closest to the heading theta'''
+        angle = round(theta * self._angles / (2 * pi)) % self._angles
+        return self._sprites[state * self._angles + angle]
+
+
+    def draw(self, surface, positions, thetas, states, doreturn=False):
+        '''Draws every boid onto surface with a single batched blit. The state of
+        a boid is the index of its color, e.g. whether it is active.
+        Returns the rects drawn to when doreturn is set'''
+        scale = self._angles / (2 * pi)
+        angles = self._angles
+        radius = self._radius
+
+        if hasattr(thetas, 'astype'):
+            # numpy arrays from the array engines, indexed all at once
+            indices = ((thetas * scale).round().astype(int) % angles + angles * states).tolist()
+            corners = (positions.astype(int) - radius).tolist()
+        else:
+            indices = [
+                round(theta * scale) % angles + angles * state
+                for theta, state in zip(thetas, states)
+            ]
+            corners = [(int(x) - radius, int(y) - radius) for x, y in positions]
+
+        return surface.blits(
+            zip(map(self._sprites.__getitem__, indices), corners), doreturn=doreturn)
+
+
+    def _render(self, color, theta):
+        size = 2 * self._radius + 1
+
+        # a color key is cheaper to blit than per-pixel alpha
+        key = tuple(255 - channel for channel in color)
+        sprite = pygame.Surface((size, size))
+        sprite.fill(key)
+        sprite.set_colorkey(key, pygame.RLEACCEL)
+
+        cos_t = cos(theta)
+        sin_t = sin(theta)
+        pygame.draw.polygon(sprite, color, [
+            (x * cos_t - y * sin_t + self._radius, x * sin_t + y * cos_t + self._radius)
+            for x, y in self._poly
+        ])
+
+        # match the display's pixel format when there is one, for faster blits
+        if pygame.display.get_surface() is not None:
+            sprite = sprite.convert()
+        return sprite
+# END class SpriteCache
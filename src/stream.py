@@ -0,0 +1,639 @@
+"""
+Live streaming of a simulation to any number of subscribers.
+
+`StreamServer` publishes every tick of a flock over the network, e.g. to
+stream_client.py on another machine of the LAN, raw over TCP on one port and
+as binary WebSocket messages on another. A stream starts with a hello, then
+holds one frame per tick:
+
+    hello   magic b'BOIDSTRM', then little-endian uint32 version, boid count,
+            float32 world width and height, and uint32 scale (28 bytes)
+    frame   little-endian uint32 length of the body, uint8 kind and uint32
+            tick (9 bytes), then the body:
+    key     uint32 x of each boid, then uint32 y, in 1/scale pixels, then
+            uint8 heading, in 1/256 turns (9 bytes per boid)
+    delta   int8 change of x since the last frame, then of y and of heading,
+            wrapping around the world (3 bytes per boid)
+
+Both bodies end with the active flag of each boid, packed 8 to a byte. Over
+WebSocket, the hello and every frame are sent as messages of their own.
+
+Positions are rounded to fixed point, and only sent in full in key frames.
+Boids move a few pixels per tick at most, so after the first key frame every
+frame is a delta, a third of the size of a key frame and about a fifth of the
+size of a recorded tick, unless a change does not fit in a byte.
+
+The simulation never waits on the network. `record` only hands the latest
+tick over to the server's own thread, which encodes whichever tick is latest
+when it gets to it, once for every subscriber. Frames are dropped for a
+subscriber whose connection is backed up, see STREAM_BUFFER_LIMIT, and it
+catches up with a key frame of the latest tick once its connection drains.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import struct
+import sys
+import threading
+import time
+from array import array
+from math import pi
+import config
+
+MAGIC = b'BOIDSTRM'
+VERSION = 1
+HELLO = struct.Struct('<8sIIffI')
+FRAME = struct.Struct('<IBI')
+
+# the kinds of frames
+KEY = 0
+DELTA = 1
+
+# headings are rounded to this many steps per turn
+HEADING_STEPS = 256
+
+TWO_PI = 2 * pi
+
+# as of RFC 6455, hashed with the key of a handshake to accept it
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# the opcodes of the WebSocket messages handled
+WEBSOCKET_BINARY = 0x2
+WEBSOCKET_CLOSE = 0x8
+WEBSOCKET_PING = 0x9
+WEBSOCKET_PONG = 0xA
+
+# subscribers have nothing to send but pings and closes: larger messages are
+# refused, closing the connection with this status, rather than buffered
+WEBSOCKET_MAX_CONTROL = 125
+WEBSOCKET_MAX_MESSAGE = 1024
+WEBSOCKET_TOO_BIG = 1009
+
+
+class FrameEncoder:
+    '''Encodes the ticks of a flock into key and delta frames'''
+    def __init__(self, boid_count, world_size, scale=config.STREAM_SCALE):
+        self._boid_count = boid_count
+        self._scale = scale
+        self._period = quantized_period(world_size, scale)
+
+        # the quantized (xs, ys, headings, flags) of the last tick encoded
+        self._state = None
+        self._tick = None
+        self._previous_tick = None
+        self._key = None
+        self._delta = None
+
+
+    def get_tick(self):
+        '''Returns the last tick encoded, None before the first'''
+        return self._tick
+
+
+    def get_previous_tick(self):
+        '''Returns the tick encoded before the last one, which its delta frame
+        follows on from'''
+        return self._previous_tick
+
+
+    def encode(self, tick, positions, thetas, active):
+        '''Encodes a tick of the flock, replacing the last one'''
+        if len(thetas) != self._boid_count:
+            raise ValueError(f'expected {self._boid_count} boids, got {len(thetas)}')
+
+        state = quantize(positions, thetas, active, self._scale, self._period)
+        previous = self._state
+        self._state = state
+        self._previous_tick = self._tick
+        self._tick = tick
+        self._key = None
+        self._delta = None if previous is None else \
+            encode_delta(tick, previous, state, self._period)
+
+
+    def get_key_frame(self):
+        '''Returns the key frame of the last tick encoded'''
+        if self._key is None:
+            xs, ys, headings, flags = self._state
+            xs = array('I', xs)
+            ys = array('I', ys)
+            if sys.byteorder == 'big':
+                xs.byteswap()
+                ys.byteswap()
+            body = xs.tobytes() + ys.tobytes() + bytes(headings) + flags
+            self._key = FRAME.pack(len(body), KEY, self._tick) + body
+        return self._key
+
+
+    def get_delta_frame(self):
+        '''Returns the delta frame from the previous tick encoded to the last
+        one, None if it would not fit'''
+        return self._delta
+# END class FrameEncoder
+
+class StreamDecoder:
+    '''Rebuilds the flock from the frames of a stream'''
+    def __init__(self, hello):
+        magic, version, boid_count, width, height, scale = HELLO.unpack(hello)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'not a version {VERSION} stream')
+
+        self._boid_count = boid_count
+        self._world_size = (width, height)
+        self._scale = scale
+        self._period = quantized_period(self._world_size, scale)
+
+        self._tick = None
+        self._xs = None
+        self._ys = None
+        self._headings = None
+        self._active = None
+
+
+    def get_boid_count(self):
+        '''Returns the number of boids streamed'''
+        return self._boid_count
+
+
+    def get_world_size(self):
+        '''Returns the (width, height) of the world streamed'''
+        return self._world_size
+
+
+    def get_tick(self):
+        '''Returns the tick of the last frame decoded, None before the first'''
+        return self._tick
+
+
+    def decode(self, kind, tick, body):
+        '''Applies a frame, read with read_frame'''
+        n = self._boid_count
+        if kind == KEY:
+            if len(body) != 9 * n + flags_size(n):
+                raise ValueError(f'key frame of {len(body)} bytes for {n} boids')
+            xs = array('I')
+            xs.frombytes(body[:4 * n])
+            ys = array('I')
+            ys.frombytes(body[4 * n:8 * n])
+            if sys.byteorder == 'big':
+                xs.byteswap()
+                ys.byteswap()
+            headings = list(body[8 * n:9 * n])
+            offset = 9 * n
+        elif kind == DELTA:
+            if self._xs is None:
+                raise ValueError('a delta frame came before any key frame')
+            if len(body) != 3 * n + flags_size(n):
+                raise ValueError(f'delta frame of {len(body)} bytes for {n} boids')
+            deltas = array('b')
+            deltas.frombytes(body[:3 * n])
+            period_x, period_y = self._period
+            xs = [(x + d) % period_x for x, d in zip(self._xs, deltas[:n])]
+            ys = [(y + d) % period_y for y, d in zip(self._ys, deltas[n:2 * n])]
+            headings = [
+                (heading + d) % HEADING_STEPS
+                for heading, d in zip(self._headings, deltas[2 * n:])
+            ]
+            offset = 3 * n
+        else:
+            raise ValueError(f'unknown frame kind {kind}')
+
+        self._xs = xs
+        self._ys = ys
+        self._headings = headings
+        self._active = unpack_flags(body[offset:], n)
+        self._tick = tick
+
+
+    def get_frame(self):
+        '''Returns the (positions, thetas, active) of the last frame decoded'''
+        scale = self._scale
+        positions = [(x / scale, y / scale) for x, y in zip(self._xs, self._ys)]
+        thetas = [heading * TWO_PI / HEADING_STEPS for heading in self._headings]
+        return positions, thetas, self._active
+# END class StreamDecoder
+
+class Subscriber:
+    '''A connection to a subscriber of a stream, raw or over WebSocket'''
+    def __init__(self, writer, websocket=False):
+        self._writer = writer
+        self._websocket = websocket
+        self._tick = None
+
+
+    def get_tick(self):
+        '''Returns the tick of the last frame sent, None before the first'''
+        return self._tick
+
+
+    def is_websocket(self):
+        '''Returns whether the subscriber is connected over WebSocket'''
+        return self._websocket
+
+
+    def is_backed_up(self, limit):
+        '''Returns whether more than limit bytes still wait to be sent'''
+        return self._writer.transport.get_write_buffer_size() > limit
+
+
+    def send(self, data, tick=None, opcode=WEBSOCKET_BINARY):
+        '''Queues data to be sent, without waiting. Frames are given their tick'''
+        if self._websocket:
+            data = websocket_header(len(data), opcode) + data
+        self._writer.write(data)
+        if tick is not None:
+            self._tick = tick
+
+
+    def close(self):
+        '''Closes the connection, once what was queued is sent'''
+        self._writer.close()
+
+
+    def abort(self):
+        '''Closes the connection at once, dropping what was queued'''
+        self._writer.transport.abort()
+# END class Subscriber
+
+class StreamServer:
+    '''Publishes every tick of a flock to the subscribers of a stream, from a
+    thread of its own'''
+    def __init__(self, boid_count, world_size, first_tick=0, host=config.STREAM_HOST,
+                 port=config.STREAM_PORT, websocket_port=config.STREAM_WEBSOCKET_PORT,
+                 scale=config.STREAM_SCALE, buffer_limit=config.STREAM_BUFFER_LIMIT):
+        self._boid_count = boid_count
+        self._hello = HELLO.pack(
+            MAGIC, VERSION, boid_count, world_size[0], world_size[1], scale)
+        self._encoder = FrameEncoder(boid_count, world_size, scale)
+        self._buffer_limit = buffer_limit
+        self._next_tick = first_tick
+
+        # the latest tick recorded, waiting for the server's thread to send it
+        self._lock = threading.Lock()
+        self._latest = None
+        self._scheduled = False
+
+        self._subscribers = set()
+        self._subscriber_count = 0
+        self._dropped_frames = 0
+
+        # the servers are started here, so that e.g. a port in use raises
+        self._loop = asyncio.new_event_loop()
+        self._servers = [self._loop.run_until_complete(
+            asyncio.start_server(self._serve_raw, host, port))]
+        if websocket_port is not None:
+            self._servers.append(self._loop.run_until_complete(
+                asyncio.start_server(self._serve_websocket, host, websocket_port)))
+
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name='stream', daemon=True)
+        self._thread.start()
+
+
+    def get_port(self):
+        '''Returns the port of the raw stream, e.g. the one picked for port 0'''
+        return self._servers[0].sockets[0].getsockname()[1]
+
+
+    def get_websocket_port(self):
+        '''Returns the port of the WebSocket stream, None if not served'''
+        if len(self._servers) < 2:
+            return None
+        return self._servers[1].sockets[0].getsockname()[1]
+
+
+    def get_subscriber_count(self):
+        '''Returns the number of subscribers connected'''
+        return self._subscriber_count
+
+
+    def get_dropped_frames(self):
+        '''Returns how many frames were dropped for backed up subscribers'''
+        return self._dropped_frames
+
+
+    def record(self, positions, thetas, active):
+        '''Publishes a tick, without waiting. The sequences must not be mutated afterwards'''
+        if len(thetas) != self._boid_count:
+            raise ValueError(f'expected {self._boid_count} boids, got {len(thetas)}')
+
+        tick = self._next_tick
+        self._next_tick += 1
+        with self._lock:
+            # a tick not sent yet is stale now, only the latest one is
+            self._latest = (tick, positions, thetas, active)
+            if self._scheduled or self._subscriber_count == 0:
+                return
+            self._scheduled = True
+        self._loop.call_soon_threadsafe(self._broadcast)
+
+
+    def close(self):
+        '''Disconnects the subscribers and stops serving'''
+        if self._loop is None:
+            return
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.run_until_complete(self._shutdown())
+        self._loop.close()
+        self._loop = None
+
+
+    def _broadcast(self):
+        with self._lock:
+            latest = self._latest
+            self._scheduled = False
+        if latest is None or not self._subscribers:
+            return
+
+        # only encoded once, whatever the number of subscribers
+        tick = latest[0]
+        if tick != self._encoder.get_tick():
+            self._encoder.encode(*latest)
+
+        delta = self._encoder.get_delta_frame()
+        for subscriber in self._subscribers:
+            if subscriber.get_tick() == tick:
+                continue
+            if subscriber.is_backed_up(self._buffer_limit):
+                # the subscriber will catch up with a later key frame
+                self._dropped_frames += 1
+                continue
+
+            if delta is not None and subscriber.get_tick() == self._encoder.get_previous_tick():
+                subscriber.send(delta, tick)
+            else:
+                subscriber.send(self._encoder.get_key_frame(), tick)
+
+
+    async def _serve_raw(self, reader, writer):
+        await self._serve(reader, Subscriber(writer))
+
+
+    async def _serve_websocket(self, reader, writer):
+        try:
+            accepted = await accept_websocket(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            accepted = False
+        if not accepted:
+            writer.close()
+            return
+        await self._serve(reader, Subscriber(writer, websocket=True))
+
+
+    async def _serve(self, reader, subscriber):
+        subscriber.send(self._hello)
+        self._subscribers.add(subscriber)
+        self._subscriber_count = len(self._subscribers)
+        # the latest tick is sent right away, even if the simulation is paused
+        self._broadcast()
+
+        try:
+            if subscriber.is_websocket():
+                await read_websocket(reader, subscriber)
+            else:
+                # anything sent by raw subscribers is ignored, until they leave
+                while await reader.read(4096):
+                    pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._subscribers.discard(subscriber)
+            self._subscriber_count = len(self._subscribers)
+            subscriber.close()
+
+
+    async def _shutdown(self):
+        for server in self._servers:
+            server.close()
+        for subscriber in list(self._subscribers):
+            subscriber.abort()
+        for server in self._servers:
+            await server.wait_closed()
+
+        # let the connections see they were closed, e.g. ones still opening
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=1)
+            for task in pending:
+                task.cancel()
+# END class StreamServer
+
+def quantized_period(world_size, scale):
+    '''Returns the period positions wrap around with, in 1/scale pixels, see
+    Boid._enforce_bounds'''
+    return (round((world_size[0] + 1) * scale), round((world_size[1] + 1) * scale))
+
+
+def quantize(positions, thetas, active, scale, period):
+    '''Returns the (xs, ys, headings, flags) of a tick, rounded to fixed point'''
+    if hasattr(thetas, 'tolist'):
+        # numpy arrays from the array engines
+        positions = positions.tolist()
+        thetas = thetas.tolist()
+        active = active.tolist()
+
+    period_x, period_y = period
+    xs = [round(x * scale) % period_x for x, _ in positions]
+    ys = [round(y * scale) % period_y for _, y in positions]
+    headings = [round(theta * HEADING_STEPS / TWO_PI) % HEADING_STEPS for theta in thetas]
+    return xs, ys, headings, pack_flags(active)
+
+
+def encode_delta(tick, previous, state, period):
+    '''Returns the delta frame from one quantized tick to another, None if a
+    change does not fit in a byte'''
+    (previous_xs, previous_ys, previous_headings, _), (xs, ys, headings, flags) = previous, state
+
+    # the shortest change, wrapping around the world like the boids do
+    period_x, period_y = period
+    half_x, half_y = period_x // 2, period_y // 2
+    half_turn = HEADING_STEPS // 2
+    try:
+        deltas = array('b', [(x - p + half_x) % period_x - half_x
+                             for x, p in zip(xs, previous_xs)])
+        deltas.extend([(y - p + half_y) % period_y - half_y for y, p in zip(ys, previous_ys)])
+        deltas.extend([(heading - p + half_turn) % HEADING_STEPS - half_turn
+                       for heading, p in zip(headings, previous_headings)])
+    except OverflowError:
+        return None
+
+    body = deltas.tobytes() + flags
+    return FRAME.pack(len(body), DELTA, tick) + body
+
+
+def flags_size(count):
+    '''Returns the number of bytes count packed flags take'''
+    return (count + 7) // 8
+
+
+def pack_flags(flags):
+    '''Packs booleans 8 to a byte, the first in the lowest bit'''
+    flags = list(flags)
+    packed = bytearray(flags_size(len(flags)))
+    for i, flag in enumerate(flags):
+        if flag:
+            packed[i >> 3] |= 1 << (i & 7)
+    return bytes(packed)
+
+
+def unpack_flags(packed, count):
+    '''Returns the count booleans packed by pack_flags'''
+    return [bool(packed[i >> 3] >> (i & 7) & 1) for i in range(count)]
+
+
+def read_exactly(stream, size):
+    '''Reads size bytes from a binary file, e.g. a socket's, None at its end'''
+    data = stream.read(size)
+    if len(data) < size:
+        return None
+    return data
+
+
+def read_hello(stream):
+    '''Returns a decoder for the stream read from a binary file'''
+    hello = read_exactly(stream, HELLO.size)
+    if hello is None:
+        raise ValueError('the stream ended before its hello')
+    return StreamDecoder(hello)
+
+
+def read_frame(stream):
+    '''Returns the (kind, tick, body) of the next frame of a binary file, None
+    at the end of the stream'''
+    header = read_exactly(stream, FRAME.size)
+    if header is None:
+        return None
+    length, kind, tick = FRAME.unpack(header)
+    body = read_exactly(stream, length)
+    if body is None:
+        return None
+    return kind, tick, body
+
+
+def websocket_header(length, opcode=WEBSOCKET_BINARY):
+    '''Returns the header of an unfragmented, unmasked WebSocket message'''
+    if length < 126:
+        return struct.pack('>BB', 0x80 | opcode, length)
+    if length < 1 << 16:
+        return struct.pack('>BBH', 0x80 | opcode, 126, length)
+    return struct.pack('>BBQ', 0x80 | opcode, 127, length)
+
+
+async def accept_websocket(reader, writer):
+    '''Answers the HTTP handshake opening a WebSocket, returns whether it was one'''
+    request = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+    key = None
+    for line in request.split('\r\n')[1:]:
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'sec-websocket-key':
+            key = value.strip()
+
+    if key is None:
+        writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+        return False
+
+    accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+    writer.write(('HTTP/1.1 101 Switching Protocols\r\n'
+                  'Upgrade: websocket\r\n'
+                  'Connection: Upgrade\r\n'
+                  f'Sec-WebSocket-Accept: {accept}\r\n\r\n').encode())
+    return True
+
+
+async def read_websocket(reader, subscriber):
+    '''Reads the messages of a WebSocket subscriber until it closes, answering
+    pings. Anything else it sends is ignored, and messages too large for
+    anything it should send close the connection'''
+    while True:
+        head = await reader.readexactly(2)
+        opcode = head[0] & 0x0F
+        length = head[1] & 0x7F
+        if length == 126:
+            length = struct.unpack('>H', await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('>Q', await reader.readexactly(8))[0]
+
+        # control messages have opcodes from 0x8
+        if length > (WEBSOCKET_MAX_CONTROL if opcode & 0x8 else WEBSOCKET_MAX_MESSAGE):
+            subscriber.send(struct.pack('>H', WEBSOCKET_TOO_BIG), opcode=WEBSOCKET_CLOSE)
+            return
+        mask = await reader.readexactly(4) if head[1] & 0x80 else bytes(4)
+        payload = await reader.readexactly(length)
+
+        if opcode == WEBSOCKET_CLOSE:
+            subscriber.send(b'', opcode=WEBSOCKET_CLOSE)
+            return
+        if opcode == WEBSOCKET_PING:
+            subscriber.send(
+                bytes(b ^ mask[i % 4] for i, b in enumerate(payload)), opcode=WEBSOCKET_PONG)
+
+
+def parse_args(args=None):
+    '''Parses the command line arguments of a streaming server'''
+    # only imported to serve from the command line
+    from simulation import ENGINES, RULES, parse_rules
+
+    parser = argparse.ArgumentParser(
+        description='Run the boid simulation without a display, streaming it to subscribers.')
+    parser.add_argument('-n', '--boids', type=int, default=config.BOID_COUNT,
+                        help='number of boids')
+    parser.add_argument('--world-size', type=int, nargs=2, default=config.WORLD_SIZE,
+                        metavar=('WIDTH', 'HEIGHT'), help='size of the world')
+    parser.add_argument('-e', '--engine', choices=ENGINES, default=config.ENGINE,
+                        help='engine used to update the flock')
+    parser.add_argument('-s', '--seed', type=int,
+                        help='spawn the same flock on every run with this seed')
+    parser.add_argument('-r', '--rules', default='+'.join(RULES),
+                        help="the active rules, like 'separation+cohesion', or 'none'")
+    parser.add_argument('-u', '--ups', type=int, default=60, help='ticks per second')
+    parser.add_argument('--host', default=config.STREAM_HOST,
+                        help="address to serve on, '0.0.0.0' for the whole LAN")
+    parser.add_argument('-p', '--port', type=int, default=config.STREAM_PORT,
+                        help='port of the raw TCP stream')
+    parser.add_argument('--websocket-port', type=int, default=config.STREAM_WEBSOCKET_PORT,
+                        help='port of the WebSocket stream')
+    args = parser.parse_args(args)
+
+    try:
+        parse_rules(args.rules)
+    except ValueError as error:
+        parser.error(str(error))
+    return args
+
+
+def main(args):
+    # only imported to serve from the command line
+    from scheduler import SimulationThread
+    from simulation import RULES, Simulation, parse_rules
+
+    world_size = tuple(args.world_size)
+    sim = Simulation(args.boids, args.engine, world_size, seed=args.seed)
+    rules = parse_rules(args.rules)
+    sim.set_rules(*(rule in rules for rule in RULES))
+
+    server = StreamServer(sim.get_boid_count(), world_size, sim.get_tick(), args.host,
+                          args.port, args.websocket_port)
+    sim_thread = SimulationThread(sim, args.ups, recorders=(server,))
+    sim_thread.start()
+    print(f'Streaming {sim.get_boid_count()} boids on {args.host}:{server.get_port()}, '
+          f'WebSocket on port {server.get_websocket_port()}. Ctrl+C to stop')
+
+    try:
+        while sim_thread.is_alive():
+            time.sleep(0.5)
+        # the simulation failed, raise its error
+        sim_thread.get_snapshots()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim_thread.stop()
+        server.close()
+        sim.close()
+
+
+if __name__ == '__main__':
+    main(parse_args())
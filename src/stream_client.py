@@ -0,0 +1,141 @@
+"""
+A minimal viewer of a streamed simulation, see stream.py.
+
+Connects to a `StreamServer`, e.g. `python main.py --stream` or
+`python stream.py` on another machine, and draws the latest frame received,
+scaled to fit the window. Frames are read on a background thread, so the
+window keeps responding whatever the network does, and a frame which arrives
+while another is drawn simply replaces the next one.
+"""
+
+import argparse
+import socket
+import threading
+import time
+import pygame
+from pygame.locals import *
+from config import *
+
+from camera import Camera
+from sprites import SpriteCache
+from stream import read_frame, read_hello
+
+FPS = 60  # frames per second
+
+
+class StreamReader(threading.Thread):
+    '''Reads the frames of a stream from a socket, keeping the latest one'''
+    def __init__(self, connection):
+        super().__init__(name='stream', daemon=True)
+        self._connection = connection
+        self._file = connection.makefile('rb')
+        self._decoder = read_hello(self._file)
+
+        self._lock = threading.Lock()
+        self._frame = None
+        self._tick = None
+        self._error = None
+
+
+    def get_world_size(self):
+        '''Returns the (width, height) of the world streamed'''
+        return self._decoder.get_world_size()
+
+
+    def get_frame(self):
+        '''Returns the tick and (positions, thetas, active) of the latest frame,
+        or None before the first, raising if the stream failed'''
+        if self._error is not None:
+            raise RuntimeError('the stream could not be read') from self._error
+
+        with self._lock:
+            return self._tick, self._frame
+
+
+    def run(self):
+        try:
+            while True:
+                frame = read_frame(self._file)
+                if frame is None:
+                    break
+                self._decoder.decode(*frame)
+
+                frame = self._decoder.get_frame()
+                with self._lock:
+                    self._tick = self._decoder.get_tick()
+                    self._frame = frame
+        except (OSError, ValueError) as error:
+            self._error = error
+        finally:
+            self._file.close()
+
+
+    def close(self):
+        '''Disconnects from the stream'''
+        self._connection.close()
+# END class StreamReader
+
+def view_loop(reader, screen, sprites, camera):
+    frame_time = 1 / FPS
+    next_frame = time.perf_counter()
+    drawn_tick = None
+
+    while True:
+        pygame.event.pump()
+        keys = pygame.key.get_pressed()
+        if keys[K_ESCAPE] or keys[K_q] or pygame.QUIT in (e.type for e in pygame.event.get()):
+            break
+        if not reader.is_alive():
+            print('The stream ended')
+            reader.get_frame()
+            break
+
+        # only draw when a new frame came in
+        tick, frame = reader.get_frame()
+        if tick != drawn_tick:
+            positions, thetas, active = camera.view(*frame, sprites.get_radius())
+            screen.fill(BG_COLOR)
+            sprites.draw(screen, positions, thetas, active)
+            pygame.display.flip()
+            pygame.display.set_caption(f'Boids Stream - tick {tick}')
+            drawn_tick = tick
+
+        # sleep until the next frame is due
+        next_frame += frame_time
+        delay = next_frame - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_frame = time.perf_counter()
+
+
+def parse_args(args=None):
+    '''Parses the command line arguments of the viewer'''
+    parser = argparse.ArgumentParser(description='View a streamed boid simulation.')
+    parser.add_argument('--host', default=STREAM_HOST, help='address of the server')
+    parser.add_argument('-p', '--port', type=int, default=STREAM_PORT,
+                        help='port of the raw TCP stream')
+    return parser.parse_args(args)
+
+
+def main(args):
+    connection = socket.create_connection((args.host, args.port))
+    reader = StreamReader(connection)
+    reader.start()
+
+    pygame.init()
+    screen = pygame.display.set_mode(SCREEN_SIZE)
+    pygame.display.set_caption('Boids Stream')
+    screen.fill(BG_COLOR)
+    pygame.display.flip()
+
+    try:
+        view_loop(reader, screen, SpriteCache(), Camera(reader.get_world_size()))
+    finally:
+        reader.close()
+        pygame.display.quit()
+        pygame.quit()
+
+
+if __name__ == '__main__':
+    main(parse_args())
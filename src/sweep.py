@@ -0,0 +1,296 @@
+"""
+Parameter sweeps over many headless simulations.
+
+Runs every combination of the given parameter values, once per seed, each
+as its own headless `Simulation`, spread over a pool of processes, and
+collects summary metrics of every run into one results table, e.g.
+
+    python sweep.py --param view_distance=50,75,100 --param view_angle=1.57,2.36 \\
+        --seeds 0 1 2 3 --ticks 2000 --output sweep.csv
+
+The metrics are averaged over samples taken every --sample-every ticks once
+the first --warmup ticks are done:
+ - polarization: the length of the mean heading, 1 when every boid heads the
+   same way, close to 0 when headings are random
+ - clusters: the number of groups of boids, linked by boids within view
+   distance of one another
+ - mean_neighbors: the mean number of other boids within view distance
+while ticks_per_second only times the ticks, not the sampling. Rows are
+written as runs finish, so an interrupted sweep keeps the runs it finished.
+"""
+
+import argparse
+import csv
+import functools
+import itertools
+import json
+import time
+from math import cos, sin
+from multiprocessing import Pool
+import config
+
+from neighbor_index import wrapped_difference
+from simulation import Simulation, HEADING_KERNELS, RULES, non_negative_int, parse_rules
+
+# the parameters which can be swept, and how their values are parsed. Rules
+# are combined like 'separation+cohesion', or 'none', and nearest 0 reacts
+# to every boid in view
+PARAMETERS = {
+    'boids': int,
+    'max_magnitude': float,
+    'view_distance': float,
+    'view_angle': float,
+    'd_theta_per_update': float,
+    'nearest': int,
+    'rules': str,
+}
+
+# values of the parameters not swept
+DEFAULTS = {
+    'boids': config.BOID_COUNT,
+    **Simulation.get_boid_constants(),
+    'nearest': config.NEAREST_NEIGHBORS or 0,
+    'rules': '+'.join(RULES),
+}
+
+# the parallel engine would compete with the pool for the cores
+SWEEP_ENGINES = ('object', 'numpy')
+
+METRICS = ('polarization', 'clusters', 'mean_neighbors', 'ticks_per_second')
+
+
+def parse_param(text):
+    '''Parses a NAME=V1,V2,... argument into (name, [values])'''
+    name, _, values = text.partition('=')
+    if name not in PARAMETERS:
+        raise argparse.ArgumentTypeError(
+            f'unknown parameter {name!r}, expected one of {tuple(PARAMETERS)}')
+    if not values:
+        raise argparse.ArgumentTypeError(f'no values given for {name}')
+
+    try:
+        values = [PARAMETERS[name](value) for value in values.split(',')]
+        if name == 'rules':
+            for value in values:
+                parse_rules(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(f'invalid value for {name}: {error}')
+    return name, values
+
+
+def expand_runs(grid, seeds):
+    '''Returns the settings of every run: each combination of the values of
+    the grid, a dict of parameter names to lists of values, with each seed'''
+    runs = []
+    for values in itertools.product(*grid.values()):
+        for seed in seeds:
+            runs.append({'run': len(runs), 'seed': seed, **DEFAULTS, **dict(zip(grid, values))})
+    return runs
+
+
+def run(settings, engine, heading_kernel, ticks, warmup, sample_every):
+    '''Runs a single simulation of the sweep, and returns its settings with its metrics'''
+    # each process runs many simulations, every constant is set every time
+    Simulation.set_boid_constants(
+        settings['max_magnitude'], settings['view_distance'], settings['view_angle'],
+        settings['d_theta_per_update'])
+
+    sim = Simulation(settings['boids'], engine, nearest=settings['nearest'] or None,
+                     heading_kernel=heading_kernel, seed=settings['seed'])
+    rules = parse_rules(settings['rules'])
+    sim.set_rules(*(rule in rules for rule in RULES))
+
+    samples = []
+    elapsed = 0
+    for tick in range(1, ticks + 1):
+        start = time.perf_counter()
+        sim.step()
+        elapsed += time.perf_counter() - start
+
+        if tick > warmup and (tick - warmup) % sample_every == 0:
+            samples.append(measure(sim, settings['view_distance']))
+
+    # too short a run to sample, the final state will do
+    if not samples:
+        samples.append(measure(sim, settings['view_distance']))
+    sim.close()
+
+    return {
+        **settings,
+        'engine': engine,
+        'heading_kernel': heading_kernel,
+        'ticks': ticks,
+        'polarization': sum(sample[0] for sample in samples) / len(samples),
+        'clusters': sum(sample[1] for sample in samples) / len(samples),
+        'mean_neighbors': sum(sample[2] for sample in samples) / len(samples),
+        'ticks_per_second': ticks / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def measure(sim, view_distance):
+    '''Returns the (polarization, clusters, mean neighbors) of a simulation's flock'''
+    positions = sim.get_positions()
+    thetas = sim.get_thetas()
+    if hasattr(thetas, 'tolist'):
+        # numpy arrays from the array engines
+        positions, thetas = positions.tolist(), thetas.tolist()
+
+    clusters, mean_neighbors = flock_structure(positions, view_distance, sim.get_world_size())
+    return polarization(thetas), clusters, mean_neighbors
+
+
+def polarization(thetas):
+    '''Returns the length of the mean heading, from 0 to 1 when all headings agree'''
+    if not thetas:
+        return 0.0
+    sum_x = sum(cos(theta) for theta in thetas)
+    sum_y = sum(sin(theta) for theta in thetas)
+    return (sum_x * sum_x + sum_y * sum_y) ** 0.5 / len(thetas)
+
+
+def flock_structure(positions, radius, world_size):
+    '''Returns the number of clusters of boids linked by boids within radius
+    of one another, and the mean number of other boids within radius of each,
+    measured the shortest way around the world'''
+    count = len(positions)
+    if count == 0:
+        return 0, 0.0
+
+    # positions wrap around with this period, see Boid._enforce_bounds
+    period = (world_size[0] + 1, world_size[1] + 1)
+
+    # cells at least radius wide, tiling the world exactly so that
+    # neighboring cells wrap around correctly
+    grid_width = max(int(period[0] // radius), 1)
+    grid_height = max(int(period[1] // radius), 1)
+    cell_width = period[0] / grid_width
+    cell_height = period[1] / grid_height
+    cells = {}
+    for index, pos in enumerate(positions):
+        key = (int(pos[0] // cell_width) % grid_width, int(pos[1] // cell_height) % grid_height)
+        cells.setdefault(key, []).append(index)
+
+    # union-find of the clusters, every pair within radius joins two
+    parents = list(range(count))
+    squared_radius = radius * radius
+    neighbors = 0
+    for (c_x, c_y), cell in cells.items():
+        # each distinct neighboring cell once, even on tiny grids
+        keys = {
+            ((c_x + d_x) % grid_width, (c_y + d_y) % grid_height)
+            for d_x in (-1, 0, 1)
+            for d_y in (-1, 0, 1)
+        }
+        others = [index for key in keys for index in cells.get(key, ())]
+
+        for index in cell:
+            x, y = positions[index]
+            for other in others:
+                if other <= index:
+                    continue
+
+                d_x = wrapped_difference(positions[other][0] - x, period[0])
+                d_y = wrapped_difference(positions[other][1] - y, period[1])
+                if d_x * d_x + d_y * d_y > squared_radius:
+                    continue
+
+                neighbors += 2
+                root, other_root = find_root(parents, index), find_root(parents, other)
+                if root != other_root:
+                    parents[other_root] = root
+
+    clusters = sum(1 for index in range(count) if find_root(parents, index) == index)
+    return clusters, neighbors / count
+
+
+def find_root(parents, index):
+    '''Returns the root of index in a union-find forest, halving the path to it'''
+    while parents[index] != index:
+        parents[index] = parents[parents[index]]
+        index = parents[index]
+    return index
+
+
+class ResultsWriter:
+    '''Writes the rows of the results table as they come, as CSV if the path
+    ends in .csv, or else as lines of JSON'''
+    def __init__(self, path, fieldnames):
+        self._file = open(path, 'w', newline='')
+        self._writer = None
+        if path.endswith('.csv'):
+            self._writer = csv.DictWriter(self._file, fieldnames)
+            self._writer.writeheader()
+
+
+    def write(self, row):
+        '''Writes a row, flushed so that it survives an interrupted sweep'''
+        if self._writer is not None:
+            self._writer.writerow(row)
+        else:
+            self._file.write(json.dumps(row) + '\n')
+        self._file.flush()
+
+
+    def close(self):
+        '''Closes the results file'''
+        self._file.close()
+# END class ResultsWriter
+
+def parse_args(args=None):
+    '''Parses the command line arguments of a sweep'''
+    parser = argparse.ArgumentParser(
+        description='Run headless simulations over a grid of parameters in parallel.')
+    parser.add_argument('-p', '--param', type=parse_param, action='append', default=[],
+                        metavar='NAME=V1,V2,...',
+                        help=f'values of a parameter to sweep, one of {", ".join(PARAMETERS)}. '
+                             'Every combination of the values is run')
+    parser.add_argument('-s', '--seeds', type=int, nargs='+', default=[0],
+                        help='seeds of the spawned flocks, each combination runs once per seed')
+    parser.add_argument('-t', '--ticks', type=non_negative_int, default=1000,
+                        help='ticks simulated per run')
+    parser.add_argument('--warmup', type=non_negative_int, default=200,
+                        help='ticks before the metrics are sampled, while the flock forms')
+    parser.add_argument('--sample-every', type=int, default=50, metavar='TICKS',
+                        help='ticks between samples of the metrics')
+    parser.add_argument('-e', '--engine', choices=SWEEP_ENGINES, default='object',
+                        help='engine updating each flock')
+    parser.add_argument('--heading-kernel', choices=HEADING_KERNELS,
+                        default=config.HEADING_KERNEL,
+                        help='heading kernel of the object engine')
+    parser.add_argument('-j', '--processes', type=int, default=config.WORKER_COUNT,
+                        help='simulations run at once (default: one per core)')
+    parser.add_argument('-o', '--output', default='sweep.csv',
+                        help='results table, CSV if it ends in .csv, or else JSON lines')
+    return parser.parse_args(args)
+
+
+def main(args):
+    grid = dict(args.param)
+    runs = expand_runs(grid, args.seeds)
+    run_one = functools.partial(
+        run, engine=args.engine, heading_kernel=args.heading_kernel, ticks=args.ticks,
+        warmup=args.warmup, sample_every=args.sample_every)
+
+    fieldnames = ['run', 'seed', *PARAMETERS, 'engine', 'heading_kernel', 'ticks', *METRICS]
+    writer = ResultsWriter(args.output, fieldnames)
+    print(f'Running {len(runs)} simulations . . . ')
+
+    start = time.perf_counter()
+    try:
+        with Pool(args.processes) as pool:
+            # each run is a task of its own, handed to whichever process is free
+            for done, result in enumerate(pool.imap_unordered(run_one, runs, chunksize=1), 1):
+                writer.write(result)
+                print(f"[{done}/{len(runs)}] run {result['run']}: "
+                      f"polarization {result['polarization']:.2f}, "
+                      f"clusters {result['clusters']:.1f}, "
+                      f"neighbors {result['mean_neighbors']:.1f}, "
+                      f"{result['ticks_per_second']:.1f} ticks/s")
+    finally:
+        writer.close()
+
+    print(f'Done in {time.perf_counter() - start:.1f}s, results in {args.output}')
+
+
+if __name__ == '__main__':
+    main(parse_args())
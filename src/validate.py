@@ -0,0 +1,210 @@
+"""
+Golden-trajectory checks of the faster engines against the reference.
+
+Runs the reference, the object engine updating each `Boid` in synchronous
+mode through the grid index, and every candidate engine from the same seeded
+flock, tick by tick, and measures how far apart they drift: the largest
+distance between the positions of the same boid, the shortest way around the
+world, and the largest difference of heading. A candidate fails from the
+first tick either exceeds its tolerance, e.g.
+
+    python validate.py --candidates numpy numpy:verlet parallel jit --ticks 100
+
+Candidates are named ENGINE[:OPTION...], with options naming a neighbor
+index or heading kernel, e.g. object:quadtree or object:vector. The exit
+status is 1 if any candidate failed.
+
+Only synchronous updates can be compared: in sequential mode every boid sees
+the boids updated before it, in an order which depends on the index. The
+vector heading kernel is equivalent to the reference rather than identical,
+it is expected to drift apart. So are any two engines given long enough:
+they differ by rounding errors of around 1e-13 pixels, which flocking
+amplifies about tenfold every dozen ticks in a dense flock, hence tolerances
+rather than exact comparisons, over a horizon of a hundred or so ticks.
+"""
+
+import argparse
+import sys
+from math import hypot
+import config
+
+from boid import normalize_angle
+from neighbor_index import NEIGHBOR_INDEXES, wrapped_difference
+from scenario import SPAWNS, spawn
+from simulation import Simulation, ENGINES, HEADING_KERNELS, RULES, parse_rules
+from sweep import ResultsWriter
+
+REFERENCE = 'object'
+
+# every other path through the engines, indexes and caches
+CANDIDATES = (
+    'object:sparse', 'object:quadtree', 'object:verlet', 'numpy', 'numpy:verlet', 'parallel',
+    'jit')
+
+
+def parse_candidate(text):
+    '''Parses an ENGINE[:OPTION...] argument into the settings of a simulation'''
+    engine, *options = text.split(':')
+    if engine not in ENGINES:
+        raise argparse.ArgumentTypeError(f'unknown engine {engine!r}, expected one of {ENGINES}')
+
+    candidate = {
+        'name': text,
+        'engine': engine,
+        'neighbor_index': 'grid',
+        'heading_kernel': 'angle',
+    }
+    for option in options:
+        if option in NEIGHBOR_INDEXES:
+            candidate['neighbor_index'] = option
+        elif option in HEADING_KERNELS:
+            candidate['heading_kernel'] = option
+        else:
+            raise argparse.ArgumentTypeError(
+                f'unknown option {option!r} of {text}, expected a neighbor index '
+                f'{tuple(NEIGHBOR_INDEXES)} or heading kernel {tuple(HEADING_KERNELS)}')
+    return candidate
+
+
+def build(candidate, args):
+    '''Returns the simulation of a candidate, on the seeded flock of the run'''
+    world_size = tuple(args.world_size)
+    sim = Simulation(
+        boids=spawn(args.boids, args.seed, args.spawn, world_size),
+        engine=candidate['engine'], world_size=world_size, update_mode='synchronous',
+        workers=args.workers, neighbor_index=candidate['neighbor_index'],
+        nearest=args.nearest, heading_kernel=candidate['heading_kernel'],
+        obstacles=args.obstacles)
+
+    rules = parse_rules(args.rules)
+    sim.set_rules(*(rule in rules for rule in RULES))
+    return sim
+
+
+def divergence(reference, candidate):
+    '''Returns the largest distance between the positions of the same boid in
+    two simulations, the shortest way around the world, and the largest
+    difference of heading'''
+    width, height = reference.get_world_size()
+    positions = as_list(reference.get_positions())
+    other_positions = as_list(candidate.get_positions())
+
+    position = 0.0
+    for (x, y), (o_x, o_y) in zip(positions, other_positions):
+        position = max(position, hypot(
+            wrapped_difference(o_x - x, width + 1), wrapped_difference(o_y - y, height + 1)))
+
+    heading = 0.0
+    for theta, o_theta in zip(as_list(reference.get_thetas()), as_list(candidate.get_thetas())):
+        heading = max(heading, abs(normalize_angle(o_theta - theta)))
+
+    return position, heading
+
+
+def as_list(values):
+    '''Returns the values as lists, from numpy arrays or any sequence'''
+    if hasattr(values, 'tolist'):
+        return values.tolist()
+    return list(values)
+
+
+def parse_args(args=None):
+    '''Parses the command line arguments of a validation run'''
+    parser = argparse.ArgumentParser(
+        description='Check the faster engines follow the trajectories of the reference.')
+    parser.add_argument('-c', '--candidates', type=parse_candidate, nargs='+',
+                        default=[parse_candidate(name) for name in CANDIDATES],
+                        metavar='ENGINE[:OPTION]',
+                        help='engines compared to the reference, optionally with a neighbor '
+                             f'index or heading kernel (default: {" ".join(CANDIDATES)})')
+    parser.add_argument('-n', '--boids', type=int, default=300, help='number of boids')
+    parser.add_argument('--spawn', choices=SPAWNS, default=SPAWNS[0],
+                        help='how the flock is spawned')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the spawned flock')
+    parser.add_argument('--world-size', type=int, nargs=2, default=config.WORLD_SIZE,
+                        metavar=('WIDTH', 'HEIGHT'), help='size of the world')
+    parser.add_argument('-t', '--ticks', type=int, default=100, help='ticks compared')
+    parser.add_argument('-r', '--rules', default='+'.join(RULES),
+                        help="the active rules, like 'separation+cohesion', or 'none'")
+    parser.add_argument('-k', '--nearest', type=int, default=config.NEAREST_NEIGHBORS,
+                        help='only react to this many of the nearest boids in view '
+                             '(default: every boid in view)')
+    parser.add_argument('--obstacles', metavar='PATH',
+                        help='steer every engine by the obstacles and attractors of this file. '
+                             'Flocks crowding around attractors drift apart sooner, compare '
+                             'fewer ticks')
+    parser.add_argument('--position-tolerance', type=float, default=1e-6, metavar='PIXELS',
+                        help='largest distance allowed between the positions of a boid')
+    parser.add_argument('--heading-tolerance', type=float, default=1e-6, metavar='RADIANS',
+                        help='largest difference allowed between the headings of a boid')
+    parser.add_argument('-w', '--workers', type=int, default=config.WORKER_COUNT,
+                        help='worker processes of the parallel engine (default: one per core)')
+    parser.add_argument('-o', '--output',
+                        help='write the divergence of every candidate at every tick to this '
+                             'file, CSV if it ends in .csv, or else JSON lines')
+    args = parser.parse_args(args)
+
+    try:
+        parse_rules(args.rules)
+    except ValueError as error:
+        parser.error(str(error))
+    return args
+
+
+def main(args):
+    reference = build(parse_candidate(REFERENCE), args)
+    candidates = []
+    writer = None
+    try:
+        for candidate in args.candidates:
+            try:
+                candidates.append((candidate, build(candidate, args)))
+            except ValueError as error:
+                # e.g. an index the engine does not support
+                raise SystemExit(f"{candidate['name']}: {error}")
+
+        if args.output:
+            writer = ResultsWriter(args.output, ['candidate', 'tick', 'position', 'heading'])
+
+        # the worst divergence of each candidate, and the first tick it failed
+        worst = {candidate['name']: [0.0, 0, 0.0, 0] for candidate, _ in candidates}
+        failed = {}
+        for tick in range(1, args.ticks + 1):
+            reference.step()
+            for candidate, sim in candidates:
+                sim.step()
+                position, heading = divergence(reference, sim)
+                if writer is not None:
+                    writer.write({'candidate': candidate['name'], 'tick': tick,
+                                  'position': position, 'heading': heading})
+
+                name = candidate['name']
+                if position > worst[name][0]:
+                    worst[name][0:2] = [position, tick]
+                if heading > worst[name][2]:
+                    worst[name][2:4] = [heading, tick]
+                if name not in failed and (position > args.position_tolerance or
+                                           heading > args.heading_tolerance):
+                    failed[name] = tick
+    finally:
+        reference.close()
+        for _, sim in candidates:
+            sim.close()
+        if writer is not None:
+            writer.close()
+
+    print(f'{args.ticks} ticks of {args.boids} {args.spawn} boids, seed {args.seed}, '
+          f'rules {args.rules}, against the object engine in synchronous mode')
+    for candidate, _ in candidates:
+        name = candidate['name']
+        position, position_tick, heading, heading_tick = worst[name]
+        status = f'FAILED at tick {failed[name]}' if name in failed else 'ok'
+        print(f'{name:<20} {status:<20} '
+              f'position {position:.2e}px (tick {position_tick})  '
+              f'heading {heading:.2e}rad (tick {heading_tick})')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(parse_args()))
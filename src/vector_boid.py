@@ -0,0 +1,301 @@
+"""
+Boids which carry their heading as a unit vector.
+
+`VectorBoid` follows the rules of `boid.Boid`, with the same interface, but
+keeps its heading as a unit vector (hx, hy) instead of an angle. Whether
+another boid is in view, which side of self it is on, and where it heads
+relative to self all come from dot and cross products, so evaluating a pair
+of boids takes no atan2 and no angle normalization, and moving takes no cos
+or sin. Angles are only computed when asked for, e.g. to draw the boids.
+
+The flocking is equivalent rather than identical:
+ - alignment turns by the sine of the difference in heading, the same as the
+   angle for small differences, and gentler towards the pi/2 limit
+ - cohesion measures the angle to the relative center with a polynomial
+   approximation of atan2, within 0.004 radians, the short way round
+ - turns are applied as a rational rotation, within 2e-4 radians
+ - differences in heading are measured the short way round. Boid subtracts
+   raw angles, so near the -pi/pi seam it ignores some boids heading its
+   way for alignment, and may turn the long way round towards the center
+
+Select it with `HEADING_KERNEL = 'vector'`, the object engine only.
+"""
+
+from math import atan2, cos, pi, sin, sqrt
+from sys import float_info
+import config
+
+from boid import Boid
+
+EPSILON = float_info.epsilon
+HALF_PI = pi / 2
+QUARTER_PI = pi / 4
+
+# coefficient of the atan approximation in approximate_angle
+ATAN_CURVATURE = 0.273
+
+
+class VectorBoid(Boid):
+    '''A single boid, heading along a unit vector.
+
+    Finding the other boids, the buffers and the wrapping are Boid's, only
+    the heading kernel is overridden'''
+    __slots__ = ('__hx', '__hy', '__next_hx', '__next_hy')
+
+    # another boid is in view while the cosine of its angle from the heading is above this
+    __COS_VIEW_ANGLE = cos(Boid.get_view_angle())
+    __D_THETA_PER_UPDATE = Boid.get_d_theta_per_update()
+
+    __ACTIVE_COLOR = Boid.get_active_color()
+
+    def __init__(self, init_position, init_magnitude, init_theta, world_size=config.WORLD_SIZE):
+        # IDs are shared with Boid, so either kind can restore the other's flock
+        super().__init__(init_position, init_magnitude, init_theta, world_size)
+        self.__hx = cos(init_theta)
+        self.__hy = sin(init_theta)
+
+        # back buffer written by update, see swap_buffers
+        self.__next_hx = self.__hx
+        self.__next_hy = self.__hy
+
+
+    @staticmethod
+    def configure():
+        '''Read the constants of the rules from Boid again, after Boid.configure'''
+        VectorBoid.__COS_VIEW_ANGLE = cos(Boid.get_view_angle())
+        VectorBoid.__D_THETA_PER_UPDATE = Boid.get_d_theta_per_update()
+
+
+    def get_theta(self):
+        '''Returns the boid's heading, as an angle'''
+        return atan2(self.__hy, self.__hx)
+
+
+    def get_heading(self):
+        '''Returns the boid's heading, as a unit vector'''
+        return (self.__hx, self.__hy)
+
+
+    def get_poly(self):
+        '''Returns the boid's rotated poly'''
+        return [
+            [x * self.__hx - y * self.__hy + self._x, x * self.__hy + y * self.__hx + self._y]
+            for x, y in Boid.get_base_poly()
+        ]
+
+
+    def _interact_at(self, other, diff_x, diff_y, squared_distance, rules):
+        # lets self and other react to one another, from the offset between them
+        distance = sqrt(squared_distance)
+
+        # the heading of each boid relative to the other's serves both of them,
+        # the cross product only changes sign
+        relative_cos = self.__hx * other.__hx + self.__hy * other.__hy
+        relative_sin = self.__hx * other.__hy - self.__hy * other.__hx
+
+        # the other simply sees self in the opposite direction
+        self.__react(
+            other, diff_x, diff_y, distance,
+            self.__hx * diff_x + self.__hy * diff_y, self.__hx * diff_y - self.__hy * diff_x,
+            relative_cos, relative_sin, rules)
+        other.__react(
+            self, -diff_x, -diff_y, distance,
+            -other.__hx * diff_x - other.__hy * diff_y, other.__hy * diff_x - other.__hx * diff_y,
+            relative_cos, -relative_sin, rules)
+
+
+    def _react_at(self, other, diff_x, diff_y, squared_distance, rules):
+        # reacts to another boid within the view distance, from the offset to it
+        self.__react(
+            other, diff_x, diff_y, sqrt(squared_distance),
+            self.__hx * diff_x + self.__hy * diff_y, self.__hx * diff_y - self.__hy * diff_x,
+            self.__hx * other.__hx + self.__hy * other.__hy,
+            self.__hx * other.__hy - self.__hy * other.__hx, rules)
+
+
+    def _sight(self, diff_x, diff_y, squared_distance):
+        # returns how self sees another boid at the offset, its (distance,
+        # forward, side), or None if it is outside the view angle
+        distance = sqrt(squared_distance)
+        forward = self.__hx * diff_x + self.__hy * diff_y
+        if forward <= VectorBoid.__COS_VIEW_ANGLE * distance:
+            return None
+        return (distance, forward, self.__hx * diff_y - self.__hy * diff_x)
+
+
+    def _react_seen(self, other, diff_x, diff_y, squared_distance, sight, rules):
+        # reacts to another boid in view, as returned by _sight
+        distance, forward, side = sight
+        self.__react(
+            other, diff_x, diff_y, distance, forward, side,
+            self.__hx * other.__hx + self.__hy * other.__hy,
+            self.__hx * other.__hy - self.__hy * other.__hx, rules)
+
+
+    def _swap_heading(self):
+        # makes the heading in the back buffer visible, see swap_buffers
+        self.__hx = self.__next_hx
+        self.__hy = self.__next_hy
+
+
+    def _steer(self, cohesion, field=None):
+        # computes the turn, rotating the heading into the back buffer
+        self.__next_hx = self.__hx
+        self.__next_hy = self.__hy
+        final_d_theta = 0.0
+
+        # only a boid which saw at least a single boid steers with the flock
+        if self._boids_in_view > 0:
+            final_d_theta = self._d_theta_alignment / self._boids_in_view
+
+            # once we've found the relative center, we try to move towards it
+            if cohesion:
+                relative_angle = approximate_angle(
+                    self.__hx * self._center_x + self.__hy * self._center_y,
+                    self.__hx * self._center_y - self.__hy * self._center_x)
+                final_d_theta += relative_angle / self._boids_in_view / self._boids_in_view
+
+            # only account for separation if we've actually avoided any
+            if self._boids_avoided > 0:
+                final_d_theta += self._d_theta_separation / self._boids_avoided
+
+            # cannot exceed the max change in theta per update
+            final_d_theta = max(
+                min(final_d_theta, VectorBoid.__D_THETA_PER_UPDATE),
+                -VectorBoid.__D_THETA_PER_UPDATE)
+
+        # the obstacles steer the boid on top of the others, within the same
+        # limit. The field works with angles, it takes one atan2 per boid
+        if field is not None:
+            final_d_theta = max(
+                min(final_d_theta + field.turn(self._x, self._y, atan2(self.__hy, self.__hx)),
+                    VectorBoid.__D_THETA_PER_UPDATE),
+                -VectorBoid.__D_THETA_PER_UPDATE)
+
+        if final_d_theta == 0:
+            return
+
+        # rotate by the turn, through the tangent of half of it to the fifth order
+        squared_d_theta = final_d_theta * final_d_theta
+        tangent = final_d_theta * (0.5 + squared_d_theta * (1 / 24 + squared_d_theta / 240))
+        scale = 1 / (1 + tangent * tangent)
+        cos_d_theta = (1 - tangent * tangent) * scale
+        sin_d_theta = 2 * tangent * scale
+        next_hx = self.__hx * cos_d_theta - self.__hy * sin_d_theta
+        next_hy = self.__hx * sin_d_theta + self.__hy * cos_d_theta
+
+        # safety check: keep the heading a unit vector, despite rounding
+        length = sqrt(next_hx * next_hx + next_hy * next_hy)
+        self.__next_hx = next_hx / length
+        self.__next_hy = next_hy / length
+
+
+    def __react(self, other, diff_x, diff_y, distance, forward, side,
+                relative_cos, relative_sin, rules):
+        # forward and side are the dot and cross products of the heading and
+        # the offset of the other boid, relative_cos and relative_sin those
+        # of the two headings
+
+        # if the boid is not moving, it need not do anything
+        if self._magnitude == 0:
+            return
+
+        # if we cannot see the other boid, do nothing
+        if forward <= VectorBoid.__COS_VIEW_ANGLE * distance:
+            return
+
+        # we can see the other boid!
+        self._boids_in_view += 1
+        self._color = VectorBoid.__ACTIVE_COLOR
+        multiplier = 1 / distance
+
+        # follow the 3 rules if active
+        separation, alignment, cohesion = rules
+        if separation:
+            self.__avoid_collision(
+                other, diff_x, diff_y, distance, forward, side,
+                relative_cos, relative_sin, multiplier)
+
+        # we should only try to align with boids going in the same general
+        # direction, i.e. at most pi/2 apart, and not already aligned
+        if alignment and relative_cos >= 0 and \
+            (relative_sin > EPSILON or relative_sin < -EPSILON):
+            self._d_theta_alignment += relative_sin * multiplier
+
+        # cohesion will try to go towards the center of the local group
+        # however we will only compute the relative center
+        if cohesion:
+            self._center_x += diff_x * distance
+            self._center_y += diff_y * distance
+
+
+    def __avoid_collision(self, other, diff_x, diff_y, distance, forward, side,
+                          relative_cos, relative_sin, multiplier):
+        o_magnitude = other._magnitude
+
+        ## first we consider some edge cases
+        if forward > 0 and -EPSILON * distance <= side <= EPSILON * distance:
+            # case 1: boid is directly in front
+            if o_magnitude == 0:
+                # case 1.1: stationary boid, move out of the way
+                self._boids_avoided += 1
+                self._d_theta_separation += VectorBoid.__D_THETA_PER_UPDATE * multiplier
+                return
+
+            if relative_cos > 0 and -EPSILON <= relative_sin <= EPSILON:
+                # case 1.2: moving away directly away. If too slow,
+                # dodge it otherwise no need to do anything
+                if o_magnitude < self._magnitude:
+                    self._boids_avoided += 1
+                    self._d_theta_separation += VectorBoid.__D_THETA_PER_UPDATE * multiplier
+                return
+
+        # At this point, we know there is no boid directly in front,
+        # but if it's not moving, don't need to avoid it.
+        if o_magnitude == 0:
+            return
+
+        # last thing to check is if a collision will occur: the other must be
+        # heading between our own heading and straight at us
+        towards_self = other.__hx * diff_y - other.__hy * diff_x
+        if side > 0:
+            if relative_sin > 0 or towards_self < 0:
+                return
+        elif relative_sin < 0 or towards_self > 0:
+            return
+
+        # finally, since a collision may occur, we veer away from the other boid
+        if side <= 0:
+            self._d_theta_separation += VectorBoid.__D_THETA_PER_UPDATE * multiplier
+        else:
+            self._d_theta_separation -= VectorBoid.__D_THETA_PER_UPDATE * multiplier
+
+        self._boids_avoided += 1
+
+
+    def _update_position(self):
+        # get update the position based on the speed, into the back buffer
+        self._next_x = self._x + self._magnitude * self.__next_hx
+        self._next_y = self._y + self._magnitude * self.__next_hy
+
+        # enforce bounding
+        self._enforce_bounds()
+# END class VectorBoid
+
+def approximate_angle(x, y):
+    '''Returns the angle of the vector (x, y) in ]-pi, pi] like atan2, within
+    0.004 radians, from a polynomial approximation of atan'''
+    abs_x = abs(x)
+    abs_y = abs(y)
+    if abs_x >= abs_y:
+        if abs_x == 0:
+            return 0.0
+        ratio = y / x
+        angle = ratio * (QUARTER_PI + ATAN_CURVATURE * (1 - abs(ratio)))
+        if x < 0:
+            angle += pi if y >= 0 else -pi
+        return angle
+
+    ratio = x / y
+    angle = ratio * (QUARTER_PI + ATAN_CURVATURE * (1 - abs(ratio)))
+    return (HALF_PI if y > 0 else -HALF_PI) - angle
@@ -0,0 +1,26 @@
+"""
+Shared fixtures of the tests. The modules live flat in src, as main.py runs them.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
+
+from boid import Boid
+from simulation import Simulation
+
+
+@pytest.fixture(autouse=True)
+def global_state():
+    '''Restores the rules, their constants and the boid ID counter, which are
+    shared by every simulation'''
+    rules = Simulation.get_rules()
+    constants = Simulation.get_boid_constants()
+    next_id = Boid.get_next_id()
+    yield
+    Simulation.set_rules(*rules)
+    Simulation.set_boid_constants(**constants)
+    Boid.set_next_id(next_id)
@@ -0,0 +1,74 @@
+"""
+Tests of camera.py: panning and zooming a view of a wrapping world.
+"""
+
+import pytest
+
+import camera
+
+SCREEN_SIZE = (200, 100)
+
+
+def test_small_world_passes_through():
+    '''A world fitting the window is shown as it is, at no cost'''
+    view = camera.Camera(SCREEN_SIZE, SCREEN_SIZE)
+    positions, thetas, states = [(1.0, 2.0), (150.0, 90.0)], [0.0, 1.0], [False, True]
+    assert view.view(positions, thetas, states) == (positions, thetas, states)
+
+
+def test_large_world_is_fitted():
+    '''A world larger than the window is zoomed out to fit it, centered'''
+    view = camera.Camera((800, 200), SCREEN_SIZE)
+    assert view.get_zoom() == 0.25
+    # the width fits exactly, the height is centered
+    assert view.to_screen(0, 100) == pytest.approx((0, 50))
+    assert view.to_screen(800, 100) == pytest.approx((200, 50))
+
+
+def test_zoom_is_clamped():
+    '''The view zooms in up to MAX_ZOOM, and out until the world fits'''
+    view = camera.Camera((800, 400), SCREEN_SIZE)
+    view.zoom(100)
+    assert view.get_zoom() == camera.MAX_ZOOM
+    view.zoom(0.001)
+    assert view.get_zoom() == 0.25
+
+
+def test_view_wraps_and_culls():
+    '''Boids across the edge of the world are shown next to those before it,
+    boids off screen are left out'''
+    view = camera.Camera((999, 999), SCREEN_SIZE)
+    view.zoom(1 / view.get_zoom())
+    assert view.get_zoom() == pytest.approx(1)
+    # the top left corner of the window 50 pixels before the world's right edge
+    x, y, _ = view.get_state()
+    view.pan(950 - x, -y)
+    assert view.get_state()[:2] == pytest.approx((950, 0))
+
+    positions = [(960.0, 10.0), (20.0, 30.0), (500.0, 50.0), (20.0, 500.0)]
+    screen, thetas, states = view.view(positions, [0.0, 1.0, 2.0, 3.0], [True, False, True, False])
+    assert [coordinate for pos in screen for coordinate in pos] == \
+        pytest.approx([10, 10, 70, 30])
+    assert thetas == [0.0, 1.0]
+    assert states == [True, False]
+    assert view.to_screen(20.0, 30.0) == pytest.approx((70, 30))
+
+
+def test_view_of_arrays():
+    '''The arrays of the array engines give the same view as lists'''
+    np = pytest.importorskip('numpy')
+    view = camera.Camera((2000, 1000), SCREEN_SIZE)
+    view.zoom(2)
+    view.pan(-300, 170)
+
+    rng = np.random.default_rng(0)
+    positions = rng.uniform(0, 1000, (500, 2)) * (2, 1)
+    thetas = rng.uniform(-3, 3, 500)
+    states = rng.uniform(size=500) < 0.5
+    screen, screen_thetas, screen_states = view.view(positions, thetas, states, margin=8)
+    expected = view.view(positions.tolist(), thetas.tolist(), states.tolist(), margin=8)
+
+    assert len(screen) > 0
+    np.testing.assert_allclose(screen, expected[0])
+    assert screen_thetas.tolist() == expected[1]
+    assert screen_states.tolist() == expected[2]
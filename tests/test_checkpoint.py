@@ -0,0 +1,110 @@
+"""
+Tests of checkpoint.py: saving a simulation and resuming it where it left off.
+"""
+
+import os
+
+import pytest
+
+import checkpoint
+from vector_boid import VectorBoid
+from simulation import Simulation
+
+
+def save(sim, tmp_path):
+    '''Saves the simulation to a checkpoint, returns its path'''
+    path = tmp_path / 'run.ckpt'
+    checkpoint.save(sim, path)
+    return path
+
+
+def resume(sim, tmp_path):
+    '''Returns the simulation saved to a checkpoint and loaded back'''
+    return checkpoint.load(save(sim, tmp_path), workers=1)
+
+
+def test_object_engine_round_trip(tmp_path):
+    '''The object engine resumes with the same boids, settings and rules'''
+    sim = Simulation(60, engine='object', seed=1, nearest=4)
+    sim.step(5)
+    Simulation.set_rules(separation=True, alignment=False, cohesion=True)
+
+    resumed = resume(sim, tmp_path)
+    assert resumed.get_tick() == 5
+    assert resumed.get_nearest() == 4
+    assert resumed.get_world_size() == sim.get_world_size()
+    assert Simulation.get_rules() == (True, False, True)
+    assert [boid.get_id() for boid in resumed.get_boids()] == \
+        [boid.get_id() for boid in sim.get_boids()]
+    assert resumed.get_positions() == sim.get_positions()
+    assert resumed.get_thetas() == sim.get_thetas()
+    assert resumed.get_active() == sim.get_active()
+
+
+def test_object_engine_resumes_the_same_run(tmp_path):
+    '''A resumed simulation follows the trajectories of the one saved'''
+    sim = Simulation(60, engine='object', seed=2)
+    sim.step(5)
+    resumed = resume(sim, tmp_path)
+
+    sim.step(10)
+    resumed.step(10)
+    assert resumed.get_positions() == pytest.approx(sim.get_positions())
+    assert resumed.get_thetas() == pytest.approx(sim.get_thetas())
+
+
+def test_heading_kernel_is_restored(tmp_path):
+    '''Boids of the vector heading kernel resume as VectorBoids'''
+    sim = Simulation(20, engine='object', seed=3, heading_kernel='vector')
+    sim.step(2)
+
+    resumed = resume(sim, tmp_path)
+    assert resumed.get_heading_kernel() == 'vector'
+    assert all(type(boid) is VectorBoid for boid in resumed.get_boids())
+
+
+def test_numpy_engine_restores_arrays(tmp_path):
+    '''The array engines read the columns back into arrays, not Boid objects'''
+    np = pytest.importorskip('numpy')
+    sim = Simulation(80, engine='numpy', seed=4)
+    sim.step(5)
+
+    state = checkpoint.read_state(save(sim, tmp_path))
+    assert isinstance(state.positions, np.ndarray)
+    assert state.positions.shape == (80, 2)
+    assert state.active.dtype == bool
+    np.testing.assert_array_equal(state.positions, sim.get_positions())
+
+    resumed = Simulation.from_state(state)
+    sim.step(10)
+    resumed.step(10)
+    np.testing.assert_allclose(resumed.get_positions(), sim.get_positions())
+    np.testing.assert_array_equal(resumed.get_active(), sim.get_active())
+
+
+def test_saving_replaces_the_previous_checkpoint(tmp_path):
+    '''Saving over a checkpoint replaces it, without leaving a temporary file behind'''
+    sim = Simulation(10, engine='object', seed=5)
+    path = save(sim, tmp_path)
+    sim.step(3)
+    checkpoint.save(sim, path)
+
+    assert os.listdir(tmp_path) == ['run.ckpt']
+    assert checkpoint.read_state(path).tick == 3
+
+
+def test_not_a_checkpoint(tmp_path):
+    '''Files which are not checkpoints are refused'''
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'BOIDTRAJ' + bytes(8))
+    with pytest.raises(ValueError):
+        checkpoint.read_state(path)
+
+
+def test_truncated_checkpoint(tmp_path):
+    '''Checkpoints cut short are refused, rather than resumed with missing boids'''
+    path = save(Simulation(10, engine='object', seed=6), tmp_path)
+    path.write_bytes(path.read_bytes()[:-20])
+    with pytest.raises(ValueError):
+        checkpoint.read_state(path)
+
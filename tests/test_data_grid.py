@@ -0,0 +1,59 @@
+"""
+Tests of data_grid.py: data moved between cells is found in its new cell only.
+"""
+
+import pytest
+
+from data_grid import DataGrid, SparseDataGrid
+
+WIDTH = 5
+HEIGHT = 4
+
+
+def cells_holding(grid, data):
+    '''Returns the [row, column] of every cell holding data, once per time it is held'''
+    return [list(coords) for coords, cell in grid.get_occupied_cells()
+            for held in cell if held is data]
+
+
+@pytest.mark.parametrize('grid_class', [DataGrid, SparseDataGrid])
+@pytest.mark.parametrize('from_coords, to_coords, moved', [
+    # to a neighboring cell, and to one further away
+    ([1, 1], [1, 2], [1, 2]),
+    ([1, 1], [3, 4], [3, 4]),
+    # across the wrap, given past the edges like a boid which just crossed them
+    ([0, 0], [-1, 0], [HEIGHT - 1, 0]),
+    ([2, WIDTH - 1], [2, WIDTH], [2, 0]),
+    ([HEIGHT - 1, WIDTH - 1], [HEIGHT, WIDTH], [0, 0]),
+    # onto the same cell, once wrapped
+    ([1, 0], [1, WIDTH], [1, 0]),
+])
+def test_move_data(grid_class, from_coords, to_coords, moved):
+    '''Data moved is found exactly once, in the cell it moved to'''
+    grid = grid_class(WIDTH, HEIGHT, True)
+    data, left_behind, joined = object(), object(), object()
+    grid.push_data(left_behind, list(from_coords))
+    grid.push_data(data, list(from_coords))
+    grid.push_data(joined, list(moved))
+
+    grid.move_data(data, list(from_coords), list(to_coords))
+
+    assert cells_holding(grid, data) == [moved]
+    assert sum(held is data for held in grid.get_cell(list(moved))) == 1
+    # the data it shared its cells with stays put
+    assert cells_holding(grid, left_behind) == [from_coords]
+    assert cells_holding(grid, joined) == [moved]
+
+
+@pytest.mark.parametrize('grid_class', [DataGrid, SparseDataGrid])
+def test_move_data_and_back(grid_class):
+    '''Data moved around the world and back leaves no trace behind'''
+    grid = grid_class(WIDTH, HEIGHT, True)
+    data = object()
+    grid.push_data(data, [0, 0])
+    path = [[0, 0], [0, -1], [-1, -1], [-1, 0], [0, 0]]
+    for from_coords, to_coords in zip(path, path[1:]):
+        grid.move_data(data, list(from_coords), list(to_coords))
+
+    assert cells_holding(grid, data) == [[0, 0]]
+    assert all(not cell or list(coords) == [0, 0] for coords, cell in grid.get_occupied_cells())
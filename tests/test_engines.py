@@ -0,0 +1,62 @@
+"""
+Tests that the engines, indexes and kernels follow the reference trajectories,
+like validate.py over a few ticks.
+"""
+
+import os
+
+import pytest
+
+import config
+import validate
+
+OBSTACLES = os.path.join(os.path.dirname(__file__), os.pardir, 'obstacles.json')
+
+TOLERANCE = 1e-6
+
+
+def follows_reference(candidate, *options, ticks=15):
+    '''Returns the largest (position, heading) divergence of a candidate from
+    the object engine over a few ticks, on a clumped seeded flock'''
+    args = validate.parse_args(['--boids', '150', '--spawn', 'clumped', '--workers', '2',
+                                *options])
+    reference = validate.build(validate.parse_candidate(validate.REFERENCE), args)
+    sim = validate.build(validate.parse_candidate(candidate), args)
+    worst = (0.0, 0.0)
+    try:
+        for _ in range(ticks):
+            reference.step()
+            sim.step()
+            worst = tuple(map(max, worst, validate.divergence(reference, sim)))
+    finally:
+        reference.close()
+        sim.close()
+    return worst
+
+
+@pytest.mark.parametrize('candidate', ['object:sparse', 'object:quadtree', 'object:verlet'])
+@pytest.mark.parametrize('nearest', [[], ['--nearest', '4']])
+def test_object_indexes(candidate, nearest):
+    '''Every neighbor index of the object engine, reacting to every boid or the nearest'''
+    position, heading = follows_reference(candidate, *nearest)
+    assert position < TOLERANCE
+    assert heading < TOLERANCE
+
+
+@pytest.mark.parametrize('candidate', ['numpy', 'numpy:verlet', 'parallel', 'jit'])
+@pytest.mark.parametrize('nearest', [[], ['--nearest', '4']])
+def test_array_engines(candidate, nearest):
+    '''Every array engine, reacting to every boid or the nearest'''
+    pytest.importorskip('numpy')
+    position, heading = follows_reference(candidate, *nearest)
+    assert position < TOLERANCE
+    assert heading < TOLERANCE
+
+
+def test_obstacles(tmp_path, monkeypatch):
+    '''The numpy engine steers around obstacles like the object engine'''
+    pytest.importorskip('numpy')
+    monkeypatch.setattr(config, 'OBSTACLE_CACHE_DIR', str(tmp_path))
+    position, heading = follows_reference('numpy', '--obstacles', OBSTACLES, ticks=40)
+    assert position < TOLERANCE
+    assert heading < TOLERANCE
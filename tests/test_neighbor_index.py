@@ -0,0 +1,93 @@
+"""
+Tests of neighbor_index.py: every index finds every pair of boids within view distance.
+"""
+
+import random
+
+import pytest
+
+from boid import Boid
+from neighbor_index import NEIGHBOR_INDEXES, wrapped_difference, wrapped_ranges
+
+WORLD_SIZE = (300, 200)
+
+
+def spawn(count, seed, clumped=False):
+    '''Returns boids across the world, or clumped around a corner to overload its cells'''
+    rng = random.Random(seed)
+    if clumped:
+        positions = [(rng.uniform(-30, 30) % (WORLD_SIZE[0] + 1),
+                      rng.uniform(-30, 30) % (WORLD_SIZE[1] + 1)) for _ in range(count)]
+    else:
+        positions = [(rng.uniform(0, WORLD_SIZE[0]), rng.uniform(0, WORLD_SIZE[1]))
+                     for _ in range(count)]
+    return [Boid(pos, 2, rng.uniform(-3, 3), WORLD_SIZE) for pos in positions]
+
+
+def visible_pairs(boids):
+    '''Returns the IDs of every pair of boids within view distance, the
+    shortest way around the world'''
+    view_distance = Boid.get_view_distance()
+    pairs = set()
+    for i, boid in enumerate(boids):
+        x, y = boid.get_pos()
+        for other in boids[i + 1:]:
+            o_x, o_y = other.get_pos()
+            d_x = wrapped_difference(o_x - x, WORLD_SIZE[0] + 1)
+            d_y = wrapped_difference(o_y - y, WORLD_SIZE[1] + 1)
+            if d_x * d_x + d_y * d_y <= view_distance ** 2:
+                pairs.add(frozenset((boid.get_id(), other.get_id())))
+    return pairs
+
+
+def check_index(index, boids):
+    '''Checks the candidates of an index cover every visible pair, each once'''
+    candidates = [
+        frozenset((boid.get_id(), other.get_id()))
+        for boid, others in index.candidate_pairs() for other in others
+    ]
+    assert len(candidates) == len(set(candidates))
+    assert visible_pairs(boids) <= set(candidates)
+
+    seen = set()
+    for boid, groups in index.neighborhoods():
+        seen.update(frozenset((boid.get_id(), other.get_id()))
+                    for group in groups for other in group if other is not boid)
+    assert visible_pairs(boids) <= seen
+
+
+@pytest.mark.parametrize('name', sorted(NEIGHBOR_INDEXES))
+@pytest.mark.parametrize('clumped', [False, True])
+def test_index_finds_every_visible_pair(name, clumped):
+    '''Pairs across the edges of the world, and in overloaded cells, are found'''
+    boids = spawn(300, 1, clumped)
+    check_index(NEIGHBOR_INDEXES[name](boids, WORLD_SIZE), boids)
+
+
+@pytest.mark.parametrize('name', sorted(NEIGHBOR_INDEXES))
+def test_index_follows_the_boids(name):
+    '''Refreshed indexes find the boids where they moved to, e.g. verlet lists
+    past half their skin'''
+    boids = spawn(200, 2)
+    index = NEIGHBOR_INDEXES[name](boids, WORLD_SIZE)
+    for _ in range(12):
+        for boid in boids:
+            boid.update([], synchronous=True)
+            boid.swap_buffers()
+        index.refresh()
+        check_index(index, boids)
+
+
+def test_wrapped_difference():
+    '''Differences are folded to the shortest way around'''
+    assert wrapped_difference(10, 301) == 10
+    assert wrapped_difference(290, 301) == -11
+    assert wrapped_difference(-290, 301) == 11
+
+
+def test_wrapped_ranges():
+    '''Ranges are split where they cross the edges of the world'''
+    assert wrapped_ranges(10, 20, 100) == [(10, 20)]
+    assert wrapped_ranges(-5, 20, 100) == [(0, 20), (95, 100)]
+    assert wrapped_ranges(90, 110, 100) == [(90, 100), (0, 10)]
+    assert wrapped_ranges(-10, 200, 100) == [(0, 100)]
@@ -0,0 +1,137 @@
+"""
+Tests of obstacles.py: the sampled field, and its cache.
+"""
+
+import json
+import os
+from math import pi
+
+import pytest
+
+import config
+import obstacles
+
+WORLD_SIZE = (599, 399)
+
+DESCRIPTION = {
+    'obstacles': [
+        {'circle': [300, 200], 'radius': 40},
+        # straddles the left edge of the world
+        {'polygon': [[-20, 50], [30, 50], [30, 100], [-20, 100]]},
+    ],
+    'attractors': [{'point': [500, 320], 'radius': 60, 'strength': 0.2}],
+}
+
+
+@pytest.fixture
+def obstacle_file(tmp_path):
+    '''Returns the path of an obstacle file holding DESCRIPTION'''
+    path = tmp_path / 'obstacles.json'
+    path.write_text(json.dumps(DESCRIPTION))
+    return path
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    '''Caches the fields of the test in a directory of its own'''
+    path = tmp_path / 'cache'
+    monkeypatch.setattr(config, 'OBSTACLE_CACHE_DIR', str(path))
+    return path
+
+
+def test_samples_around_a_circle(obstacle_file, cache_dir):
+    '''Inside an obstacle the distance is negative, and the gradient leads out'''
+    field = obstacles.load_field(obstacle_file, WORLD_SIZE)
+    cell_width, _ = field.get_cell_size()
+
+    distance, gradient_x, gradient_y, _, _ = field.sample(300 + 30, 200)
+    assert distance == pytest.approx(-10, abs=cell_width)
+    assert gradient_x == pytest.approx(1, abs=0.2)
+    assert gradient_y == pytest.approx(0, abs=0.2)
+
+    distance, _, _, _, _ = field.sample(300 + 40 + 20, 200)
+    assert distance == pytest.approx(20, abs=cell_width)
+
+    # far from every obstacle and attractor, nothing is kept
+    assert field.sample(150, 300) == obstacles.EMPTY_SAMPLE
+    assert field.turn(150, 300, 0.0) == 0.0
+
+
+def test_obstacles_reach_around_the_edges(obstacle_file, cache_dir):
+    '''An obstacle across the left edge of the world is also on the right'''
+    field = obstacles.load_field(obstacle_file, WORLD_SIZE)
+    distance, gradient_x, _, _, _ = field.sample(WORLD_SIZE[0] - 5, 75)
+    assert distance < 0
+    # the shortest way out is through the right edge, i.e. towards -x
+    assert gradient_x < 0
+
+
+def test_boids_turn_away_and_towards_attractors(obstacle_file, cache_dir):
+    '''A boid heading at an obstacle turns away, one passing an attractor turns to it'''
+    field = obstacles.load_field(obstacle_file, WORLD_SIZE)
+
+    # heading at the circle, just off its center towards +y, it turns towards +y
+    assert field.turn(300 - 60, 205, 0.0) > 0
+    assert field.turn(300 - 60, 195, 0.0) < 0
+
+    # heading along +x past the attractor, it turns towards it
+    assert field.turn(500, 340, 0.0) < 0
+    assert field.turn(500, 300, 0.0) > 0
+    # and not at all when already heading at it
+    assert field.turn(500, 300, pi / 2) == pytest.approx(0, abs=0.05)
+
+
+def test_field_is_cached(obstacle_file, cache_dir):
+    '''A field is sampled once, read back from the cache, and sampled again
+    once the file changes'''
+    sampled = obstacles.load_field(obstacle_file, WORLD_SIZE)
+    assert len(os.listdir(cache_dir)) == 1
+
+    cached = obstacles.load_field(obstacle_file, WORLD_SIZE)
+    assert len(os.listdir(cache_dir)) == 1
+    assert cached.get_indices() == sampled.get_indices()
+    assert cached.get_samples() == sampled.get_samples()
+
+    description = dict(DESCRIPTION, attractors=[])
+    obstacle_file.write_text(json.dumps(description))
+    changed = obstacles.load_field(obstacle_file, WORLD_SIZE)
+    assert len(os.listdir(cache_dir)) == 2
+    assert changed.sample(500, 300) == obstacles.EMPTY_SAMPLE
+
+
+def test_corrupt_cache_is_sampled_again(obstacle_file, cache_dir):
+    '''A truncated cache file is ignored and replaced'''
+    sampled = obstacles.load_field(obstacle_file, WORLD_SIZE)
+    [name] = os.listdir(cache_dir)
+    path = cache_dir / name
+    cache = path.read_bytes()
+    path.write_bytes(cache[:-7])
+
+    resampled = obstacles.load_field(obstacle_file, WORLD_SIZE)
+    assert resampled.get_samples() == sampled.get_samples()
+    assert path.read_bytes() == cache
+
+
+def test_cache_directory(monkeypatch, tmp_path):
+    '''Fields are cached in OBSTACLE_CACHE_DIR, or else the user's cache directory'''
+    monkeypatch.setattr(config, 'OBSTACLE_CACHE_DIR', None)
+    monkeypatch.setattr(obstacles.sys, 'platform', 'linux')
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    assert obstacles.cache_directory() == os.path.join(str(tmp_path), 'py3-boids', 'fields')
+
+    monkeypatch.setattr(config, 'OBSTACLE_CACHE_DIR', 'elsewhere')
+    assert obstacles.cache_directory() == 'elsewhere'
+
+
+@pytest.mark.parametrize('description', [
+    {'obstacles': [{'square': [1, 2]}]},
+    {'obstacles': [{'polygon': [[0, 0], [1, 1]]}]},
+    {'obstacles': [{'circle': [1, 2]}]},
+    {'attractors': [{'radius': 5}]},
+    [],
+])
+def test_invalid_obstacle_files(description):
+    '''Invalid descriptions are refused with a ValueError'''
+    with pytest.raises(ValueError):
+        obstacles.parse(description)
+
@@ -0,0 +1,34 @@
+"""
+Tests of the counters profiled by the engines.
+"""
+
+import pytest
+
+from profiler import PROFILER
+from simulation import Simulation
+
+
+def profiled_counters(engine):
+    '''Returns the counters and histograms profiled over a few ticks of a seeded flock'''
+    sim = Simulation(boid_count=300, engine=engine, workers=2, seed=3)
+    sim.set_rules(True, True, True)
+    PROFILER.reset()
+    PROFILER.set_enabled(True)
+    try:
+        for _ in range(5):
+            sim.step()
+        summary = PROFILER.get_summary()
+    finally:
+        PROFILER.set_enabled(False)
+        PROFILER.reset()
+        sim.close()
+    return summary['counters'], summary['histograms']
+
+
+def test_parallel_counters():
+    '''The workers of the parallel engine report the same counters as the numpy engine'''
+    pytest.importorskip('numpy')
+    counters, histograms = profiled_counters('parallel')
+    assert set(counters) == {'candidates', 'visible'}
+    assert counters['visible'] > 0
+    assert (counters, histograms) == profiled_counters('numpy')
@@ -0,0 +1,120 @@
+"""
+Tests of recording.py: writing trajectories, reading and replaying them.
+"""
+
+import pytest
+
+import recording
+
+WORLD_SIZE = (640, 480)
+
+TICKS = [
+    ([(1.5, 2.5), (600.25, 470.75)], [0.5, -3.0], [True, False]),
+    ([(2.5, 3.5), (601.25, 471.75)], [0.625, -2.875], [False, False]),
+    ([(3.5, 4.5), (602.25, 472.75)], [0.75, -2.75], [True, True]),
+]
+
+
+def record(path, ticks=TICKS, first_tick=10):
+    '''Writes a recording of the ticks'''
+    recorder = recording.TrajectoryRecorder(path, 2, WORLD_SIZE, first_tick)
+    for tick in ticks:
+        recorder.record(*tick)
+    assert recorder.get_record_count() == len(ticks)
+    recorder.close()
+
+
+def test_round_trip(tmp_path):
+    '''Every tick recorded is read back, in float32 precision'''
+    path = tmp_path / 'run.boids'
+    record(path)
+
+    reader = recording.TrajectoryReader(path)
+    try:
+        assert reader.get_boid_count() == 2
+        assert reader.get_world_size() == WORLD_SIZE
+        assert reader.get_first_tick() == 10
+        assert reader.get_tick_count() == len(TICKS)
+        # the values above are exact in float32
+        for index, tick in enumerate(TICKS):
+            assert reader.get_frame(index) == tick
+        with pytest.raises(IndexError):
+            reader.get_frame(len(TICKS))
+    finally:
+        reader.close()
+
+
+def test_numpy_arrays(tmp_path):
+    '''The arrays of the array engines are recorded as they are'''
+    np = pytest.importorskip('numpy')
+    positions, thetas, active = TICKS[0]
+    path = tmp_path / 'run.boids'
+    record(path, [(np.array(positions), np.array(thetas), np.array(active))])
+
+    reader = recording.TrajectoryReader(path)
+    try:
+        assert reader.get_frame(0) == TICKS[0]
+    finally:
+        reader.close()
+
+
+def test_partial_record_is_ignored(tmp_path):
+    '''A recording cut short keeps its complete ticks'''
+    path = tmp_path / 'run.boids'
+    record(path)
+    path.write_bytes(path.read_bytes()[:-5])
+
+    reader = recording.TrajectoryReader(path)
+    try:
+        assert reader.get_tick_count() == len(TICKS) - 1
+        assert reader.get_frame(1) == TICKS[1]
+    finally:
+        reader.close()
+
+
+def test_wrong_boid_count(tmp_path):
+    '''Ticks of another number of boids are refused'''
+    recorder = recording.TrajectoryRecorder(tmp_path / 'run.boids', 3, WORLD_SIZE)
+    try:
+        with pytest.raises(ValueError):
+            recorder.record(*TICKS[0])
+    finally:
+        recorder.close()
+
+
+@pytest.mark.parametrize('data', [b'', b'BOIDTRA', b'BOIDCKPT' + bytes(20)])
+def test_not_a_recording(tmp_path, data):
+    '''Files which are not recordings are refused'''
+    path = tmp_path / 'other.bin'
+    path.write_bytes(data)
+    with pytest.raises(ValueError):
+        recording.TrajectoryReader(path)
+
+
+def test_replay(tmp_path):
+    '''A replay moves through the recording at its speed, in either direction'''
+    path = tmp_path / 'run.boids'
+    record(path)
+    reader = recording.TrajectoryReader(path)
+    try:
+        replay = recording.Replay(reader, speed=4)
+        replay.advance(0.125)
+        assert replay.get_position() == 0.5
+
+        previous, current, alpha = replay.get_snapshots()
+        assert (previous.tick, current.tick, alpha) == (10, 11, 0.5)
+        assert current.positions == TICKS[1][0]
+
+        # clamped to the last tick, which has none after it
+        replay.advance(10)
+        assert replay.get_position() == 2.0
+        previous, current, alpha = replay.get_snapshots()
+        assert previous.tick == current.tick == 12
+
+        replay.set_speed(-8)
+        replay.advance(0.125)
+        assert replay.get_position() == 1.0
+        replay.seek(-5)
+        assert replay.get_position() == 0.0
+    finally:
+        reader.close()
@@ -0,0 +1,240 @@
+"""
+Tests of scheduler.py: the fixed-timestep loop of SimulationThread, and the
+interpolation between its snapshots.
+"""
+
+import time
+from math import pi
+
+import pytest
+
+import scheduler
+from scheduler import Snapshot, SimulationThread, interpolate, interpolation_factor
+
+# a long timestep, so that the thread's own delays are far below one tick
+UPS = 10
+TIMESTEP = 1 / UPS
+
+WORLD_SIZE = (1000, 800)
+
+
+class Clock:
+    '''The clock of the scheduler: real time, which a slow tick can skip ahead'''
+    def __init__(self):
+        self.skipped = 0
+
+
+    def perf_counter(self):
+        '''Returns the real time plus the time skipped'''
+        return time.perf_counter() + self.skipped
+# END class Clock
+
+
+class FakeSim:
+    '''A simulation of one boid which moves one pixel per tick, and whose
+    ticks take the given number of timesteps on the clock'''
+    def __init__(self, clock=None, costs=None, error=None):
+        self._clock = clock
+        self._costs = costs or {}
+        self._error = error
+        self._tick = 0
+
+
+    def step(self):
+        '''Advances one tick'''
+        if self._error is not None:
+            raise self._error
+        self._tick += 1
+        if self._clock is not None:
+            self._clock.skipped += self._costs.get(self._tick, 0) * TIMESTEP
+
+
+    def get_tick(self):
+        '''Returns the number of ticks stepped'''
+        return self._tick
+
+
+    def get_positions(self):
+        '''Returns the positions of the boids'''
+        return [(float(self._tick), 0.0)]
+
+
+    def get_thetas(self):
+        '''Returns the headings of the boids'''
+        return [0.0]
+
+
+    def get_active(self):
+        '''Returns the active flags of the boids'''
+        return [False]
+# END class FakeSim
+
+
+def wait_for_tick(thread, tick, timeout=5):
+    '''Returns the snapshots once the thread published the given tick'''
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        previous, current = thread.get_snapshots()
+        if current.tick >= tick:
+            return previous, current
+        time.sleep(0.001)
+    raise AssertionError(f'tick {tick} was never published')
+
+
+def run_slow_tick(monkeypatch, max_substeps):
+    '''Runs a thread whose first tick takes 10 timesteps, until its 4th tick.
+    Returns the thread and its last two snapshots'''
+    clock = Clock()
+    monkeypatch.setattr(scheduler, 'time', clock)
+    thread = SimulationThread(FakeSim(clock, {1: 10}), UPS, max_substeps=max_substeps)
+    thread.start()
+    try:
+        previous, current = wait_for_tick(thread, 4)
+    finally:
+        thread.stop()
+    return thread, previous, current
+
+
+def test_catch_up_is_bounded(monkeypatch):
+    '''After a slow tick, only max_substeps ticks run in a row, the 4th is
+    due after the dropped ones'''
+    _, previous, current = run_slow_tick(monkeypatch, max_substeps=3)
+    assert (previous.tick, current.tick) == (3, 4)
+    # ticks 1 to 3 were due a timestep apart, then 10 timesteps went by
+    assert current.time - previous.time == pytest.approx(9 * TIMESTEP)
+
+
+def test_catch_up_within_max_substeps(monkeypatch):
+    '''A backlog of fewer ticks than max_substeps is caught up in full'''
+    thread, previous, current = run_slow_tick(monkeypatch, max_substeps=20)
+    assert current.time - previous.time == pytest.approx(TIMESTEP)
+    assert thread.get_dropped_ticks() == 0
+
+
+def test_dropped_ticks(monkeypatch):
+    '''The ticks due while catching up which did not run are counted'''
+    thread, _, _ = run_slow_tick(monkeypatch, max_substeps=3)
+    # ticks 1 to 3 ran, ticks 4 to 11 fell due during the slow tick
+    assert thread.get_dropped_ticks() == 8
+
+
+def test_resume_without_catching_up():
+    '''The ticks due during a pause are neither run nor dropped'''
+    paused = [True]
+    thread = SimulationThread(FakeSim(), UPS, paused=lambda: paused[0])
+    thread.start()
+    try:
+        time.sleep(5 * TIMESTEP)
+        assert thread.get_snapshots()[1].tick == 0
+
+        resumed = time.perf_counter()
+        paused[0] = False
+        previous, current = wait_for_tick(thread, 2)
+    finally:
+        thread.stop()
+
+    assert (previous.tick, current.tick) == (1, 2)
+    # a tick falling due as the pause is lifted may still run, but none due earlier
+    assert previous.time > resumed - TIMESTEP
+    assert current.time - previous.time == pytest.approx(TIMESTEP)
+    assert thread.get_dropped_ticks() == 0
+
+
+def test_errors_surface():
+    '''An error raised by the simulation is raised again by get_snapshots'''
+    thread = SimulationThread(FakeSim(error=ValueError('broken')), UPS * 10)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+
+    with pytest.raises(RuntimeError) as raised:
+        thread.get_snapshots()
+    assert isinstance(raised.value.__cause__, ValueError)
+
+
+def test_snapshots_and_recorders():
+    '''Snapshots copy the state of each tick, and every tick is recorded'''
+    class Recorder:
+        def __init__(self):
+            self.positions = []
+
+        def record(self, positions, thetas, active):
+            self.positions.append(positions)
+
+    recorder = Recorder()
+    thread = SimulationThread(FakeSim(), UPS, recorders=(recorder,))
+    thread.start()
+    try:
+        previous, current = wait_for_tick(thread, 2)
+    finally:
+        thread.stop()
+
+    assert current.positions == [(float(current.tick), 0.0)]
+    assert previous.tick == current.tick - 1
+    assert current.time - previous.time == pytest.approx(TIMESTEP)
+    assert recorder.positions[:3] == [[(0.0, 0.0)], [(1.0, 0.0)], [(2.0, 0.0)]]
+
+
+def normalized(theta):
+    '''Returns the same heading in [-pi, pi)'''
+    return (theta + pi) % (2 * pi) - pi
+
+
+def snapshots(previous, current, as_array=lambda values: values):
+    '''Returns the snapshots of two consecutive ticks of the given
+    (positions, thetas), a timestep apart'''
+    return (Snapshot(1, 0.0, as_array(previous[0]), as_array(previous[1]), None),
+            Snapshot(2, TIMESTEP, as_array(current[0]), as_array(current[1]), None))
+
+
+@pytest.mark.parametrize('engine', ['object', 'numpy'])
+def test_interpolate(engine):
+    '''Boids are drawn in between, but at their current position once they
+    wrapped, and turn the short way across the -pi/pi seam'''
+    as_array = lambda values: values
+    if engine == 'numpy':
+        np = pytest.importorskip('numpy')
+        as_array = np.array
+
+    previous, current = snapshots(
+        ([(10, 10), (995, 10), (10, 5)], [pi - 0.1, 0.5, -pi + 0.2]),
+        ([(20, 30), (5, 10), (10, 795)], [-pi + 0.1, 0.7, pi - 0.2]),
+        as_array)
+    positions, thetas = interpolate(previous, current, 0.25, WORLD_SIZE)
+
+    assert [tuple(position) for position in positions] == pytest.approx(
+        [(12.5, 15), (5, 10), (10, 795)])
+    # headings are drawn as is, they may lie past the seam
+    thetas = [normalized(theta) for theta in thetas]
+    assert thetas == pytest.approx([pi - 0.05, 0.55, -pi + 0.1])
+
+
+@pytest.mark.parametrize('alpha', [0, 1, 1.5])
+def test_interpolate_ends(alpha):
+    '''Alpha 0 is the previous snapshot, 1 or more the current one'''
+    previous, current = snapshots(([(10, 10)], [0.5]), ([(20, 10)], [0.7]))
+    positions, thetas = interpolate(previous, current, alpha, WORLD_SIZE)
+    if alpha == 0:
+        assert (positions, thetas) == (previous.positions, previous.thetas)
+    else:
+        assert (positions, thetas) == (current.positions, current.thetas)
+
+
+def test_interpolate_same_tick():
+    '''Until the first tick, both snapshots are the initial state'''
+    _, current = snapshots(([(10, 10)], [0.5]), ([(20, 10)], [0.7]))
+    assert interpolate(current, current, 0.5, WORLD_SIZE) == (current.positions, current.thetas)
+
+
+@pytest.mark.parametrize('now, factor', [
+    (TIMESTEP, 0), (1.5 * TIMESTEP, 0.5), (2 * TIMESTEP, 1), (0, 0), (5 * TIMESTEP, 1)])
+def test_interpolation_factor(now, factor):
+    '''The flock is drawn one tick behind, clamped to the two snapshots'''
+    previous, current = snapshots(([], []), ([], []))
+    assert interpolation_factor(previous, current, now) == pytest.approx(factor)
+
+
+def test_interpolation_factor_same_time():
+    '''Snapshots due at once, like the initial ones, show the current one'''
+    _, current = snapshots(([], []), ([], []))
+    assert interpolation_factor(current, current, 0) == 1
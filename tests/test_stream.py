@@ -0,0 +1,249 @@
+"""
+Tests of stream.py: the key and delta frames, and the WebSocket framing.
+"""
+
+import asyncio
+import io
+import socket
+import struct
+from math import pi
+
+import pytest
+
+import stream
+
+WORLD_SIZE = (100, 80)
+
+
+def decoder(boid_count, world_size=WORLD_SIZE, scale=stream.config.STREAM_SCALE):
+    '''Returns a decoder for a stream with the given hello'''
+    return stream.StreamDecoder(stream.HELLO.pack(
+        stream.MAGIC, stream.VERSION, boid_count, world_size[0], world_size[1], scale))
+
+
+def apply(decoder, frame):
+    '''Decodes a frame as read from a stream'''
+    decoder.decode(*stream.read_frame(io.BytesIO(frame)))
+
+
+def test_key_frame_round_trip():
+    '''A key frame carries positions to 1/scale pixels and headings to 1/256 turns'''
+    positions = [(0.0, 0.0), (12.3, 45.6), (99.9, 79.9), (50.0625, 0.5)]
+    thetas = [0.0, 1.0, -2.5, pi]
+    active = [True, False, True, True]
+    encoder = stream.FrameEncoder(4, WORLD_SIZE)
+    encoder.encode(7, positions, thetas, active)
+    assert encoder.get_delta_frame() is None
+
+    received = decoder(4)
+    apply(received, encoder.get_key_frame())
+    assert received.get_tick() == 7
+
+    decoded_positions, decoded_thetas, decoded_active = received.get_frame()
+    for (x, y), (decoded_x, decoded_y) in zip(positions, decoded_positions):
+        assert decoded_x == pytest.approx(x, abs=0.5 / stream.config.STREAM_SCALE)
+        assert decoded_y == pytest.approx(y, abs=0.5 / stream.config.STREAM_SCALE)
+    step = 2 * pi / stream.HEADING_STEPS
+    for theta, decoded in zip(thetas, decoded_thetas):
+        # decoded headings are in [0, 2 pi[
+        assert (decoded - theta + pi) % (2 * pi) - pi == pytest.approx(0, abs=step / 2)
+    assert decoded_active == active
+
+
+def test_delta_frames_follow_the_key_frame():
+    '''Delta frames rebuild the same flock as key frames, across the edges of the world'''
+    encoder = stream.FrameEncoder(3, WORLD_SIZE)
+    received = decoder(3)
+    ticks = [
+        ([(99.5, 10.0), (20.0, 0.25), (50.0, 40.0)], [0.0, pi / 2, 3.1], [False] * 3),
+        # the first boid wraps to the left edge, the second to the bottom one,
+        # the third turns across the -pi/pi seam
+        ([(0.5, 10.5), (20.25, 80.5), (51.0, 41.0)], [0.1, -pi / 2, -3.1], [True] * 3),
+        ([(2.0, 12.0), (21.0, 79.0), (52.0, 42.0)], [0.2, -1.4, -3.0], [True, False, True]),
+    ]
+
+    encoder.encode(0, *ticks[0])
+    apply(received, encoder.get_key_frame())
+    for tick, state in enumerate(ticks[1:], 1):
+        encoder.encode(tick, *state)
+        delta = encoder.get_delta_frame()
+        assert delta is not None
+        assert len(delta) < len(encoder.get_key_frame())
+        apply(received, delta)
+
+        # the same as if the key frame of the tick had been sent instead
+        expected = decoder(3)
+        apply(expected, encoder.get_key_frame())
+        assert received.get_frame() == expected.get_frame()
+        assert received.get_tick() == tick
+
+
+def test_large_moves_need_a_key_frame():
+    '''A change which does not fit in a byte has no delta frame'''
+    encoder = stream.FrameEncoder(1, WORLD_SIZE)
+    encoder.encode(0, [(10.0, 10.0)], [0.0], [False])
+    encoder.encode(1, [(60.0, 10.0)], [0.0], [False])
+    assert encoder.get_delta_frame() is None
+    assert encoder.get_previous_tick() == 0
+
+
+def test_delta_frame_before_a_key_frame():
+    '''A delta frame cannot be decoded without the frame it follows on from'''
+    encoder = stream.FrameEncoder(1, WORLD_SIZE)
+    encoder.encode(0, [(10.0, 10.0)], [0.0], [False])
+    encoder.encode(1, [(11.0, 10.0)], [0.0], [False])
+    with pytest.raises(ValueError):
+        apply(decoder(1), encoder.get_delta_frame())
+
+
+def test_wrong_boid_count():
+    '''Frames of another number of boids are refused'''
+    encoder = stream.FrameEncoder(2, WORLD_SIZE)
+    with pytest.raises(ValueError):
+        encoder.encode(0, [(1.0, 1.0)], [0.0], [False])
+
+    encoder.encode(0, [(1.0, 1.0), (2.0, 2.0)], [0.0, 0.0], [False, False])
+    with pytest.raises(ValueError):
+        apply(decoder(3), encoder.get_key_frame())
+
+
+def test_not_a_stream():
+    '''Streams are refused unless they start with the hello of this version'''
+    with pytest.raises(ValueError):
+        stream.StreamDecoder(stream.HELLO.pack(b'BOIDTRAJ', stream.VERSION, 1, 10, 10, 8))
+    with pytest.raises(ValueError):
+        stream.read_hello(io.BytesIO(b'BOIDSTRM'))
+
+
+def test_flags_round_trip():
+    '''Flags are packed 8 to a byte'''
+    flags = [True, False, False, True, True, False, True, False, True, True]
+    packed = stream.pack_flags(flags)
+    assert packed == bytes([0b01011001, 0b11])
+    assert stream.unpack_flags(packed, len(flags)) == flags
+
+
+@pytest.mark.parametrize('length, header', [
+    (0, b'\x82\x00'),
+    (125, b'\x82\x7d'),
+    (126, b'\x82\x7e\x00\x7e'),
+    (65535, b'\x82\x7e\xff\xff'),
+    (65536, b'\x82\x7f' + struct.pack('>Q', 65536)),
+])
+def test_websocket_header(length, header):
+    '''Message lengths take 7 bits, then 16, then 64'''
+    assert stream.websocket_header(length) == header
+
+
+class FakeWriter:
+    '''Collects what is written to a connection'''
+    def __init__(self):
+        self.data = b''
+
+
+    def write(self, data):
+        self.data += data
+# END class FakeWriter
+
+class FakeSubscriber:
+    '''Collects the (opcode, payload) of the WebSocket messages sent to a subscriber'''
+    def __init__(self):
+        self.sent = []
+
+
+    def send(self, data, tick=None, opcode=stream.WEBSOCKET_BINARY):
+        self.sent.append((opcode, data))
+# END class FakeSubscriber
+
+def client_message(opcode, payload, mask=b'\x01\x02\x03\x04', length=None):
+    '''Returns a masked message from a client, optionally claiming another length'''
+    length = len(payload) if length is None else length
+    if length < 126:
+        header = struct.pack('>BB', 0x80 | opcode, 0x80 | length)
+    elif length < 1 << 16:
+        header = struct.pack('>BBH', 0x80 | opcode, 0x80 | 126, length)
+    else:
+        header = struct.pack('>BBQ', 0x80 | opcode, 0x80 | 127, length)
+    return header + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+def read_websocket(data):
+    '''Returns the messages sent to a subscriber reading the data, and
+    whether it stopped reading before its end'''
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        subscriber = FakeSubscriber()
+        try:
+            await stream.read_websocket(reader, subscriber)
+        except asyncio.IncompleteReadError:
+            return subscriber.sent, False
+        return subscriber.sent, not reader.at_eof()
+
+    return asyncio.run(read())
+
+
+def test_websocket_ping_and_close():
+    '''Pings are answered with the unmasked payload, closes are acknowledged'''
+    sent, _ = read_websocket(
+        client_message(stream.WEBSOCKET_PING, b'hello') +
+        client_message(stream.WEBSOCKET_BINARY, b'ignored') +
+        client_message(stream.WEBSOCKET_CLOSE, b''))
+    assert sent == [(stream.WEBSOCKET_PONG, b'hello'), (stream.WEBSOCKET_CLOSE, b'')]
+
+
+def test_websocket_message_too_big():
+    '''Oversized messages close the connection with status 1009, before
+    their payload is read'''
+    too_big = struct.pack('>H', stream.WEBSOCKET_TOO_BIG)
+
+    # only the header arrives, claiming a payload far beyond the limit
+    data = client_message(stream.WEBSOCKET_BINARY, b'', length=1 << 40)[:10]
+    sent, stopped_early = read_websocket(data + b'never read')
+    assert sent == [(stream.WEBSOCKET_CLOSE, too_big)]
+    assert stopped_early
+
+    sent, _ = read_websocket(client_message(stream.WEBSOCKET_PING, bytes(126)))
+    assert sent == [(stream.WEBSOCKET_CLOSE, too_big)]
+
+
+def test_websocket_handshake():
+    '''The handshake is accepted with the key of RFC 6455's example'''
+    async def accept(request):
+        reader = asyncio.StreamReader()
+        reader.feed_data(request)
+        writer = FakeWriter()
+        return await stream.accept_websocket(reader, writer), writer.data
+
+    accepted, response = asyncio.run(accept(
+        b'GET / HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n'
+        b'Connection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n\r\n'))
+    assert accepted
+    assert response.startswith(b'HTTP/1.1 101 ')
+    assert b'Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=\r\n' in response
+
+    accepted, response = asyncio.run(accept(b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n'))
+    assert not accepted
+    assert response.startswith(b'HTTP/1.1 400 ')
+
+
+def test_server_publishes_to_raw_subscribers():
+    '''A subscriber receives the hello, then a key frame of the latest tick'''
+    server = stream.StreamServer(2, WORLD_SIZE, first_tick=5, host='127.0.0.1', port=0,
+                                 websocket_port=None)
+    try:
+        with socket.create_connection(('127.0.0.1', server.get_port()), timeout=5) as client:
+            connection = client.makefile('rb')
+            received = stream.read_hello(connection)
+            server.record([(1.0, 2.0), (3.0, 4.0)], [0.0, 1.0], [True, False])
+            kind, tick, body = stream.read_frame(connection)
+    finally:
+        server.close()
+
+    assert kind == stream.KEY
+    received.decode(kind, tick, body)
+    positions, _, active = received.get_frame()
+    assert tick == 5
+    assert positions == [(1.0, 2.0), (3.0, 4.0)]
+    assert active == [True, False]
@@ -0,0 +1,70 @@
+"""
+Tests of sweep.py: parsing the grid, and measuring the flocks.
+"""
+
+import argparse
+from math import pi
+
+import pytest
+
+import sweep
+
+
+def test_parse_param():
+    '''Values are parsed by parameter'''
+    assert sweep.parse_param('view_distance=50,75') == ('view_distance', [50.0, 75.0])
+    assert sweep.parse_param('rules=none,separation+cohesion') == \
+        ('rules', ['none', 'separation+cohesion'])
+
+
+@pytest.mark.parametrize('text', ['speed=1', 'boids=', 'boids=ten', 'rules=flying'])
+def test_invalid_param(text):
+    '''Unknown parameters and invalid values are refused'''
+    with pytest.raises(argparse.ArgumentTypeError):
+        sweep.parse_param(text)
+
+
+def test_expand_runs():
+    '''Every combination of the grid is run with every seed'''
+    runs = sweep.expand_runs({'boids': [10, 20], 'nearest': [0, 7]}, seeds=[0, 1])
+    assert len(runs) == 8
+    assert [run['run'] for run in runs] == list(range(8))
+    assert {(run['boids'], run['nearest'], run['seed']) for run in runs} == \
+        {(b, n, s) for b in (10, 20) for n in (0, 7) for s in (0, 1)}
+    assert all(run['view_distance'] == sweep.DEFAULTS['view_distance'] for run in runs)
+
+
+def test_polarization():
+    '''Polarization is 1 when headings agree, 0 when they cancel out'''
+    assert sweep.polarization([0.5] * 4) == pytest.approx(1)
+    assert sweep.polarization([0, pi / 2, pi, -pi / 2]) == pytest.approx(0, abs=1e-12)
+    assert sweep.polarization([]) == 0.0
+
+
+def test_flock_structure():
+    '''Boids linked by chains within the radius form one cluster, across the edges'''
+    world_size = (199, 99)
+    positions = [
+        # a chain across the right edge of the world
+        (195.0, 50.0), (5.0, 50.0), (14.0, 50.0),
+        # a pair
+        (100.0, 10.0), (100.0, 18.0),
+        # alone
+        (100.0, 60.0),
+    ]
+    clusters, mean_neighbors = sweep.flock_structure(positions, 10, world_size)
+    assert clusters == 3
+    assert mean_neighbors == pytest.approx((1 + 2 + 1 + 1 + 1 + 0) / 6)
+    assert sweep.flock_structure([], 10, world_size) == (0, 0.0)
+
+
+def test_run():
+    '''A run reports its settings with the metrics of the flock'''
+    settings = dict(sweep.DEFAULTS, run=0, seed=3, boids=30, view_distance=60.0, rules='none')
+    result = sweep.run(settings, 'object', 'angle', ticks=4, warmup=2, sample_every=1)
+
+    assert result['view_distance'] == 60.0
+    assert result['engine'] == 'object'
+    assert 0 <= result['polarization'] <= 1
+    assert 1 <= result['clusters'] <= 30
+    assert result['ticks_per_second'] > 0
@@ -0,0 +1,48 @@
+"""
+Tests of vector_boid.py: VectorBoid flocks like Boid, within the bounds its
+module docstring gives.
+"""
+
+from math import pi, sin
+
+from boid import Boid, normalize_angle
+from scenario import spawn
+from simulation import Simulation
+
+# the largest difference of heading between two boids of the flock
+SPREAD = 0.2
+
+# the cohesion and turn approximations of VectorBoid, see vector_boid.py, and
+# its alignment, which turns by the sine of the differences of heading
+HEADING_BOUND = 0.004 + 2e-4 + SPREAD - sin(SPREAD)
+
+
+def flock(heading_kernel):
+    '''Returns a clumped flock heading within SPREAD / 2 of the x axis, away
+    from the -pi/pi seam where Boid measures differences in heading the long
+    way round. With this seed, no boid sees the center of the others right
+    behind it either, where Boid may turn the long way round towards it'''
+    boids = [
+        Boid.restore(boid.get_id(), boid.get_pos(), boid.get_magnitude(),
+                     boid.get_theta() / pi * SPREAD / 2, False)
+        for boid in spawn(200, 5, 'clumped')
+    ]
+    sim = Simulation(boids=boids, engine='object', update_mode='synchronous',
+                     heading_kernel=heading_kernel)
+    sim.set_rules(True, True, True)
+    return sim
+
+
+def test_one_tick_follows_boid():
+    '''After one tick, every heading is within the documented bounds of Boid's'''
+    reference = flock('angle')
+    sim = flock('vector')
+    initial = reference.get_thetas()
+    reference.step()
+    sim.step()
+
+    thetas = reference.get_thetas()
+    assert max(abs(normalize_angle(theta - before))
+               for theta, before in zip(thetas, initial)) > 10 * HEADING_BOUND
+    assert max(abs(normalize_angle(other - theta))
+               for theta, other in zip(thetas, sim.get_thetas())) <= HEADING_BOUND